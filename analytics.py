@@ -0,0 +1,281 @@
+import json
+import os
+import heapq
+import operator
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date
+from itertools import islice
+
+
+class SalesBucket:
+    __slots__ = ("orders", "revenue", "discount_cost", "drinks", "extras")
+
+    def __init__(self):
+        self.orders = 0
+        self.revenue = 0.0
+        self.discount_cost = 0.0
+        self.drinks = {}
+        self.extras = {}
+
+    def add(self, coffee_type, extras, price, discount_cost, sign=1):
+        self.orders += sign
+        self.revenue += sign * price
+        self.discount_cost += sign * discount_cost
+        self.drinks[coffee_type] = self.drinks.get(coffee_type, 0) + sign
+        for extra in extras:
+            self.extras[extra] = self.extras.get(extra, 0) + sign
+
+    def merge(self, other):
+        self.orders += other.orders
+        self.revenue += other.revenue
+        self.discount_cost += other.discount_cost
+        for name, count in other.drinks.items():
+            self.drinks[name] = self.drinks.get(name, 0) + count
+        for name, count in other.extras.items():
+            self.extras[name] = self.extras.get(name, 0) + count
+
+    def summary(self):
+        orders = self.orders
+        return {
+            "orders": orders,
+            "revenue": round(self.revenue, 2),
+            "average_ticket": round(self.revenue / orders, 2) if orders else 0.0,
+            "discount_cost": round(self.discount_cost, 2),
+            "drink_mix": {name: count for name, count in self.drinks.items() if count},
+            "extras_attach_rate": {name: round(count / orders, 3) if orders else 0.0
+                                   for name, count in self.extras.items() if count},
+        }
+
+
+def discount_cost_of(price, discount):
+    # Money given away by a discount, from the final price and the fraction
+    if discount <= 0 or discount >= 1:
+        return 0.0
+    return price / (1 - discount) - price
+
+
+class ColumnStore:
+    # Append-only columnar order history: one binary file per column.
+    # Rows are appended at brew completion, so ts is normally ascending.
+    COLUMNS = (("ts", "d"), ("drink", "H"), ("extras", "Q"), ("price", "d"),
+               ("discount", "d"))
+    MAX_EXTRAS = 64  # bits in an extras mask
+
+    def __init__(self, directory, flush_every=256):
+        self.directory = directory
+        self.flush_every = flush_every
+        self.names_path = os.path.join(directory, "names.json")
+        self._pending = {name: array(code) for name, code in self.COLUMNS}
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.drinks = []
+        self.extras = []
+        if os.path.exists(self.names_path):
+            with open(self.names_path, encoding="utf-8") as handle:
+                names = json.load(handle)
+            self.drinks = names["drinks"]
+            self.extras = names["extras"]
+        self._drink_ids = {name: index for index, name in enumerate(self.drinks)}
+        self._extra_bits = {name: 1 << index for index, name in enumerate(self.extras)}
+
+    def _column_path(self, name):
+        return os.path.join(self.directory, f"{name}.col")
+
+    def _drink_id(self, name):
+        if name not in self._drink_ids:
+            self._drink_ids[name] = len(self.drinks)
+            self.drinks.append(name)
+            self._save_names()
+        return self._drink_ids[name]
+
+    def _extras_mask(self, extras):
+        mask = 0
+        for name in extras:
+            if name not in self._extra_bits:
+                if len(self.extras) >= self.MAX_EXTRAS:
+                    raise ValueError(f"history holds at most {self.MAX_EXTRAS} extras")
+                self._extra_bits[name] = 1 << len(self.extras)
+                self.extras.append(name)
+                self._save_names()
+            mask |= self._extra_bits[name]
+        return mask
+
+    def _save_names(self):
+        with open(self.names_path, "w", encoding="utf-8") as handle:
+            json.dump({"drinks": self.drinks, "extras": self.extras}, handle,
+                      ensure_ascii=False)
+
+    def append(self, timestamp, coffee_type, extras, price, discount):
+        with self._lock:
+            pending = self._pending
+            pending["ts"].append(timestamp)
+            pending["drink"].append(self._drink_id(coffee_type))
+            pending["extras"].append(self._extras_mask(extras))
+            pending["price"].append(price)
+            pending["discount"].append(discount)
+            if len(pending["ts"]) >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending["ts"]:
+            return
+        for name, code in self.COLUMNS:
+            with open(self._column_path(name), "ab") as handle:
+                self._pending[name].tofile(handle)
+            self._pending[name] = array(code)
+
+    def _read_column(self, name, code, start=0, stop=None):
+        column = array(code)
+        path = self._column_path(name)
+        if not os.path.exists(path):
+            return column
+        with open(path, "rb") as handle:
+            handle.seek(start * column.itemsize)
+            if stop is None:
+                column.frombytes(handle.read())
+            else:
+                column.frombytes(handle.read((stop - start) * column.itemsize))
+        return column
+
+    def rows(self, start, end):
+        # (ts, drink, extras, price, discount) for orders with start <= ts < end,
+        # oldest first. While the timestamps are ascending the range is found
+        # by bisection and only that slice of the other columns is read; a
+        # history with rows out of order (the clock stepping back) is
+        # filtered and sorted instead.
+        self.flush()
+        codes = dict(self.COLUMNS)
+        timestamps = self._read_column("ts", codes["ts"])
+        if all(map(operator.le, timestamps, islice(timestamps, 1, None))):
+            first = bisect_left(timestamps, start)
+            last = bisect_left(timestamps, end)
+            indexes = range(last - first)
+        else:
+            first, last = 0, None
+            indexes = sorted((index for index, ts in enumerate(timestamps)
+                              if start <= ts < end), key=timestamps.__getitem__)
+        if not indexes:
+            return
+
+        drinks = self._read_column("drink", codes["drink"], first, last)
+        masks = self._read_column("extras", codes["extras"], first, last)
+        prices = self._read_column("price", codes["price"], first, last)
+        discounts = self._read_column("discount", codes["discount"], first, last)
+        extra_names = list(enumerate(self.extras))
+        for index in indexes:
+            mask = masks[index]
+            extras = [name for bit, name in extra_names if mask >> bit & 1]
+            yield (timestamps[first + index], self.drinks[drinks[index]], extras,
+                   prices[index], discounts[index])
+
+    def query(self, start, end):
+        bucket = SalesBucket()
+        for _, drink, extras, price, discount in self.rows(start, end):
+            bucket.add(drink, extras, price, discount_cost_of(price, discount))
+        return bucket
+
+
+class ShardedColumnStore(ColumnStore):
+    # The main store plus shard-N subdirectories written by post-order
+    # worker processes. Appends go to the main store; reads merge all of
+    # them by timestamp.
+    def shards(self):
+        # Reopened on every read so names added by the workers are seen
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.startswith("shard-")
+                       and os.path.isdir(os.path.join(self.directory, name)))
+        return [ColumnStore(os.path.join(self.directory, name)) for name in names]
+
+    def rows(self, start, end):
+        return heapq.merge(super().rows(start, end),
+                           *(shard.rows(start, end) for shard in self.shards()),
+                           key=lambda row: row[0])
+
+
+class SalesAnalytics:
+    # Rolling hourly and daily buckets updated once per committed order
+    def __init__(self, store=None, hours=72, days=120):
+        self.store = store
+        self.record_history = True  # off when post-order workers write the history
+        self.max_hours = hours
+        self.max_days = days
+        self.hourly = OrderedDict()
+        self.daily = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, buckets, key, limit):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = SalesBucket()
+            while len(buckets) > limit:
+                buckets.popitem(last=False)
+        return bucket
+
+    def record(self, timestamp, coffee_type, extras, price, discount, sign=1):
+        cost = discount_cost_of(price, discount)
+        hour = int(timestamp // 3600)
+        day = date.fromtimestamp(timestamp).toordinal()
+        with self._lock:
+            self._bucket(self.hourly, hour, self.max_hours).add(
+                coffee_type, extras, price, cost, sign)
+            self._bucket(self.daily, day, self.max_days).add(
+                coffee_type, extras, price, cost, sign)
+
+    def load(self, now):
+        # Rebuild the rolling buckets from the on-disk history after a restart
+        if self.store is None:
+            return
+        since = min(now - self.max_hours * 3600, now - self.max_days * 86400)
+        for timestamp, drink, extras, price, discount in self.store.rows(since, now + 1):
+            self.record(timestamp, drink, extras, price, discount)
+
+    def on_order_event(self, event_type, result):
+        # Engine listener: charged orders count right away and are undone on
+        # cancel; only brewed orders go to the on-disk history, stamped with
+        # their completion time so the history stays in append order
+        order = result.order
+        timestamp = result.timestamp.timestamp()
+        if event_type == "order":
+            self.record(timestamp, order.coffee_type, order.extras,
+                        result.price, result.discount)
+        elif event_type == "cancel":
+            self.record(timestamp, order.coffee_type, order.extras,
+                        result.price, result.discount, sign=-1)
+        elif event_type == "complete" and self.store is not None and self.record_history:
+            self.store.append(result.completed_at.timestamp(), order.coffee_type,
+                              order.extras, result.price, result.discount)
+
+    def hourly_report(self, hours=24):
+        # [(hour start timestamp, summary)], oldest first
+        with self._lock:
+            keys = list(self.hourly)[-hours:]
+            return [(key * 3600, self.hourly[key].summary()) for key in keys]
+
+    def daily_report(self, days=7):
+        with self._lock:
+            keys = list(self.daily)[-days:]
+            return [(date.fromordinal(key), self.daily[key].summary()) for key in keys]
+
+    def today(self):
+        with self._lock:
+            bucket = self.daily.get(date.today().toordinal())
+            return (bucket or SalesBucket()).summary()
+
+    def report(self, start, end):
+        # Summary for an arbitrary time range, from the on-disk history
+        if self.store is None:
+            bucket = SalesBucket()
+            with self._lock:
+                for key, hour_bucket in self.hourly.items():
+                    if start <= key * 3600 < end:
+                        bucket.merge(hour_bucket)
+            return bucket.summary()
+        return self.store.query(start, end).summary()
@@ -0,0 +1,88 @@
+from inventory import INGREDIENTS
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; fall back to plain Python loops
+    np = None
+
+
+class BatchResult:
+    def __init__(self, cents, discounts, feasible, prefix, errors):
+        self.cents = cents            # charged price per order in cents, as quote_cents
+        self.discounts = discounts    # discount fraction applied per order
+        self.feasible = feasible      # order fits current stock on its own
+        self.prefix = prefix          # orders [0:prefix] fit stock together
+        self.errors = errors          # validation error per order ("" if valid)
+
+    @property
+    def prices(self):
+        return [cents / 100 for cents in self.cents]
+
+    @property
+    def prefix_total(self):
+        return sum(self.cents[:self.prefix]) / 100
+
+
+def evaluate_batch(engine, orders, now=None):
+    # Price, discount and stock-check a batch of orders in one pass. Prices
+    # are the engine's quote_cents, so they match what process_order charges.
+    orders = list(orders)
+    available = [engine.inventory.available(index) for index in range(len(INGREDIENTS))]
+
+    errors = []
+    rows = []
+    cents = []
+    discounts = []
+    for order in orders:
+        error = engine.validate(order)
+        errors.append(error)
+        if error:
+            rows.append(None)
+            cents.append(0)
+            discounts.append(0.0)
+            continue
+        rows.append(engine.recipes.recipe_for(order).amounts)
+        price, discount = engine.quote_cents(order, now)
+        cents.append(price)
+        discounts.append(discount)
+
+    if np is not None:
+        return _evaluate_numpy(rows, cents, discounts, available, errors)
+    return _evaluate_python(rows, cents, discounts, available, errors)
+
+
+def _evaluate_numpy(rows, cents, discounts, available, errors):
+    width = len(available)
+    matrix = np.zeros((len(rows), width))
+    for index, amounts in enumerate(rows):
+        if amounts is not None:
+            matrix[index] = amounts
+    stock = np.asarray(available)
+
+    valid = np.array([not error for error in errors], dtype=bool)
+    feasible = valid & (matrix <= stock).all(axis=1)
+    # Invalid orders are never brewed, so they don't use stock or end the prefix
+    over = (np.cumsum(matrix, axis=0) > stock).any(axis=1)
+    prefix = int(np.argmax(over)) if over.any() else len(rows)
+
+    return BatchResult(list(cents), list(discounts), feasible.tolist(), prefix, errors)
+
+
+def _evaluate_python(rows, cents, discounts, available, errors):
+    feasible = []
+    used = [0.0] * len(available)
+    prefix = None
+    for index, amounts in enumerate(rows):
+        if amounts is None:
+            feasible.append(False)
+            continue
+        feasible.append(all(need <= have for need, have in zip(amounts, available)))
+        if prefix is None:
+            # Running sums in the same order as np.cumsum, so both paths
+            # compare the same floats
+            used = [total + need for total, need in zip(used, amounts)]
+            if any(total > have for total, have in zip(used, available)):
+                prefix = index
+
+    return BatchResult(list(cents), list(discounts), feasible,
+                       len(rows) if prefix is None else prefix, errors)
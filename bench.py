@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from engine import Order, OrderEngine
+from history import OrderRecord, RingBuffer
+from inventory import INGREDIENTS
+
+
+DEFAULT_DRINKS = {"Espresso": 2, "Americano": 3, "Cappuccino": 3, "Latte": 4, "Mocha": 2}
+DEFAULT_SIZES = {"Small": 2, "Medium": 5, "Large": 3}
+DEFAULT_EXTRAS = {"Extra Shot": 0.15, "Caramel Syrup": 0.2, "Vanilla Syrup": 0.15,
+                  "Chocolate Sauce": 0.1, "Whipped Cream": 0.1}
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                            "bench_results.jsonl")
+
+
+class OrderGenerator:
+    # Synthetic orders with weighted drinks/sizes, independent extras and
+    # Poisson arrivals that speed up during rush-hour bursts
+    def __init__(self, drinks=None, sizes=None, extras=None, rate=0.5,
+                 burst_every=3600, burst_length=900, burst_factor=4.0, seed=None,
+                 temperatures=None):
+        self.drinks = list((drinks or DEFAULT_DRINKS).items())
+        self.sizes = list((sizes or DEFAULT_SIZES).items())
+        self.extras = list((extras or DEFAULT_EXTRAS).items())
+        # {temperature: weight}; every order is 90°C when missing
+        self.temperatures = list(temperatures.items()) if temperatures else None
+        self.rate = rate  # orders per second outside bursts
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.burst_factor = burst_factor
+        self.random = random.Random(seed)
+
+    def in_burst(self, at):
+        return self.burst_every > 0 and at % self.burst_every < self.burst_length
+
+    def order(self, customer=""):
+        rng = self.random
+        drink = rng.choices([name for name, _ in self.drinks],
+                            [weight for _, weight in self.drinks])[0]
+        size = rng.choices([name for name, _ in self.sizes],
+                           [weight for _, weight in self.sizes])[0]
+        extras = [name for name, chance in self.extras if rng.random() < chance]
+        table = str(rng.randint(1, 20))
+        temperature = 90
+        if self.temperatures and len(self.temperatures) == 1:
+            temperature = self.temperatures[0][0]
+        elif self.temperatures:
+            temperature = rng.choices([value for value, _ in self.temperatures],
+                                      [weight for _, weight in self.temperatures])[0]
+        return Order(drink, size, extras, customer=customer, table=table,
+                     temperature=temperature)
+
+    def stream(self, count, start=0.0):
+        # Yields (arrival seconds, order)
+        at = start
+        for index in range(count):
+            rate = self.rate * (self.burst_factor if self.in_burst(at) else 1.0)
+            at += self.random.expovariate(rate)
+            yield at, self.order(customer=f"Customer {index % 500}")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_order_path(engine, orders, history, latencies=None):
+    # Price, validate, reserve, charge, commit and record each order.
+    # Stock is refilled outside the timed section when it runs out.
+    served = rejected = 0
+    clock = time.perf_counter_ns
+    for order in orders:
+        started = clock()
+        result = engine.process_order(order)
+        if result.ok:
+            engine.complete_order(result)
+            history.append(OrderRecord.from_order(order, result.timestamp, result.price))
+        finished = clock()
+        if latencies is not None:
+            latencies.append(finished - started)
+        if result.ok:
+            served += 1
+        else:
+            rejected += 1
+            if result.insufficient:
+                for ingredient in range(len(INGREDIENTS)):
+                    engine.inventory.refill(ingredient)
+    return served, rejected
+
+
+def make_engine(journal_dir=None):
+    engine = OrderEngine()
+    engine.add_money(10 ** 12)
+    journal = None
+    if journal_dir:
+        from journal import Journal
+        journal = Journal(journal_dir)
+        journal.recover(engine)
+        journal.open()
+        engine.journal = journal
+    return engine, journal
+
+
+def run_benchmark(count=20000, seed=1, journal=False, warmup=1000):
+    generator = OrderGenerator(seed=seed)
+    orders = [order for _, order in generator.stream(count + warmup)]
+    journal_dir = tempfile.mkdtemp(prefix="coffee-bench-") if journal else None
+    try:
+        # Warm up and timed run
+        engine, journal_handle = make_engine(journal_dir)
+        history = RingBuffer(5000)
+        run_order_path(engine, orders[:warmup], history)
+        latencies = []
+        started = time.perf_counter()
+        served, rejected = run_order_path(engine, orders[warmup:], history, latencies)
+        elapsed = time.perf_counter() - started
+        if journal_handle is not None:
+            journal_handle.close()
+
+        # Separate pass for memory, since tracemalloc slows everything down
+        engine, journal_handle = make_engine(None)
+        history = RingBuffer(count)
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        run_order_path(engine, orders[warmup:], history)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    finally:
+        if journal_dir:
+            shutil.rmtree(journal_dir, ignore_errors=True)
+
+    latencies.sort()
+    to_us = 1 / 1000
+    return {
+        "orders": count,
+        "served": served,
+        "rejected": rejected,
+        "throughput": round(count / elapsed, 1),
+        "p50_us": round(percentile(latencies, 0.50) * to_us, 2),
+        "p95_us": round(percentile(latencies, 0.95) * to_us, 2),
+        "p99_us": round(percentile(latencies, 0.99) * to_us, 2),
+        "bytes_per_order": round(max(0, allocated) / count, 1),
+    }
+
+
+def current_version():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_previous(path, scenario):
+    previous = None
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                entry = json.loads(line)
+                if entry["scenario"] == scenario:
+                    previous = entry
+    return previous
+
+
+def find_regressions(current, previous, tolerance):
+    # Metric names that got worse by more than tolerance (a fraction)
+    if previous is None:
+        return []
+    regressions = []
+    if current["throughput"] < previous["throughput"] * (1 - tolerance):
+        regressions.append("throughput")
+    for key in ("p50_us", "p95_us", "p99_us", "bytes_per_order"):
+        if previous[key] and current[key] > previous[key] * (1 + tolerance):
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the headless order path")
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--journal", action="store_true",
+                        help="include journal writes in the order path")
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown before a metric counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    scenario = f"orders={args.orders} seed={args.seed} journal={args.journal}"
+    metrics = run_benchmark(args.orders, args.seed, args.journal)
+    previous = load_previous(args.results, scenario)
+    regressions = find_regressions(metrics, previous and previous["metrics"], args.tolerance)
+
+    print(f"Scenario:   {scenario}")
+    print(f"Served:     {metrics['served']} ({metrics['rejected']} rejected)")
+    print(f"Throughput: {metrics['throughput']:.0f} orders/s")
+    print(f"Latency:    p50 {metrics['p50_us']}us | p95 {metrics['p95_us']}us | "
+          f"p99 {metrics['p99_us']}us")
+    print(f"Memory:     {metrics['bytes_per_order']} bytes/order")
+    if previous is not None:
+        print(f"Previous:   {previous['version']} -> "
+              f"{previous['metrics']['throughput']:.0f} orders/s")
+    for name in regressions:
+        print(f"⚠️ Regression in {name}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as handle:
+        handle.write(json.dumps({"scenario": scenario, "version": current_version(),
+                                 "time": time.time(), "metrics": metrics}) + "\n")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
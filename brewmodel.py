@@ -0,0 +1,142 @@
+from inventory import COFFEE, MILK, WATER
+from scheduler import build_brew_steps
+
+
+SHOT_GRAMS = 18.0
+
+
+class BrewModel:
+    # Physics-lite step durations. The boiler holds a fixed volume at a
+    # standby set point; every drink draws water that is replaced with cold
+    # water, and the heater wins the temperature back while it is idle. A
+    # drink brewed right after another therefore waits for the boiler to
+    # recover, and hotter targets or bigger drinks take longer to heat.
+    # Milk steaming scales with the milk volume, grinding and extraction
+    # with the coffee dose.
+    # Changing over between unlike drinks costs time too: a boiler more
+    # than a few degrees hotter than the drink needs is flushed down, a
+    # steam wand that the previous drink didn't use (or that sat idle) is
+    # purged first, and each syrup pump the previous drink didn't use has
+    # to be primed.
+    def __init__(self, recipes, ambient=20.0, standby=92.0, boiler_ml=5000.0,
+                 heat_seconds_per_degree_ml=0.0014, dispense_ml_per_second=12.0,
+                 grind_grams_per_second=3.0, extraction_seconds=25.0,
+                 extra_shot_seconds=5.0, milk_start=4.0, milk_target=65.0,
+                 steam_degree_ml_per_second=300.0, froth_ml_per_second=15.0,
+                 extra_seconds=2.0, flush_seconds_per_degree=0.8, flush_tolerance=3.0,
+                 steam_purge_seconds=8.0, steam_idle_seconds=90.0,
+                 extra_prime_seconds=4.0):
+        self.recipes = recipes
+        self.ambient = ambient
+        self.standby = standby
+        self.boiler_ml = boiler_ml
+        self.heat_seconds_per_degree_ml = heat_seconds_per_degree_ml
+        self.dispense_ml_per_second = dispense_ml_per_second
+        self.grind_grams_per_second = grind_grams_per_second
+        self.extraction_seconds = extraction_seconds
+        self.extra_shot_seconds = extra_shot_seconds
+        self.milk_start = milk_start
+        self.milk_target = milk_target
+        self.steam_degree_ml_per_second = steam_degree_ml_per_second
+        self.froth_ml_per_second = froth_ml_per_second
+        self.extra_seconds = extra_seconds
+        self.flush_seconds_per_degree = flush_seconds_per_degree
+        self.flush_tolerance = flush_tolerance
+        self.steam_purge_seconds = steam_purge_seconds
+        self.steam_idle_seconds = steam_idle_seconds
+        self.extra_prime_seconds = extra_prime_seconds
+
+        # Boiler thermal state carried from one order to the next
+        self.boiler_temp = standby
+        self.boiler_updated = None
+        # Changeover state: when the steam wand was last used, whether the
+        # last drink started used it, and which syrup pumps are primed
+        self.steamed_at = None
+        self.last_milk = False
+        self.primed = frozenset()
+
+    @property
+    def seconds_per_degree(self):
+        # Time for the heater to raise the whole boiler by one degree
+        # (the default 0.0014 s per ml and degree is roughly a 3 kW element)
+        return self.heat_seconds_per_degree_ml * self.boiler_ml
+
+    def boiler_at(self, now):
+        # Boiler temperature after recovering towards standby since the last draw
+        if self.boiler_updated is None or self.boiler_temp >= self.standby:
+            return self.boiler_temp
+        recovered = max(0.0, now - self.boiler_updated) / self.seconds_per_degree
+        return min(self.standby, self.boiler_temp + recovered)
+
+    def steps(self, order, now=None):
+        # build_brew_steps with modelled durations; the boiler is estimated
+        # from its current state without changing it
+        steps = build_brew_steps(order, self.recipes.coffee_menu)
+        amounts = self.amounts(order)
+        return [(text, self.duration(order, name, now, commit=False, amounts=amounts),
+                 resource, name)
+                for text, _, resource, name in steps]
+
+    def amounts(self, order):
+        # Ingredient vector the durations are based on
+        return self.recipes.recipe_for(order).amounts
+
+    def duration(self, order, step, now=None, commit=True, amounts=None):
+        # Seconds for one step. With commit=True, heating updates the boiler
+        # state, so call it when the step actually starts. Pass the amounts
+        # taken when the order was queued, so a menu reload in between
+        # can't change (or remove) the drink's recipe.
+        if amounts is None:
+            amounts = self.amounts(order)
+        if step == "grind":
+            return amounts[COFFEE] / self.grind_grams_per_second
+        if step == "heat_water":
+            return self._heat_water(order, amounts[WATER], now, commit)
+        if step == "espresso":
+            shots = max(1.0, amounts[COFFEE] / SHOT_GRAMS)
+            return self.extraction_seconds + (shots - 1) * self.extra_shot_seconds
+        if step == "heat_milk":
+            rise = self.milk_target - self.milk_start
+            seconds = amounts[MILK] * rise / self.steam_degree_ml_per_second
+            now = now or 0.0
+            if (not self.last_milk or self.steamed_at is None
+                    or now - self.steamed_at > self.steam_idle_seconds):
+                seconds += self.steam_purge_seconds
+            if commit:
+                self.steamed_at = now + seconds
+                self.last_milk = True
+            return seconds
+        if step == "froth":
+            return amounts[MILK] / self.froth_ml_per_second
+        if step == "extras":
+            extras = frozenset(order.extras)
+            seconds = (self.extra_seconds * len(extras)
+                       + self.extra_prime_seconds * len(extras - self.primed))
+            if commit:
+                self.primed = extras
+            return seconds
+        if step == "start":
+            if commit and not amounts[MILK]:
+                self.last_milk = False
+            return 1.0
+        if step == "prepare":
+            return 3.0
+        return 2.0
+
+    def _heat_water(self, order, water_ml, now, commit):
+        now = now or 0.0
+        temp = self.boiler_at(now)
+        # Bring the boiler up to the drink's temperature (or flush it down
+        # to it), then dispense
+        heating = max(0.0, order.temperature - temp) * self.seconds_per_degree
+        ceiling = order.temperature + self.flush_tolerance
+        heating += max(0.0, temp - ceiling) * self.flush_seconds_per_degree
+        dispense = water_ml / self.dispense_ml_per_second
+        if commit:
+            # The drawn water is replaced with cold water
+            temp = min(max(temp, order.temperature), ceiling)
+            drawn = min(water_ml, self.boiler_ml) / self.boiler_ml
+            self.boiler_temp = temp - (temp - self.ambient) * drawn
+            self.boiler_updated = now + heating + dispense
+        return heating + dispense
+
@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+from bisect import bisect_left, insort
+
+
+def normalize_name(name):
+    # Profile key: case-insensitive, surrounding and repeated spaces ignored
+    return " ".join(str(name).split()).casefold()
+
+
+class CustomerProfile:
+    __slots__ = ("key", "name", "orders", "points", "last_order", "favorites", "history")
+
+    def __init__(self, key, name):
+        self.key = key
+        self.name = name
+        self.orders = 0
+        self.points = 0
+        self.last_order = None  # {"coffee", "size", "extras", "temperature"}
+        self.favorites = {}     # (coffee, size, extras) -> times ordered
+        self.history = []       # [timestamp, coffee, size, extras, price], newest last
+
+    def favorite(self):
+        # (coffee, size, extras) ordered most often, or None
+        if not self.favorites:
+            return None
+        return max(self.favorites.items(), key=lambda item: item[1])[0]
+
+    def to_dict(self):
+        return {"key": self.key, "name": self.name, "orders": self.orders,
+                "points": self.points, "last": self.last_order,
+                "favorites": [[coffee, size, list(extras), count]
+                              for (coffee, size, extras), count in self.favorites.items()],
+                "history": self.history}
+
+    @classmethod
+    def from_dict(cls, data):
+        profile = cls(data["key"], data["name"])
+        profile.orders = data["orders"]
+        profile.points = data["points"]
+        profile.last_order = data["last"]
+        profile.favorites = {(coffee, size, tuple(extras)): count
+                             for coffee, size, extras, count in data["favorites"]}
+        profile.history = data["history"]
+        return profile
+
+
+class CustomerStore:
+    # Customer profiles keyed by normalized name. Nothing is read from disk
+    # until the first lookup (or preload() from a background thread). Prefix
+    # search bisects a sorted list of keys. Changes are appended to a log
+    # that is compacted on the next load once it has grown stale.
+    def __init__(self, directory, points_per_unit=1, history=20):
+        self.directory = directory
+        self.path = os.path.join(directory, "customers.jsonl")
+        self.points_per_unit = points_per_unit
+        self.history_size = history
+        self.profiles = {}
+        self._keys = []
+        self._loaded = False
+        self._dirty = []
+        self._lock = threading.RLock()
+
+    def preload(self):
+        self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            lines = 0
+            if os.path.exists(self.path):
+                with open(self.path, encoding="utf-8") as handle:
+                    for line in handle:
+                        try:
+                            profile = CustomerProfile.from_dict(json.loads(line))
+                        except (ValueError, KeyError):
+                            break  # torn write at the end of the log
+                        self.profiles[profile.key] = profile
+                        lines += 1
+            self._keys = sorted(self.profiles)
+            if lines > 2 * len(self.profiles) + 100:
+                self._compact()
+            self._loaded = True
+
+    def _compact(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            for profile in self.profiles.values():
+                handle.write(json.dumps(profile.to_dict(), ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.path)
+
+    def get(self, name):
+        self._ensure_loaded()
+        return self.profiles.get(normalize_name(name))
+
+    def visits(self, name):
+        # Brewed orders so far; the hook loyalty promotions use
+        profile = self.get(name)
+        return profile.orders if profile is not None else 0
+
+    def search(self, prefix, limit=8):
+        # Profiles whose key starts with the typed prefix, in key order
+        self._ensure_loaded()
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            keys = self._keys
+            index = bisect_left(keys, prefix)
+            matches = []
+            while index < len(keys) and len(matches) < limit and keys[index].startswith(prefix):
+                matches.append(self.profiles[keys[index]])
+                index += 1
+        return matches
+
+    def record_order(self, order, price, timestamp, points=None):
+        # points: already worked out by a post-order worker
+        if not order.customer.strip():
+            return None
+        self._ensure_loaded()
+        key = normalize_name(order.customer)
+        with self._lock:
+            profile = self.profiles.get(key)
+            if profile is None:
+                profile = self.profiles[key] = CustomerProfile(key, order.customer.strip())
+                insort(self._keys, key)
+            profile.orders += 1
+            if points is None:
+                points = int(price * self.points_per_unit)
+            profile.points += points
+            extras = tuple(order.extras)
+            profile.last_order = {"coffee": order.coffee_type, "size": order.size,
+                                  "extras": list(extras), "temperature": order.temperature}
+            combo = (order.coffee_type, order.size, extras)
+            profile.favorites[combo] = profile.favorites.get(combo, 0) + 1
+            profile.history.append([timestamp, order.coffee_type, order.size,
+                                    list(extras), round(price, 2)])
+            del profile.history[:-self.history_size]
+            self._dirty.append(profile)
+        return profile
+
+    def on_order_event(self, event_type, result):
+        # Engine listener: brewed orders count towards the profile
+        if event_type == "complete":
+            self.record_order(result.order, result.price, result.timestamp.timestamp())
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, []
+            if not dirty:
+                return
+            lines = [json.dumps(profile.to_dict(), ensure_ascii=False) + "\n"
+                     for profile in {id(profile): profile for profile in dirty}.values()]
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.writelines(lines)
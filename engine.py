@@ -0,0 +1,378 @@
+import threading
+from datetime import datetime
+
+from inventory import INGREDIENT_IDS, INGREDIENTS, SHORTAGE_NAMES, Inventory
+from ledger import CASH, Ledger, compare_states, replay_journal, tab_account, to_cents
+from metrics import Metrics
+from menuconfig import load_menu
+from promotions import PromotionTable
+
+
+class Order:
+    def __init__(self, coffee_type, size="Medium", extras=(), customer="",
+                 table="", notes="", temperature=90):
+        self.coffee_type = coffee_type
+        self.size = size
+        self.extras = tuple(extras)
+        self.customer = customer
+        self.table = table
+        self.notes = notes
+        self.temperature = temperature
+
+
+class OrderResult:
+    def __init__(self, order, ok, price=0.0, discount=0.0, insufficient=(), error=""):
+        self.order = order
+        self.ok = ok
+        self.price = price
+        self.discount = discount
+        self.insufficient = list(insufficient)
+        self.error = error
+        self.timestamp = datetime.now()
+        self.completed_at = None
+        self.reservation = None
+        self.journal_seq = None
+        self.prepaid = False
+        self.account = CASH
+        self.state = "committed" if ok else "rejected"
+
+
+class OrderEngine:
+    def __init__(self, menu=None):
+        # Resource levels
+        self.inventory = Inventory()
+        self.drinks_sold = {}
+        self.journal = None
+        self.listeners = []
+        self.metrics = Metrics()
+        self._lock = threading.Lock()
+
+        # Walk-in balance, table tabs and sales in integer cents
+        self.ledger = Ledger(record=self._append)
+
+        # Menu, sizes, extras and promotions come from config/menu.json
+        menu = menu or load_menu()
+        self.coffee_menu = menu.coffee_menu
+        self.size_options = menu.size_options
+        self.extras = menu.extras
+
+        # Precomputed price and ingredient vector per drink, size and extras
+        self.recipes = menu.recipes
+
+        # Daily specials, happy hours, combos and loyalty discounts
+        self.promotions = PromotionTable(menu.promotions, self.recipes)
+
+    def validate(self, order):
+        if not order.coffee_type:
+            return "⚠️ Please select a coffee!"
+        if order.coffee_type not in self.coffee_menu:
+            return f"⚠️ Unknown coffee: {order.coffee_type}"
+        if order.size not in self.size_options:
+            return f"⚠️ Unknown size: {order.size}"
+        for extra in order.extras:
+            if extra not in self.extras:
+                return f"⚠️ Unknown extra: {extra}"
+        return ""
+
+    def calculate_price(self, order):
+        return self.recipes.recipe_for(order).price
+
+    def get_discount(self, order, now=None):
+        # Best active promotion as a fraction of the price
+        return self.promotions.discount(order, now)
+
+    def set_promotions(self, rules):
+        # Replace the promotion rules; raises ValueError for an invalid rule
+        self.promotions = PromotionTable(rules, self.recipes, self.promotions.visits)
+
+    def consumption(self, order):
+        # Ingredient vector consumed by an order
+        return self.recipes.recipe_for(order).amounts
+
+    def check_resources(self, order):
+        missing = self.inventory.shortages(self.consumption(order))
+        return [SHORTAGE_NAMES[index] for index in missing]
+
+    def set_drink(self, name, details):
+        # Add or change a menu drink; only its recipe rows are rebuilt
+        self.coffee_menu[name] = details
+        self.recipes.update_drink(name)
+        self.promotions.invalidate()
+
+    def remove_drink(self, name):
+        self.recipes.remove_drink(name)
+        del self.coffee_menu[name]
+        self.promotions.invalidate()
+
+    def apply_menu(self, menu):
+        # Hot reload: only drinks and sizes that differ get new recipe rows,
+        # unless the extras changed, which reshapes every row
+        coffee_menu = self.coffee_menu
+        changes = {
+            "added": [name for name in menu.coffee_menu if name not in coffee_menu],
+            "changed": [name for name, details in menu.coffee_menu.items()
+                        if name in coffee_menu and coffee_menu[name] != details],
+            "removed": [name for name in coffee_menu if name not in menu.coffee_menu],
+            "sizes": list(menu.size_options.items()) != list(self.size_options.items()),
+            "extras": list(menu.extras.items()) != list(self.extras.items()),
+        }
+        if changes["extras"]:
+            for target, source in ((coffee_menu, menu.coffee_menu),
+                                   (self.size_options, menu.size_options),
+                                   (self.extras, menu.extras)):
+                target.clear()
+                target.update(source)
+            self.recipes.rebuild()
+            self.promotions.invalidate()
+        else:
+            if changes["sizes"]:
+                old_sizes = dict(self.size_options)
+                self.size_options.clear()
+                self.size_options.update(menu.size_options)
+                for size in old_sizes:
+                    if size not in menu.size_options:
+                        self.recipes.remove_size(size)
+                for size, multiplier in menu.size_options.items():
+                    if old_sizes.get(size) != multiplier:
+                        self.recipes.update_size(size)
+                self.promotions.invalidate()
+            for name in changes["removed"]:
+                self.remove_drink(name)
+            for name in changes["added"] + changes["changed"]:
+                self.set_drink(name, menu.coffee_menu[name])
+        self.set_promotions(menu.promotions)
+        return changes
+
+    def refill_resource(self, resource):
+        # Recovery rebuilds available stock, and stock held by orders still
+        # brewing is already spent by their journaled order events, so the
+        # refill journals the available level it leaves
+        index = INGREDIENT_IDS[resource]
+        with self._lock:
+            self.inventory.refill(index)
+            self._record("refill", resource=resource, level=self.inventory.available(index))
+
+    def resource_fractions(self):
+        # Fill levels in the 0..1 range used by the progress bars
+        return {name: self.inventory.fraction(index)
+                for index, name in enumerate(INGREDIENTS)}
+
+    @property
+    def money(self):
+        return self.ledger.balance(CASH) / 100
+
+    @property
+    def total_sales(self):
+        return self.ledger.sales.value() / 100
+
+    def account_for(self, table=""):
+        # Orders and payments for a table with an open tab go on the tab
+        if self.ledger.open_tabs and str(table).strip():
+            account = tab_account(table)
+            if self.ledger.has_tab(account):
+                return account
+        return CASH
+
+    def add_money(self, amount, txn_id=None, table=""):
+        # Credit the walk-in balance, or a table's tab. Ingestion sources
+        # pass txn_id so a retried payment is applied only once. Returns
+        # the Transaction.
+        transaction = self.ledger.post(self.account_for(table), to_cents(amount), txn_id)
+        self._snapshot_if_due()
+        return transaction
+
+    def take_payment(self, amount, txn_id=None, table=""):
+        # Charge the balance for an order that is brewed elsewhere
+        transaction = self.ledger.post(self.account_for(table), -to_cents(amount), txn_id)
+        self._snapshot_if_due()
+        return transaction.ok
+
+    def open_tab(self, table, limit=100):
+        # Orders for the table are charged to its tab, up to limit owed
+        self.ledger.open_tab(tab_account(table), to_cents(limit))
+        self._snapshot_if_due()
+
+    def settle_tab(self, table, txn_id=None):
+        # Amount the customer paid (negative: credit handed back), or None
+        # when the table has no open tab. Retrying with the same txn_id
+        # returns the amount of the first settlement.
+        transaction = self.ledger.settle_tab(tab_account(table), txn_id)
+        if transaction is None:
+            return None
+        self._snapshot_if_due()
+        return transaction.cents / 100
+
+    def reconcile(self, attempts=3):
+        # Replay the journal and compare it with the live ledger to the
+        # cent. Returns the differences, [] when both agree.
+        if self.journal is None:
+            return []
+        for _ in range(attempts):
+            with self._lock, self.ledger.locked():
+                live = self.ledger.state()
+                seq = self.journal.seq
+            self.journal.sync()
+            replayed = replay_journal(self.journal.directory, seq)
+            if replayed is not None:
+                return compare_states(live, replayed.state())
+        raise RuntimeError("journal snapshot kept moving past the reconciliation point")
+
+    def add_listener(self, callback):
+        # callback(event_type, result) for "order", "complete" and "cancel"
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def _notify(self, event_type, result):
+        for callback in self.listeners:
+            callback(event_type, result)
+
+    def _append(self, event_type, **fields):
+        if self.journal is None:
+            return None
+        return self.journal.append(event_type, **fields)
+
+    def _record(self, event_type, **fields):
+        # Journal an event; callers hold self._lock so snapshots line up with seq
+        seq = self._append(event_type, **fields)
+        if seq is not None and self.journal.snapshot_due():
+            self._take_snapshot()
+        return seq
+
+    def _snapshot_if_due(self):
+        # After a ledger posting, which journals under its shard lock only
+        if self.journal is not None and self.journal.snapshot_due():
+            with self._lock:
+                if self.journal.snapshot_due():
+                    self._take_snapshot()
+
+    def _take_snapshot(self):
+        # Ledger shards stay locked until the journal has read its seq
+        with self.ledger.locked():
+            self.journal.request_snapshot(self.snapshot())
+
+    def snapshot(self):
+        inventory = self.inventory
+        return {
+            "ledger": self.ledger.state(),
+            "drinks_sold": dict(self.drinks_sold),
+            # Reserved stock belongs to orders that are already journaled
+            "levels": [inventory.available(index) for index in range(len(INGREDIENTS))],
+        }
+
+    def restore(self, state):
+        self.ledger.restore(state["ledger"])
+        self.drinks_sold = dict(state["drinks_sold"])
+        for index, level in enumerate(state["levels"]):
+            self.inventory.levels[index] = level
+
+    def apply_event(self, event):
+        # Replay one journaled event during recovery
+        event_type = event["type"]
+        self.ledger.apply_event(event)
+        if event_type == "refill":
+            self.inventory.levels[INGREDIENT_IDS[event["resource"]]] = event["level"]
+        elif event_type in ("order", "cancel"):
+            sign = 1 if event_type == "order" else -1
+            coffee = event["coffee"]
+            self.drinks_sold[coffee] = self.drinks_sold.get(coffee, 0) + sign
+            levels = self.inventory.levels
+            for index, amount in enumerate(event["amounts"]):
+                levels[index] -= sign * amount
+
+    def quote(self, order, now=None):
+        # (final price rounded to the cent, discount fraction) for a valid order
+        cents, discount = self.quote_cents(order, now)
+        return cents / 100, discount
+
+    def quote_cents(self, order, now=None):
+        discount = self.get_discount(order, now)
+        return to_cents(self.calculate_price(order) * (1 - discount)), discount
+
+    def process_order(self, order, now=None, prepaid=False):
+        # Validate, price, reserve stock and charge an order in one call.
+        # Prepaid orders were paid somewhere else and skip the balance.
+        metrics = self.metrics
+        with metrics.span("order_phase_seconds", phase="validate"):
+            error = self.validate(order)
+        if error:
+            metrics.inc("orders_rejected_total", reason="invalid")
+            return OrderResult(order, False, error=error)
+
+        with metrics.span("order_phase_seconds", phase="calculate_price"):
+            cents, discount = self.quote_cents(order, now)
+            total_price = cents / 100
+
+        account = CASH if prepaid else self.account_for(order.table)
+        with self._lock:
+            if not prepaid and not self.ledger.charge(account, cents):
+                metrics.inc("orders_rejected_total", reason="balance")
+                return OrderResult(order, False, price=total_price, discount=discount,
+                                   error="⚠️ Insufficient balance!")
+
+            with metrics.span("order_phase_seconds", phase="check_resources"):
+                amounts = self.consumption(order)
+                reservation, missing = self.inventory.reserve(amounts)
+            if missing:
+                if not prepaid:
+                    self.ledger.credit(account, cents)
+                insufficient = [SHORTAGE_NAMES[index] for index in missing]
+                metrics.inc("orders_rejected_total", reason="stock")
+                for index in missing:
+                    metrics.inc("stockout_rejections_total", ingredient=INGREDIENTS[index])
+                return OrderResult(order, False, price=total_price, discount=discount,
+                                   insufficient=insufficient,
+                                   error=f"⚠️ Insufficient {', '.join(insufficient)}!")
+
+            self.ledger.sales.add(cents)
+            self.drinks_sold[order.coffee_type] = self.drinks_sold.get(order.coffee_type, 0) + 1
+            seq = self._record("order", coffee=order.coffee_type, size=order.size,
+                               extras=list(order.extras), customer=order.customer,
+                               table=order.table, notes=order.notes, price=total_price,
+                               cents=cents, account=account, discount=discount,
+                               amounts=list(amounts), prepaid=prepaid)
+
+        metrics.inc("orders_total", drink=order.coffee_type)
+
+        # Stock stays reserved until the brew finishes or fails
+        result = OrderResult(order, True, price=total_price, discount=discount)
+        result.reservation = reservation
+        result.state = "reserved"
+        result.journal_seq = seq
+        result.prepaid = prepaid
+        result.account = account
+        self._notify("order", result)
+        return result
+
+    def complete_order(self, result):
+        # Brew succeeded: consume the reserved stock
+        with self.metrics.span("order_phase_seconds", phase="update_resources"):
+            committed = result.state == "reserved" and self.inventory.commit(result.reservation)
+        if committed:
+            result.state = "committed"
+            result.completed_at = datetime.now()
+            self._notify("complete", result)
+            return True
+        return False
+
+    def cancel_order(self, result):
+        # Brew failed or never started: release stock and refund the customer.
+        # Prepaid orders are refunded by whoever took the payment.
+        with self._lock:
+            if result.state != "reserved" or not self.inventory.rollback(result.reservation):
+                return False
+            cents = to_cents(result.price)
+            if result.account != CASH and not self.ledger.has_tab(result.account):
+                result.account = CASH  # the tab was settled meanwhile
+            if not result.prepaid:
+                self.ledger.credit(result.account, cents)
+            self.ledger.sales.add(-cents)
+            self.drinks_sold[result.order.coffee_type] -= 1
+            self._record("cancel", order=result.journal_seq, coffee=result.order.coffee_type,
+                         price=result.price, cents=cents, account=result.account,
+                         amounts=list(result.reservation.amounts), prepaid=result.prepaid)
+        result.state = "cancelled"
+        self._notify("cancel", result)
+        return True
@@ -0,0 +1,78 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class Subscription:
+    # Bounded buffer of events for one subscriber. When the subscriber falls
+    # behind the oldest events are dropped, so publishing never waits.
+    def __init__(self, bus, size, match):
+        self.bus = bus
+        self.match = match
+        self.dropped = 0
+        self.closed = False
+        self._events = deque(maxlen=size)
+        self._ready = threading.Condition(threading.Lock())
+
+    def put(self, event):
+        if self.match is not None and not self.match(event):
+            return
+        with self._ready:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        # Next event, or None on timeout or once closed
+        with self._ready:
+            if not self._events and not self.closed:
+                self._ready.wait(timeout)
+            return self._events.popleft() if self._events else None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+
+class EventBus:
+    # Publish/subscribe fan-out for brew progress. publish() copies the
+    # subscriber list and hands each one the event without blocking.
+    def __init__(self, buffer=256):
+        self.buffer = buffer
+        self._subscribers = []
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, buffer=None, match=None):
+        # match(event) -> bool filters what reaches this subscriber
+        subscription = Subscription(self, buffer or self.buffer, match)
+        with self._lock:
+            self._subscribers = self._subscribers + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not subscription]
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event_type, **fields):
+        event = {"seq": next(self._seq), "type": event_type, "time": time.time()}
+        event.update(fields)
+        for subscription in self._subscribers:
+            subscription.put(event)
+        return event
+
+
+def publish_job_event(events, job, event_type, **fields):
+    # Brew pipeline event for one job; a no-op without a bus
+    if events is None:
+        return
+    order = job.order
+    events.publish(event_type, job=job.job_id, coffee=order.coffee_type, size=order.size,
+                   customer=order.customer, table=order.table, **fields)
@@ -0,0 +1,173 @@
+import threading
+
+from inventory import INGREDIENTS
+
+
+class CoordinatorUnavailable(Exception):
+    pass
+
+
+class MachineNode:
+    # One coffee machine as the coordinator sees it. accept(order) runs the
+    # machine's own prepaid order path and returns its OrderResult.
+    def __init__(self, name, engine, scheduler, accept):
+        self.name = name
+        self.engine = engine
+        self.scheduler = scheduler
+        self.accept = accept
+        self.refund = engine.add_money
+
+    def load(self):
+        return self.scheduler.queue_depth() + self.scheduler.in_progress()
+
+    def can_serve(self, order):
+        return not self.scheduler.is_full() and not self.engine.check_resources(order)
+
+    def status(self):
+        engine = self.engine
+        inventory = engine.inventory
+        return {
+            "name": self.name,
+            "queue": self.scheduler.queue_depth(),
+            "brewing": self.scheduler.in_progress(),
+            "full": self.scheduler.is_full(),
+            "money": engine.money,
+            "total_sales": engine.total_sales,
+            "drinks_sold": dict(engine.drinks_sold),
+            "available": {name: inventory.available(index)
+                          for index, name in enumerate(INGREDIENTS)},
+        }
+
+
+class FleetCoordinator:
+    # Routes orders to the least busy machine that has the stock for them and
+    # sums sales and inventory across machines. Payment is taken by the
+    # machine the customer stands at; the brewing machine gets a prepaid order.
+    def __init__(self):
+        self.nodes = {}
+        self.running = True
+        self.routed = {}
+        self._payers = {}
+        self._refunds = {}  # name -> [(price, table)] owed to a machine while it is away
+        self._listeners = {}  # name -> (engine, listener) of the latest registration
+        self._lock = threading.Lock()
+
+    def register(self, node):
+        # Registering again (a retry, or a restarted machine) replaces the
+        # node and its engine listener, so events are seen once
+        def listener(event_type, result):
+            self._on_order_event(node, event_type, result)
+
+        with self._lock:
+            self.nodes[node.name] = node
+            self.routed.setdefault(node.name, 0)
+            previous = self._listeners.get(node.name)
+            self._listeners[node.name] = (node.engine, listener)
+            refunds = self._refunds.pop(node.name, [])
+        if previous is not None:
+            previous[0].remove_listener(previous[1])
+        node.engine.add_listener(listener)
+        for price, table in refunds:
+            node.refund(price, table=table)
+
+    def unregister(self, name):
+        # The listener stays, so orders still brewing there are refunded
+        # to their payers if they fail. Refunds owed to this machine are
+        # kept until it registers again.
+        with self._lock:
+            self.nodes.pop(name, None)
+
+    def stop(self):
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def candidates(self, order, origin=None):
+        # Machines able to brew the order, least loaded first; ties stay local
+        with self._lock:
+            nodes = list(self.nodes.values())
+        ranked = sorted(((node.load(), node.name != origin, node.name), node)
+                        for node in nodes if node.can_serve(order))
+        return [node for _, node in ranked]
+
+    def route(self, order, origin=None):
+        candidates = self.candidates(order, origin)
+        return candidates[0].name if candidates else None
+
+    def submit(self, order, origin=None):
+        # (machine name, OrderResult) for the first machine that accepts the
+        # prepaid order, or (None, None) if none can
+        for node in self.candidates(order, origin):
+            result = node.accept(order)
+            if result is not None and result.ok:
+                with self._lock:
+                    self.routed[node.name] += 1
+                    if origin is not None:
+                        self._payers[id(result)] = origin
+                return node.name, result
+        return None, None
+
+    def _on_order_event(self, node, event_type, result):
+        if not result.prepaid or event_type not in ("complete", "cancel"):
+            return
+        with self._lock:
+            name = self._payers.pop(id(result), None)
+            payer = self.nodes.get(name)
+            if event_type == "cancel" and payer is None and name is not None:
+                # The paying machine is away: refund it when it registers again
+                self._refunds.setdefault(name, []).append((result.price, result.order.table))
+        # A brew that failed on another machine is refunded where it was paid
+        if event_type == "cancel" and payer is not None:
+            payer.refund(result.price, table=result.order.table)
+
+    def aggregate(self):
+        with self._lock:
+            nodes = list(self.nodes.values())
+            routed = dict(self.routed)
+        machines = [node.status() for node in nodes]
+        drinks_sold = {}
+        available = dict.fromkeys(INGREDIENTS, 0.0)
+        for status in machines:
+            for drink, count in status["drinks_sold"].items():
+                drinks_sold[drink] = drinks_sold.get(drink, 0) + count
+            for name, amount in status["available"].items():
+                available[name] += amount
+            status["routed"] = routed.get(status["name"], 0)
+        return {
+            "machines": machines,
+            "money": sum(status["money"] for status in machines),
+            "total_sales": sum(status["total_sales"] for status in machines),
+            "drinks_sold": drinks_sold,
+            "available": available,
+            "queue": sum(status["queue"] + status["brewing"] for status in machines),
+        }
+
+
+class LocalTransport:
+    # In-process stand-in for the link between a machine and the coordinator.
+    # Every call fails with CoordinatorUnavailable while the coordinator is
+    # stopped, so callers fall back to serving from local state.
+    def __init__(self, coordinator, name):
+        self.coordinator = coordinator
+        self.name = name
+
+    def _check(self):
+        if not self.coordinator.running:
+            raise CoordinatorUnavailable("Fleet coordinator is not running")
+
+    def register(self, node):
+        self._check()
+        self.coordinator.register(node)
+
+    def unregister(self):
+        self._check()
+        self.coordinator.unregister(self.name)
+
+    def submit(self, order):
+        self._check()
+        return self.coordinator.submit(order, origin=self.name)
+
+    def aggregate(self):
+        self._check()
+        return self.coordinator.aggregate()
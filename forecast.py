@@ -0,0 +1,143 @@
+import math
+import threading
+import time
+from array import array
+from datetime import datetime
+
+from inventory import INGREDIENTS
+
+
+class RefillForecaster:
+    # Consumption-rate model per ingredient:
+    # - a fast exponentially decaying rate that reacts within minutes
+    # - a 24-slot hour-of-day profile, each slot an EWMA of that hour's
+    #   rate over previous days
+    # Both are updated in O(1) per committed order; projections walk the
+    # hourly profile forward from the current stock.
+    def __init__(self, inventory, tau=900.0, alpha=0.3, alert_horizon=1800.0,
+                 max_horizon=7 * 86400):
+        self.inventory = inventory
+        self.tau = tau
+        self.alpha = alpha
+        self.alert_horizon = alert_horizon
+        self.max_horizon = max_horizon
+
+        width = len(INGREDIENTS)
+        self.fast_rate = array("d", bytes(8 * width))
+        self.profile = [array("d", bytes(8 * width)) for _ in range(24)]
+        self.profile_seen = [False] * 24
+        self._hour_used = array("d", bytes(8 * width))
+        self._hour_key = None
+        self._last_update = None
+        self._alerted = set()
+        self._lock = threading.Lock()
+
+    def record(self, amounts, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self._roll_hour(timestamp)
+            decay = 1.0
+            if self._last_update is not None:
+                decay = math.exp(-max(0.0, timestamp - self._last_update) / self.tau)
+            self._last_update = timestamp
+            fast = self.fast_rate
+            used = self._hour_used
+            for index, amount in enumerate(amounts):
+                fast[index] = fast[index] * decay + amount / self.tau
+                used[index] += amount
+
+    def on_order_event(self, event_type, result):
+        # Engine listener: only brewed orders consume stock, at the moment
+        # the brew finished
+        if event_type == "complete":
+            self.record(result.reservation.amounts, result.completed_at.timestamp())
+
+    def _roll_hour(self, timestamp):
+        # Fold the finished hour into its hour-of-day slot, then every hour
+        # after it that passed without an order as zero consumption
+        key = int(timestamp // 3600)
+        if self._hour_key is None:
+            self._hour_key = key
+            return
+        if key <= self._hour_key:
+            return
+        self._fold(self._hour_key, self._hour_used, 1)
+        for index in range(len(self._hour_used)):
+            self._hour_used[index] = 0.0
+        # A gap of days folds each slot once per day it covered
+        empty = key - self._hour_key - 1
+        for offset in range(1, min(empty, 24) + 1):
+            self._fold(self._hour_key + offset, self._hour_used, (empty - offset) // 24 + 1)
+        self._hour_key = key
+
+    def _fold(self, key, used, times):
+        # The EWMA step for hour key's slot, repeated times with the same usage
+        hour = datetime.fromtimestamp(key * 3600).hour
+        slot = self.profile[hour]
+        seen = self.profile_seen[hour]
+        keep = (1 - self.alpha) ** times
+        for index, amount in enumerate(used):
+            rate = amount / 3600
+            slot[index] = rate if not seen else (1 - keep) * rate + keep * slot[index]
+        self.profile_seen[hour] = True
+
+    def rate(self, ingredient, timestamp=None):
+        # Current consumption per second, decayed to the given time
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if self._last_update is None:
+                return 0.0
+            decay = math.exp(-max(0.0, timestamp - self._last_update) / self.tau)
+            return self.fast_rate[ingredient] * decay
+
+    def time_to_empty(self, ingredient, timestamp=None):
+        # Seconds until the ingredient runs out, or None beyond max_horizon
+        timestamp = time.time() if timestamp is None else timestamp
+        stock = self.inventory.available(ingredient)
+        if stock <= 0:
+            return 0.0
+        current = self.rate(ingredient, timestamp)
+
+        elapsed = 0.0
+        moment = timestamp
+        while elapsed < self.max_horizon:
+            hour = datetime.fromtimestamp(moment).hour
+            hour_left = 3600 - moment % 3600
+            if self.profile_seen[hour]:
+                expected = self.profile[hour][ingredient]
+                # The running hour also trusts what is happening right now
+                rate = max(expected, current) if elapsed == 0 else expected
+            else:
+                rate = current
+            if rate > 0 and stock <= rate * hour_left:
+                return elapsed + stock / rate
+            stock -= rate * hour_left
+            elapsed += hour_left
+            moment += hour_left
+        return None
+
+    def forecast(self, timestamp=None):
+        # {ingredient name: seconds to empty or None}
+        return {name: self.time_to_empty(index, timestamp)
+                for index, name in enumerate(INGREDIENTS)}
+
+    def new_alerts(self, forecast):
+        # Ingredients in a forecast() result that just crossed into the alert horizon
+        alerts = []
+        for name, seconds in forecast.items():
+            if seconds is not None and seconds <= self.alert_horizon:
+                if name not in self._alerted:
+                    self._alerted.add(name)
+                    alerts.append((name, seconds))
+            else:
+                self._alerted.discard(name)
+        return alerts
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "—"
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"~{minutes}m"
+    return f"~{minutes // 60}h {minutes % 60:02d}m"
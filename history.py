@@ -0,0 +1,63 @@
+from datetime import datetime
+
+
+class OrderRecord:
+    __slots__ = ("timestamp", "coffee_type", "size", "extras", "customer", "table",
+                 "notes", "price")
+
+    def __init__(self, timestamp, coffee_type, size, extras=(), customer="", table="",
+                 notes="", price=0.0):
+        self.timestamp = timestamp
+        self.coffee_type = coffee_type
+        self.size = size
+        self.extras = tuple(extras)
+        self.customer = customer
+        self.table = table
+        self.notes = notes
+        self.price = price
+
+    @classmethod
+    def from_order(cls, order, when=None, price=0.0):
+        return cls((when or datetime.now()).timestamp(), order.coffee_type, order.size,
+                   order.extras, order.customer, order.table, order.notes, price)
+
+
+class RingBuffer:
+    # Fixed-capacity buffer; appending when full overwrites the oldest item
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, item):
+        # Returns the evicted item, or None
+        if self._count < self.capacity:
+            self._items[(self._start + self._count) % self.capacity] = item
+            self._count += 1
+            return None
+        evicted = self._items[self._start]
+        self._items[self._start] = item
+        self._start = (self._start + 1) % self.capacity
+        return evicted
+
+    def __getitem__(self, index):
+        # 0 is the oldest item, -1 the newest
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("ring buffer index out of range")
+        return self._items[(self._start + index) % self.capacity]
+
+    def newest(self, count, offset=0):
+        # Up to count items, newest first, skipping the offset newest ones
+        last = self._count - 1 - offset
+        return [self[index] for index in range(last, max(-1, last - count), -1)]
+
+    def clear(self):
+        self._items = [None] * self.capacity
+        self._start = 0
+        self._count = 0
@@ -0,0 +1,331 @@
+import hmac
+import json
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from urllib.parse import parse_qs, urlsplit
+
+from engine import Order
+from scheduler import QueueFullError
+
+
+FINISHED = ("done", "failed", "cancelled")
+MAX_BODY = 64 * 1024  # bytes; orders and payments are a few hundred
+
+
+def parse_order(payload, engine):
+    # (Order, "") for a valid JSON order, or (None, error message)
+    if not isinstance(payload, dict):
+        return None, "order must be a JSON object"
+    coffee = payload.get("coffee")
+    if coffee not in engine.coffee_menu:
+        return None, f"unknown coffee: {coffee}"
+    size = payload.get("size", "Medium")
+    if size not in engine.size_options:
+        return None, f"unknown size: {size}"
+    extras = payload.get("extras", [])
+    if not isinstance(extras, list) or any(extra not in engine.extras for extra in extras):
+        return None, f"unknown extras: {extras}"
+    temperature = payload.get("temperature", 90)
+    if not isinstance(temperature, (int, float)) or not 65 <= temperature <= 95:
+        return None, "temperature must be between 65 and 95"
+    fields = {}
+    for key in ("customer", "table", "notes"):
+        value = payload.get(key, "")
+        if not isinstance(value, (str, int)):
+            return None, f"{key} must be a string"
+        fields[key] = str(value)
+    return Order(coffee, size, extras, temperature=temperature, **fields), ""
+
+
+def parse_payment(payload):
+    # (txn id, amount, table, "") for a valid JSON payment, or error last
+    if not isinstance(payload, dict):
+        return None, None, None, "payment must be a JSON object"
+    txn_id = payload.get("txn")
+    if not isinstance(txn_id, str) or not 0 < len(txn_id) <= 64:
+        return None, None, None, "txn must be a string of 1 to 64 characters"
+    amount = payload.get("amount")
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not 0 < amount <= 10000:
+        return None, None, None, "amount must be between 0 and 10000"
+    table = payload.get("table", "")
+    if not isinstance(table, (str, int)):
+        return None, None, None, "table must be a string"
+    return txn_id, amount, str(table), ""
+
+
+class OrderIngestServer:
+    # HTTP/JSON entry point for tablets and the POS, next to the GUI.
+    #   POST /orders       -> 202 {"id", "status", "price", "eta"}; charged to
+    #                         the table's open tab or the walk-in balance,
+    #                         402 when that doesn't cover the order
+    #   GET  /orders/<id>  -> 200 {"id", "status", "step", ...}
+    #   GET  /menu         -> 200 drinks, sizes and extras
+    #   POST /payments     -> 200 {"txn", "balance", "duplicate"}; credits the
+    #                         walk-in balance or the table's open tab once per txn
+    #   GET  /events[?order=<id>] -> server-sent brew events until the
+    #                                order is done, or for every order
+    # Connections are HTTP/1.1 keep-alive. Handler threads never touch the
+    # brew pipeline: orders go through a bounded inbox that drain() empties
+    # on the machine's own loop. A full brew queue or inbox answers 429.
+    # Payments go straight to the engine's ledger from the handler thread.
+    # The server listens on localhost only unless given another host; with
+    # a token, every request needs "Authorization: Bearer <token>".
+    def __init__(self, engine, scheduler, accept, host="127.0.0.1", port=8080,
+                 max_pending=64, timeout=5.0, keep=1000, events=None, heartbeat=15.0,
+                 token=None):
+        self.engine = engine
+        self.scheduler = scheduler
+        self.accept = accept  # accept(order) -> (OrderResult, BrewJob), on the loop
+        self.host = host
+        self.port = port
+        self.token = token
+        self.timeout = timeout
+        self.keep = keep
+        self.events = events
+        self.heartbeat = heartbeat
+        self.orders = OrderedDict()
+        self._inbox = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def submit(self, order):
+        # Called from handler threads; resolves to (status code, body)
+        if self.scheduler.is_full():
+            raise QueueFullError("Brew queue is full")
+        future = Future()
+        try:
+            self._inbox.put_nowait((order, future))
+        except queue.Full:
+            raise QueueFullError("Too many orders waiting") from None
+        return future
+
+    def wait(self, future):
+        # (status code, body) for a submitted order. One still in the inbox
+        # at the timeout is cancelled and never brewed; one the loop has
+        # already picked up can't be, so its answer gets one more timeout.
+        # If the loop is stalled past that, the handler gives up with 504.
+        for _ in range(2):
+            try:
+                return future.result(self.timeout)
+            except FutureTimeout:
+                if future.cancel():
+                    return 503, {"error": "machine did not respond"}
+        return 504, {"error": "machine did not answer in time; the order may still be placed"}
+
+    def authorized(self, header):
+        if not self.token:
+            return True
+        return hmac.compare_digest((header or "").encode("utf-8"),
+                                   f"Bearer {self.token}".encode("utf-8"))
+
+    def drain(self):
+        # Runs on the machine's loop: hand waiting orders to the brew path
+        while True:
+            try:
+                order, future = self._inbox.get_nowait()
+            except queue.Empty:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._accept(order))
+            except Exception as error:
+                future.set_exception(error)
+
+    def _accept(self, order):
+        try:
+            result, job = self.accept(order)
+        except QueueFullError as error:
+            return 429, {"error": str(error)}
+        if not result.ok:
+            if result.insufficient:
+                code = 409
+            elif "balance" in result.error:
+                code = 402
+            else:
+                code = 400
+            return code, {"error": result.error, "insufficient": result.insufficient}
+
+        # Order ids are brew job ids, so they match the event stream
+        order_id = job.job_id
+        with self._lock:
+            self.orders[order_id] = (result, job)
+            while len(self.orders) > self.keep:
+                self.orders.popitem(last=False)
+        return 202, {"id": order_id, "status": job.status, "price": round(result.price, 2),
+                     "eta": round(self.scheduler.eta(job.job_id) or job.duration, 1)}
+
+    def pay(self, txn_id, amount, table=""):
+        transaction = self.engine.add_money(amount, txn_id, table)
+        return 200, {"txn": txn_id, "balance": transaction.balance / 100,
+                     "duplicate": transaction.duplicate}
+
+    def status(self, order_id):
+        with self._lock:
+            entry = self.orders.get(order_id)
+        if entry is None:
+            return None
+        result, job = entry
+        status = "cancelled" if result.state == "cancelled" else job.status
+        return {"id": order_id, "status": status, "step": job.current_step,
+                "coffee": result.order.coffee_type, "size": result.order.size,
+                "price": round(result.price, 2)}
+
+    def menu(self):
+        engine = self.engine
+        return {"drinks": {name: details["price"] for name, details in engine.coffee_menu.items()},
+                "sizes": dict(engine.size_options),
+                "extras": {name: details["price"] for name, details in engine.extras.items()}}
+
+    def start(self):
+        # Imported here so the GUI doesn't pay for http.server unless enabled
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        ingest = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            timeout = 60  # idle keep-alive connections are closed after this
+
+            def do_GET(self):
+                if not self.check_token():
+                    return
+                url = urlsplit(self.path)
+                if url.path == "/menu":
+                    self.reply(200, ingest.menu())
+                elif url.path == "/events" and ingest.events is not None:
+                    self.stream_events(parse_qs(url.query))
+                elif url.path.startswith("/orders/"):
+                    try:
+                        status = ingest.status(int(url.path[len("/orders/"):]))
+                    except ValueError:
+                        status = None
+                    if status is None:
+                        self.reply(404, {"error": "unknown order"})
+                    else:
+                        self.reply(200, status)
+                else:
+                    self.reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                if not self.check_token():
+                    return
+                if self.path not in ("/orders", "/payments"):
+                    self.reply(404, {"error": "not found"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY:
+                    # The body is left unread, so the connection can't be reused
+                    self.close_connection = True
+                    if length < 0:
+                        self.reply(400, {"error": "bad Content-Length"})
+                    else:
+                        self.reply(413, {"error": f"body over {MAX_BODY} bytes"})
+                    return
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"null")
+                except ValueError:
+                    self.reply(400, {"error": "body must be JSON"})
+                    return
+                if self.path == "/payments":
+                    txn_id, amount, table, error = parse_payment(payload)
+                    if error:
+                        self.reply(400, {"error": error})
+                    else:
+                        self.reply(*ingest.pay(txn_id, amount, table))
+                    return
+                order, error = parse_order(payload, ingest.engine)
+                if error:
+                    self.reply(400, {"error": error})
+                    return
+                try:
+                    code, body = ingest.wait(ingest.submit(order))
+                except QueueFullError as error:
+                    code, body = 429, {"error": str(error)}
+                self.reply(code, body)
+
+            def stream_events(self, query):
+                # Long-lived text/event-stream response. A slow client only
+                # blocks this thread; the bus drops its oldest events instead.
+                try:
+                    order_id = int(query["order"][0]) if "order" in query else None
+                except ValueError:
+                    self.reply(400, {"error": "order must be a number"})
+                    return
+                match = None
+                if order_id is not None:
+                    match = lambda event: event.get("job") == order_id
+                subscription = ingest.events.subscribe(match=match)
+
+                self.close_connection = True
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                try:
+                    status = ingest.status(order_id) if order_id is not None else None
+                    if status is not None and status["status"] in FINISHED:
+                        # Finished before the client subscribed
+                        self.send_event("status", status)
+                        return
+                    while True:
+                        event = subscription.get(ingest.heartbeat)
+                        if event is None:
+                            self.wfile.write(b": keep-alive\n\n")
+                        else:
+                            self.send_event(event["type"], event)
+                            if order_id is not None and event["type"] in FINISHED:
+                                return
+                        self.wfile.flush()
+                except OSError:
+                    pass  # client went away
+                finally:
+                    subscription.close()
+
+            def check_token(self):
+                if ingest.authorized(self.headers.get("Authorization")):
+                    return True
+                self.reply(401, {"error": "missing or wrong API token"})
+                return False
+
+            def send_event(self, event_type, data):
+                self.wfile.write(f"event: {event_type}\ndata: "
+                                 f"{json.dumps(data, ensure_ascii=False)}\n\n".encode())
+                self.wfile.flush()
+
+            def reply(self, code, body):
+                data = json.dumps(body, ensure_ascii=False).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if code == 429:
+                    self.send_header("Retry-After", "5")
+                elif code == 401:
+                    self.send_header("WWW-Authenticate", "Bearer")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 128
+
+        self._server = Server((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="order-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,107 @@
+import itertools
+import threading
+from array import array
+
+
+# Ingredient ids index every consumption vector and the inventory arrays
+WATER = 0
+COFFEE = 1
+MILK = 2
+CARAMEL_SYRUP = 3
+VANILLA_SYRUP = 4
+CHOCOLATE_SAUCE = 5
+WHIPPED_CREAM = 6
+
+INGREDIENTS = ("Water", "Coffee", "Milk", "Caramel Syrup", "Vanilla Syrup",
+               "Chocolate Sauce", "Whipped Cream")
+INGREDIENT_IDS = {name: index for index, name in enumerate(INGREDIENTS)}
+
+# Names used in "Insufficient ..." messages
+SHORTAGE_NAMES = ("water", "coffee beans", "milk", "Caramel Syrup", "Vanilla Syrup",
+                  "Chocolate Sauce", "Whipped Cream")
+
+CAPACITIES = (2000, 1000, 2000, 1000, 1000, 1000, 1000)  # ml / g
+
+
+def empty_vector():
+    return array("d", bytes(8 * len(INGREDIENTS)))
+
+
+class Reservation:
+    def __init__(self, reservation_id, amounts):
+        self.reservation_id = reservation_id
+        self.amounts = amounts
+        self.state = "reserved"
+
+
+class Inventory:
+    def __init__(self, capacities=CAPACITIES):
+        self.capacity = array("d", capacities)
+        self.levels = array("d", capacities)
+        self.reserved = empty_vector()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def available(self, ingredient):
+        return self.levels[ingredient] - self.reserved[ingredient]
+
+    def fraction(self, ingredient):
+        return self.available(ingredient) / self.capacity[ingredient]
+
+    def shortages(self, amounts):
+        with self._lock:
+            return self._shortages(amounts)
+
+    def _shortages(self, amounts):
+        levels = self.levels
+        reserved = self.reserved
+        return [index for index, amount in enumerate(amounts)
+                if amount and levels[index] - reserved[index] < amount]
+
+    def reserve(self, amounts):
+        # Check and hold stock in one step; returns (reservation, shortages)
+        with self._lock:
+            missing = self._shortages(amounts)
+            if missing:
+                return None, missing
+            reserved = self.reserved
+            for index, amount in enumerate(amounts):
+                if amount:
+                    reserved[index] += amount
+            return Reservation(next(self._ids), amounts), []
+
+    def commit(self, reservation):
+        # Brew succeeded: the held stock is consumed
+        with self._lock:
+            if reservation.state != "reserved":
+                return False
+            for index, amount in enumerate(reservation.amounts):
+                if amount:
+                    self.reserved[index] -= amount
+                    self.levels[index] -= amount
+            reservation.state = "committed"
+            return True
+
+    def rollback(self, reservation):
+        # Brew failed or was cancelled: release the held stock
+        with self._lock:
+            if reservation.state != "reserved":
+                return False
+            for index, amount in enumerate(reservation.amounts):
+                if amount:
+                    self.reserved[index] -= amount
+            reservation.state = "rolled back"
+            return True
+
+    def refill(self, ingredient, amount=None):
+        with self._lock:
+            if amount is None:
+                self.levels[ingredient] = self.capacity[ingredient]
+            else:
+                self.levels[ingredient] = min(self.capacity[ingredient],
+                                              self.levels[ingredient] + amount)
+
+    def drain(self, ingredient):
+        # Stock runs out: only what brewing orders already hold is left
+        with self._lock:
+            self.levels[ingredient] = self.reserved[ingredient]
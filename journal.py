@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class Journal:
+    # Append-only event log with group commit and periodic snapshots.
+    # append() only buffers the line; a writer thread writes and fsyncs
+    # everything buffered in one go, so fsync never runs on the order path.
+    def __init__(self, directory, flush_interval=0.05, batch_size=256,
+                 snapshot_every=1000, keep_recent=50):
+        self.directory = directory
+        self.log_path = os.path.join(directory, "journal.log")
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+
+        self.seq = 0
+        self.recent_orders = deque(maxlen=keep_recent)
+        self.durable_seq = 0
+        self._buffer = []
+        self._snapshot = None
+        self._since_snapshot = 0
+        self._file = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._durable = threading.Condition(self._lock)
+        self._writer = None
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(self.log_path, "a", encoding="utf-8")
+        self._writer = threading.Thread(target=self._write_loop, name="journal-writer",
+                                        daemon=True)
+        self._writer.start()
+
+    def append(self, event_type, **fields):
+        # Buffer one event and return its sequence number
+        with self._lock:
+            self.seq += 1
+            fields["seq"] = self.seq
+            fields["type"] = event_type
+            fields.setdefault("ts", time.time())
+            if event_type == "order":
+                self.recent_orders.append(fields)
+            self._buffer.append(json.dumps(fields, ensure_ascii=False))
+            self._since_snapshot += 1
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.notify()
+            return self.seq
+
+    def snapshot_due(self):
+        return self._since_snapshot >= self.snapshot_every
+
+    def request_snapshot(self, state):
+        # State must describe everything up to the current seq
+        with self._lock:
+            self._snapshot = {"seq": self.seq, "state": state,
+                              "recent": list(self.recent_orders)}
+            self._since_snapshot = 0
+            self._wakeup.notify()
+
+    def sync(self, timeout=None):
+        # Block until every appended event is on disk
+        with self._lock:
+            target = self.seq
+            self._wakeup.notify()
+            return self._durable.wait_for(lambda: self.durable_seq >= target, timeout)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_loop(self):
+        while True:
+            with self._lock:
+                if not self._buffer and self._snapshot is None and not self._closed:
+                    self._wakeup.wait(self.flush_interval)
+                lines, self._buffer = self._buffer, []
+                snapshot, self._snapshot = self._snapshot, None
+                target = self.seq
+                closed = self._closed
+
+            if lines:
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            if snapshot is not None:
+                self._write_snapshot(snapshot)
+
+            with self._lock:
+                self.durable_seq = max(self.durable_seq, target)
+                self._durable.notify_all()
+            if closed and not self._buffer:
+                break
+
+    def _write_snapshot(self, snapshot):
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            json.dump(snapshot, handle, ensure_ascii=False)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+    def recover(self, engine):
+        # Rebuild engine state from the snapshot plus the journal tail.
+        # Call before open(); returns the most recent order events, oldest first.
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as handle:
+                snapshot = json.load(handle)
+            snapshot_seq = snapshot["seq"]
+            engine.restore(snapshot["state"])
+            self.recent_orders.extend(snapshot.get("recent", []))
+
+        last_seq = snapshot_seq
+        if os.path.exists(self.log_path):
+            with open(self.log_path, encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash: nothing after it was acknowledged
+                        break
+                    if event["seq"] <= snapshot_seq:
+                        continue
+                    last_seq = event["seq"]
+                    if event["type"] == "order":
+                        self.recent_orders.append(event)
+                    engine.apply_event(event)
+
+        # Compact: everything so far goes into a fresh snapshot
+        self.seq = self.durable_seq = last_seq
+        self._write_snapshot({"seq": last_seq, "state": engine.snapshot(),
+                              "recent": list(self.recent_orders)})
+        open(self.log_path, "w", encoding="utf-8").close()
+        return list(self.recent_orders)
@@ -1,118 +1,206 @@
 import customtkinter as ctk
+import os
+import sys
 import threading
+from collections import deque
 import time
-from PIL import Image, ImageTk
-import json
 from datetime import datetime
+from brewmodel import BrewModel
+from engine import Order, OrderEngine
+from events import EventBus
+from forecast import RefillForecaster, format_duration
+from history import OrderRecord, RingBuffer
+from journal import Journal
+from menuconfig import MENU_PATH, MenuWatcher, load_menu
+from metrics import Metrics
+from promotions import load_promotions
+from scheduler import BatchingPolicy, EventBrewScheduler, QueueFullError
+from timeline import TkTimeline
+from viewmodel import ViewModel
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SECONDARY_PANEL_DELAY = 0.05  # seconds after the first paint
+FLEET_RETRY = 10.0  # seconds between attempts to join an unreachable fleet
 
 class ModernCoffeeMachine:
-    def __init__(self):
-        # Main window setup
-        self.app = ctk.CTk()
-        self.app.title("Modern Coffee Machine")
+    def __init__(self, data_dir=DATA_DIR, name="Coffee Machine", fleet=None, master=None):
+        # Startup profiling: COFFEE_PROFILE_STARTUP=1 or --profile-startup
+        self.profile_startup = (os.environ.get("COFFEE_PROFILE_STARTUP") == "1"
+                                or "--profile-startup" in sys.argv)
+        self.startup_started = time.perf_counter()
+        self.startup_timings = []
+
+        # Main window setup; with a master the machine opens in a window of
+        # that root and shares its main loop
+        self.app = ctk.CTk() if master is None else ctk.CTkToplevel(master)
+        self.app.title(f"Modern Coffee Machine - {name}" if fleet else "Modern Coffee Machine")
         self.app.geometry("1200x800")
 
         # Theme settings
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("blue")
 
+        # Timing spans and counters; COFFEE_METRICS=1 turns them on
+        self.metrics = Metrics(enabled=os.environ.get("COFFEE_METRICS") == "1")
+        self.metrics_server = None
+        if self.metrics.enabled:
+            from metrics import MetricsServer
+            self.metrics_server = MetricsServer(
+                self.metrics, port=int(os.environ.get("COFFEE_METRICS_PORT", "9108")))
+            self.metrics_server.start()
+
+        # Menu config, compiled and cached by file hash under data/cache;
+        # COFFEE_MENU points at another store's menu file
+        self.menu_path = os.environ.get("COFFEE_MENU", MENU_PATH)
+        self.menu_cache = os.path.join(data_dir, "cache")
+        menu = self.timed_section("menu load",
+                                  lambda: load_menu(self.menu_path, self.menu_cache))
+
+        # Headless order engine holds menu, resources and sales
+        self.engine = OrderEngine(menu)
+        self.engine.metrics = self.metrics
+        self.coffee_menu = self.engine.coffee_menu
+        self.size_options = self.engine.size_options
+        self.extras = self.engine.extras
+        self.promotions_path = os.path.join(data_dir, "promotions.json")
+        self.load_store_promotions()
+
+        # Sales and stock survive restarts through the order journal
+        self.journal = Journal(data_dir)
+        self.recovered_orders = self.timed_section(
+            "journal recovery", lambda: self.journal.recover(self.engine))
+        self.journal.open()
+        self.engine.journal = self.journal
+
+        # Rolling sales buckets plus columnar order history on disk
+        from analytics import SalesAnalytics, ShardedColumnStore
+        self.analytics = SalesAnalytics(ShardedColumnStore(os.path.join(data_dir, "analytics")))
+        self.timed_section("analytics load", lambda: self.analytics.load(time.time()))
+        self.engine.add_listener(self.analytics.on_order_event)
+
+        # Customer profiles and loyalty points, read from disk on first use
+        from customers import CustomerStore
+        self.customers = CustomerStore(os.path.join(data_dir, "customers"))
+        self.engine.promotions.visits = self.customers.visits
+
+        # Receipts, order history and loyalty points are worked out in worker
+        # processes; the order path only copies the order into shared memory.
+        # COFFEE_WORKERS sets how many (default 2, 0 keeps it in-process).
+        # They are spawned after the first paint; until then the pool does
+        # the work in-process.
+        from postorder import PostOrderPool, RecordLayout
+        self.post_orders = PostOrderPool(
+            data_dir, self.analytics.store,
+            RecordLayout.for_menu(self.coffee_menu, self.size_options,
+                                  self.engine.recipes.extra_names),
+            workers=int(os.environ.get("COFFEE_WORKERS", "2")),
+            points_per_unit=self.customers.points_per_unit,
+            on_result=self.on_post_order_result, metrics=self.metrics)
+        self.analytics.record_history = False
+        self.engine.add_listener(self.post_orders.on_order_event)
+
+        # Time-to-empty projections from recent consumption
+        self.forecaster = RefillForecaster(self.engine.inventory)
+        self.engine.add_listener(self.forecaster.on_order_event)
+
+        # One timer loop on the Tk main loop drives brewing, clock and tips
+        self.timeline = TkTimeline(self.app)
+
+        # Per-order brew progress for displays, tablets and logs
+        self.events = EventBus()
+
+        # Brew stations share the grinder, boiler and milk steamer; step times
+        # follow size, temperature, extras and the boiler's heat.
+        # COFFEE_QUEUE_POLICY=batch groups similar drinks, holding an order
+        # back at most COFFEE_MAX_WAIT seconds (default 120)
+        policy = None
+        if os.environ.get("COFFEE_QUEUE_POLICY") == "batch":
+            policy = BatchingPolicy(max_wait=float(os.environ.get("COFFEE_MAX_WAIT", "120")))
+        self.scheduler = EventBrewScheduler(self.coffee_menu,
+                                            self.timeline,
+                                            stations=2,
+                                            max_queue=10,
+                                            on_step=self.on_brew_step,
+                                            on_done=self.on_brew_done,
+                                            metrics=self.metrics,
+                                            events=self.events,
+                                            model=BrewModel(self.engine.recipes),
+                                            policy=policy)
+
+        # Network orders from tablets and the POS: COFFEE_API=1. Only this
+        # computer can reach it unless COFFEE_API_HOST says otherwise (e.g.
+        # 0.0.0.0); set COFFEE_API_TOKEN when other devices can
+        self.ingest = None
+        if os.environ.get("COFFEE_API") == "1":
+            from ingest import OrderIngestServer
+            self.ingest = OrderIngestServer(
+                self.engine, self.scheduler, self.accept_order,
+                host=os.environ.get("COFFEE_API_HOST", "127.0.0.1"),
+                port=int(os.environ.get("COFFEE_API_PORT", "8080")), events=self.events,
+                token=os.environ.get("COFFEE_API_TOKEN") or None)
+            self.ingest.start()
+
+        # Fleet mode: orders go through the coordinator to the least busy
+        # machine with enough stock; without it this machine serves alone
+        self.name = name
+        self.fleet = fleet
+        self.fleet_timer = None
+        if fleet is not None:
+            from fleet import MachineNode
+            self.fleet_node = MachineNode(name, self.engine, self.scheduler,
+                                          self.accept_fleet_order)
+            if not self.register_with_fleet():
+                # Coordinator is down: serve alone and keep trying to join
+                self.fleet_timer = self.timeline.every(FLEET_RETRY, self.register_with_fleet,
+                                                       delay=FLEET_RETRY)
+
+        # Widget refreshes are coalesced and drawn at most 20 times a second
+        self.view = ViewModel(self.timeline, fps=20)
+        self.status_text = "Coffee Machine Ready ☕"
+
+        # Charged orders waiting for their brew to finish, by job id
+        self.brewing_orders = {}
+
         # Basic variables
-        self.water_level = 2000  # ml
-        self.coffee_beans = 1000  # g
-        self.milk_level = 2000   # ml
-        self.caramel_syrup = 1000  # ml
-        self.vanilla_syrup = 1000  # ml
-        self.chocolate_sauce = 1000  # ml
-        self.whipped_cream = 1000  # ml
-        self.money = 0.0
-        self.is_brewing = False
         self.temperature = 90
-        self.total_sales = 0
-        self.drinks_sold = {}
-        self.recent_orders = []
-        self.max_recent_orders = 5
-
-        # Daily specials
-        self.daily_specials = {
-            "Monday": {"drink": "Caramel Latte", "discount": 20},
-            "Tuesday": {"drink": "Mocha", "discount": 15},
-            "Wednesday": {"drink": "Cappuccino", "discount": 20},
-            "Thursday": {"drink": "Vanilla Latte", "discount": 15},
-            "Friday": {"drink": "Espresso", "discount": 25},
-            "Saturday": {"drink": "Americano", "discount": 20},
-            "Sunday": {"drink": "All Drinks", "discount": 10}
-        }
-
-        # Coffee menu with prices and ingredients
-        self.coffee_menu = {
-            "Espresso": {
-                "price": 15,
-                "water": 30,
-                "coffee": 18,
-                "milk": 0,
-                "description": "Strong coffee brewed by forcing hot water through finely-ground coffee beans"
-            },
-            "Americano": {
-                "price": 20,
-                "water": 170,
-                "coffee": 18,
-                "milk": 0,
-                "description": "Espresso diluted with hot water"
-            },
-            "Cappuccino": {
-                "price": 25,
-                "water": 30,
-                "coffee": 18,
-                "milk": 120,
-                "description": "Equal parts espresso, steamed milk, and milk foam"
-            },
-            "Latte": {
-                "price": 25,
-                "water": 30,
-                "coffee": 18,
-                "milk": 150,
-                "description": "Espresso with steamed milk and a small layer of milk foam"
-            },
-            "Mocha": {
-                "price": 30,
-                "water": 30,
-                "coffee": 18,
-                "milk": 150,
-                "description": "Espresso with chocolate, steamed milk and milk foam"
-            }
-        }
-
-        # Size options with price multipliers
-        self.size_options = {
-            "Small": 0.8,
-            "Medium": 1.0,
-            "Large": 1.2
-        }
-
-        # Extra options with prices
-        self.extras = {
-            "Extra Shot": {"price": 5, "coffee": 18},
-            "Caramel Syrup": {"price": 3, "syrup": 30},
-            "Vanilla Syrup": {"price": 3, "syrup": 30},
-            "Chocolate Sauce": {"price": 3, "sauce": 30},
-            "Whipped Cream": {"price": 2, "cream": 30}
-        }
+        self.customer_name = None
+        self.table_number = None
+        self.order_notes = None
+        self.orders_display = None
+        self.special_label = None
+        self.recent_orders = RingBuffer(5000)
+        self.visible_orders = 50
+        self.orders_offset = 0
+        self._rendered_orders = deque()
+        self._next_order_tag = 0
+        self._orders_to_render = 0
 
         # Coffee tips and facts
-        self.coffee_tips = [
-            "☕ Fresh coffee beans produce the best flavor",
-            "🌡️ Ideal water temperature is 90-96°C",
-            "⏰ Espresso should take 20-30 seconds to brew",
-            "🥛 Steam milk between 60-70°C for best results",
-            "✨ Clean your coffee machine regularly",
-            "💡 Store beans in an airtight container",
-            "🌿 Arabica beans are known for their smooth taste",
-            "📝 Try different roast levels to find your preference"
-        ]
+        self.coffee_tips = menu.tips
 
         self.setup_gui()
+        self.view.bind("money", self.render_money)
+        self.view.bind("resources", self.update_resource_bars)
+        self.view.bind("status", self.render_status)
+        self.view.bind("queue", self.update_queue_status)
+        self.view.bind("orders", self.render_new_orders)
+        self.view.mark("resources")
+        self.view.start()
+        self.forecast_timer = self.timeline.every(30, self.view.mark, "resources")
+        self.app.protocol("WM_DELETE_WINDOW", self.close)
         self.start_clock_update()
-        self.start_tip_rotation()
+        self.analytics_timer = self.timeline.every(5, self.post_orders.flush, delay=5)
+        self.post_orders_timer = self.timeline.every(0.1, self.post_orders.poll)
+        self.customers_timer = self.timeline.every(5, self.customers.flush, delay=5)
+        # Edits to the menu file apply without a restart
+        self.menu_watcher = MenuWatcher(self.menu_path, self.reload_menu, self.on_menu_error,
+                                        self.menu_cache)
+        self.menu_timer = self.timeline.every(2, self.menu_watcher.check, delay=2)
+        self.scheduler.start()
+        if self.ingest is not None:
+            self.ingest_timer = self.timeline.every(0.02, self.ingest.drain)
+            # Payments arrive on the server's threads; show them once a second
+            self.ingest_money_timer = self.timeline.every(1, self.view.mark, "money")
         
     def setup_gui(self):
         # Main container
@@ -127,15 +215,47 @@ class ModernCoffeeMachine:
         self.right_panel = ctk.CTkFrame(self.main_frame, width=400)
         self.right_panel.pack(side="right", fill="both", expand=True, padx=10)
 
-        # Create all sections
-        self.create_status_section()
-        self.create_payment_section()
-        self.create_coffee_selection()
-        self.create_size_selection()
-        self.create_extras_selection()
-        self.create_temperature_control()
-        self.create_brew_button()
-        self.create_right_panel_content()
+        # Create the sections needed to take an order right away
+        self.timed_section("create_status_section", self.create_status_section)
+        self.timed_section("create_payment_section", self.create_payment_section)
+        self.timed_section("create_coffee_selection", self.create_coffee_selection)
+        self.timed_section("create_size_selection", self.create_size_selection)
+        self.timed_section("create_extras_selection", self.create_extras_selection)
+        self.timed_section("create_temperature_control", self.create_temperature_control)
+        self.timed_section("create_brew_button", self.create_brew_button)
+        self.timed_section("create_right_panel_content", self.create_right_panel_content)
+        self.first_interaction = time.perf_counter() - self.startup_started
+
+        # Secondary panels are built once the window has been painted
+        self.timeline.call_later(SECONDARY_PANEL_DELAY, self.create_secondary_panels)
+
+    def create_secondary_panels(self):
+        self.timed_section("create_daily_special", self.create_daily_special)
+        self.timed_section("create_order_form", self.create_order_form)
+        self.timed_section("create_tip_section", self.create_tip_section)
+        self.timed_section("create_recent_orders", self.create_recent_orders)
+        self.timed_section("create_report_buttons", self.create_report_buttons)
+        self.timed_section("post-order workers", self.post_orders.start)
+        self.start_tip_rotation()
+        # Customer profiles load in the background, before the first lookup
+        threading.Thread(target=self.customers.preload, name="customers-load",
+                         daemon=True).start()
+        if self.profile_startup:
+            self.print_startup_profile()
+
+    def timed_section(self, name, build):
+        started = time.perf_counter()
+        result = build()
+        self.startup_timings.append((name, time.perf_counter() - started))
+        return result
+
+    def print_startup_profile(self):
+        total = time.perf_counter() - self.startup_started
+        print("Startup profile")
+        for name, seconds in self.startup_timings:
+            print(f"  {name:<30} {seconds * 1000:8.1f} ms")
+        print(f"  {'first interaction':<30} {self.first_interaction * 1000:8.1f} ms")
+        print(f"  {'all panels':<30} {total * 1000:8.1f} ms")
 
     def create_status_section(self):
         status_frame = ctk.CTkFrame(self.left_panel)
@@ -144,7 +264,8 @@ class ModernCoffeeMachine:
         ctk.CTkLabel(status_frame, text="MACHINE STATUS", 
                     font=("Arial", 16, "bold")).pack(pady=5)
 
-        # Resource levels with progress bars
+        # Resource levels with progress bars and time-to-empty forecasts
+        self.forecast_labels = {}
         resources_frame = ctk.CTkFrame(status_frame)
         resources_frame.pack(fill="x", pady=5)
 
@@ -154,10 +275,13 @@ class ModernCoffeeMachine:
         ctk.CTkLabel(water_frame, text="Water Level:").pack(side="left", padx=5)
         self.water_progress = ctk.CTkProgressBar(water_frame)
         self.water_progress.pack(side="left", fill="x", expand=True, padx=5)
-        self.water_progress.set(self.water_level/2000)
+        self.water_progress.set(self.engine.resource_fractions()["Water"])
         ctk.CTkButton(water_frame, text="Refill", 
                      command=lambda: self.refill_resource("Water"),
                      width=60).pack(side="right", padx=5)
+        self.forecast_labels["Water"] = ctk.CTkLabel(water_frame, text="—", width=70,
+                                                     font=("Arial", 10))
+        self.forecast_labels["Water"].pack(side="right")
 
         # Coffee beans level
         coffee_frame = ctk.CTkFrame(resources_frame)
@@ -165,10 +289,13 @@ class ModernCoffeeMachine:
         ctk.CTkLabel(coffee_frame, text="Coffee Beans:").pack(side="left", padx=5)
         self.coffee_progress = ctk.CTkProgressBar(coffee_frame)
         self.coffee_progress.pack(side="left", fill="x", expand=True, padx=5)
-        self.coffee_progress.set(self.coffee_beans/1000)
+        self.coffee_progress.set(self.engine.resource_fractions()["Coffee"])
         ctk.CTkButton(coffee_frame, text="Refill", 
                      command=lambda: self.refill_resource("Coffee"),
                      width=60).pack(side="right", padx=5)
+        self.forecast_labels["Coffee"] = ctk.CTkLabel(coffee_frame, text="—", width=70,
+                                                     font=("Arial", 10))
+        self.forecast_labels["Coffee"].pack(side="right")
 
         # Milk level
         milk_frame = ctk.CTkFrame(resources_frame)
@@ -176,10 +303,13 @@ class ModernCoffeeMachine:
         ctk.CTkLabel(milk_frame, text="Milk Level:").pack(side="left", padx=5)
         self.milk_progress = ctk.CTkProgressBar(milk_frame)
         self.milk_progress.pack(side="left", fill="x", expand=True, padx=5)
-        self.milk_progress.set(self.milk_level/2000)
+        self.milk_progress.set(self.engine.resource_fractions()["Milk"])
         ctk.CTkButton(milk_frame, text="Refill", 
                      command=lambda: self.refill_resource("Milk"),
                      width=60).pack(side="right", padx=5)
+        self.forecast_labels["Milk"] = ctk.CTkLabel(milk_frame, text="—", width=70,
+                                                     font=("Arial", 10))
+        self.forecast_labels["Milk"].pack(side="right")
 
         # Extra ingredients progress bars
         self.resource_bars = {}
@@ -197,10 +327,18 @@ class ModernCoffeeMachine:
             ctk.CTkButton(extra_frame, text="Refill", 
                          command=lambda e=extra: self.refill_resource(e),
                          width=60).pack(side="right", padx=5)
+            self.forecast_labels[extra] = ctk.CTkLabel(extra_frame, text="—", width=70,
+                                                       font=("Arial", 10))
+            self.forecast_labels[extra].pack(side="right")
+
+        # Stockout warnings ahead of time
+        self.forecast_alert_label = ctk.CTkLabel(status_frame, text="",
+                                                 text_color="orange")
+        self.forecast_alert_label.pack()
 
         # Money display
         self.money_label = ctk.CTkLabel(status_frame, 
-                                      text=f"Balance: ${self.money:.2f}",
+                                      text=f"Balance: ${self.engine.money:.2f}",
                                       font=("Arial", 14, "bold"))
         self.money_label.pack(pady=10)
 
@@ -220,57 +358,125 @@ class ModernCoffeeMachine:
                          width=60).pack(side="left", padx=5)
 
     def create_coffee_selection(self):
-        coffee_frame = ctk.CTkFrame(self.left_panel)
-        coffee_frame.pack(fill="x", padx=10, pady=10)
+        self.coffee_frame = ctk.CTkFrame(self.left_panel)
+        self.coffee_frame.pack(fill="x", padx=10, pady=10)
 
-        ctk.CTkLabel(coffee_frame, text="SELECT COFFEE", 
+        ctk.CTkLabel(self.coffee_frame, text="SELECT COFFEE", 
                     font=("Arial", 16, "bold")).pack(pady=5)
 
         self.coffee_var = ctk.StringVar(value="")
+        self.coffee_rows = {}
         for coffee, details in self.coffee_menu.items():
-            coffee_button_frame = ctk.CTkFrame(coffee_frame)
+            self.build_coffee_row(coffee, details)
+
+    def build_coffee_row(self, coffee, details, before=None):
+        coffee_button_frame = ctk.CTkFrame(self.coffee_frame)
+        if before is None:
             coffee_button_frame.pack(fill="x", pady=2)
-            
-            ctk.CTkRadioButton(coffee_button_frame,
-                             text=f"{coffee} (${details['price']:.2f})",
-                             variable=self.coffee_var,
-                             value=coffee).pack(side="left", padx=5)
-            
-            ingredients = f"🚰 {details['water']}ml | ☕ {details['coffee']}g"
-            if details['milk'] > 0:
-                ingredients += f" | 🥛 {details['milk']}ml"
-            
-            ctk.CTkLabel(coffee_button_frame,
-                        text=ingredients,
-                        font=("Arial", 10)).pack(side="right", padx=5)
+        else:
+            coffee_button_frame.pack(fill="x", pady=2, before=before)
+        
+        ctk.CTkRadioButton(coffee_button_frame,
+                         text=f"{coffee} (${details['price']:.2f})",
+                         variable=self.coffee_var,
+                         value=coffee).pack(side="left", padx=5)
+        
+        ingredients = f"🚰 {details['water']}ml | ☕ {details['coffee']}g"
+        if details['milk'] > 0:
+            ingredients += f" | 🥛 {details['milk']}ml"
+        
+        ctk.CTkLabel(coffee_button_frame,
+                    text=ingredients,
+                    font=("Arial", 10)).pack(side="right", padx=5)
+        self.coffee_rows[coffee] = coffee_button_frame
+
     def create_size_selection(self):
-        size_frame = ctk.CTkFrame(self.left_panel)
-        size_frame.pack(fill="x", padx=10, pady=5)
+        self.size_frame = ctk.CTkFrame(self.left_panel)
+        self.size_frame.pack(fill="x", padx=10, pady=5)
         
-        ctk.CTkLabel(size_frame, text="SELECT SIZE", 
+        ctk.CTkLabel(self.size_frame, text="SELECT SIZE", 
                     font=("Arial", 16, "bold")).pack()
         
         self.size_var = ctk.StringVar(value="Medium")
+        self.size_rows = []
+        self.build_size_rows()
+
+    def build_size_rows(self):
+        for row in self.size_rows:
+            row.destroy()
+        self.size_rows = []
         for size, multiplier in self.size_options.items():
-            ctk.CTkRadioButton(size_frame, 
-                             text=f"{size} (x{multiplier})",
-                             variable=self.size_var,
-                             value=size).pack(pady=2)
+            row = ctk.CTkRadioButton(self.size_frame, 
+                                   text=f"{size} (x{multiplier})",
+                                   variable=self.size_var,
+                                   value=size)
+            row.pack(pady=2)
+            self.size_rows.append(row)
 
     def create_extras_selection(self):
-        extras_frame = ctk.CTkFrame(self.left_panel)
-        extras_frame.pack(fill="x", padx=10, pady=5)
+        self.extras_frame = ctk.CTkFrame(self.left_panel)
+        self.extras_frame.pack(fill="x", padx=10, pady=5)
         
-        ctk.CTkLabel(extras_frame, text="EXTRAS", 
+        ctk.CTkLabel(self.extras_frame, text="EXTRAS", 
                     font=("Arial", 16, "bold")).pack()
         
         self.extra_vars = {}
+        self.extra_rows = {}
         for extra, details in self.extras.items():
-            var = ctk.BooleanVar()
-            self.extra_vars[extra] = var
-            ctk.CTkCheckBox(extras_frame, 
-                          text=f"{extra} (+${details['price']:.2f})",
-                          variable=var).pack(pady=2)
+            self.build_extra_row(extra, details)
+
+    def build_extra_row(self, extra, details):
+        var = self.extra_vars.get(extra) or ctk.BooleanVar()
+        self.extra_vars[extra] = var
+        row = ctk.CTkCheckBox(self.extras_frame, 
+                            text=f"{extra} (+${details['price']:.2f})",
+                            variable=var)
+        row.pack(pady=2)
+        self.extra_rows[extra] = row
+
+    def reload_menu(self, menu):
+        # Menu file changed: update the engine, then rebuild only the rows
+        # that differ
+        changes = self.engine.apply_menu(menu)
+        self.load_store_promotions()
+        self.coffee_tips = menu.tips
+
+        for coffee in changes["removed"]:
+            self.coffee_rows.pop(coffee).destroy()
+            if self.coffee_var.get() == coffee:
+                self.coffee_var.set("")
+        for coffee in changes["changed"]:
+            old_row = self.coffee_rows[coffee]
+            self.build_coffee_row(coffee, self.coffee_menu[coffee], before=old_row)
+            old_row.destroy()
+        for coffee in changes["added"]:
+            self.build_coffee_row(coffee, self.coffee_menu[coffee])
+
+        if changes["sizes"]:
+            self.build_size_rows()
+            if self.size_var.get() not in self.size_options:
+                self.size_var.set(next(iter(self.size_options)))
+        if changes["extras"]:
+            # Rows are rebuilt in menu order; ticked extras stay ticked
+            for extra, row in list(self.extra_rows.items()):
+                row.destroy()
+            self.extra_rows = {}
+            self.extra_vars = {extra: var for extra, var in self.extra_vars.items()
+                               if extra in self.extras}
+            for extra, details in self.extras.items():
+                self.build_extra_row(extra, details)
+
+        if self.special_label is not None:
+            self.update_daily_special()
+        self.set_status("📋 Menu updated")
+
+    def on_menu_error(self, error):
+        self.show_warning(f"⚠️ Menu file not loaded, keeping the current menu:\n{error}")
+
+    def load_store_promotions(self):
+        # Promotion rules from data/promotions.json replace the menu's
+        if os.path.exists(self.promotions_path):
+            self.engine.set_promotions(load_promotions(self.promotions_path))
 
     def create_temperature_control(self):
         temp_frame = ctk.CTkFrame(self.left_panel)
@@ -313,14 +519,26 @@ class ModernCoffeeMachine:
                                     font=("Arial", 20, "bold"))
         self.status_label.pack(pady=10)
 
+        # Brew queue
+        self.queue_label = ctk.CTkLabel(self.right_panel,
+                                    text="Queue: 0 | Brewing: 0",
+                                    font=("Arial", 12))
+        self.queue_label.pack(pady=2)
+
+    def create_daily_special(self):
         # Daily Special
         special_frame = ctk.CTkFrame(self.right_panel)
         special_frame.pack(fill="x", pady=10, padx=10)
         ctk.CTkLabel(special_frame, 
                     text="TODAY'S SPECIAL ⭐",
                     font=("Arial", 16, "bold")).pack(pady=5)
+        self.special_label = ctk.CTkLabel(self.right_panel, text="", font=("Arial", 14))
+        self.special_label.pack(pady=5)
         self.update_daily_special()
+        # Happy hours start and end during the day
+        self.special_timer = self.timeline.every(60, self.update_daily_special, delay=60)
 
+    def create_order_form(self):
         # Order Form
         order_frame = ctk.CTkFrame(self.right_panel)
         order_frame.pack(fill="x", pady=10, padx=10)
@@ -333,6 +551,20 @@ class ModernCoffeeMachine:
         ctk.CTkLabel(name_frame, text="Name:").pack(side="left", padx=5)
         self.customer_name = ctk.CTkEntry(name_frame)
         self.customer_name.pack(side="left", fill="x", expand=True, padx=5)
+        self.customer_name.bind("<KeyRelease>", self.on_customer_typed)
+
+        # Known customers matching the typed name, and the selected profile
+        self.suggestion_frame = ctk.CTkFrame(order_frame, fg_color="transparent")
+        self.suggestion_frame.pack(fill="x")
+        self.suggestion_buttons = []
+        self.customer_info = ctk.CTkLabel(order_frame, text="", font=("Arial", 12))
+        self.customer_info.pack(fill="x", padx=5)
+        self.repeat_button = ctk.CTkButton(order_frame,
+                                           text="Repeat Last Order 🔁",
+                                           command=self.repeat_last_order,
+                                           state="disabled",
+                                           height=28)
+        self.repeat_button.pack(pady=2)
 
         # Table Number
         table_frame = ctk.CTkFrame(order_frame)
@@ -340,6 +572,10 @@ class ModernCoffeeMachine:
         ctk.CTkLabel(table_frame, text="Table #:").pack(side="left", padx=5)
         self.table_number = ctk.CTkEntry(table_frame)
         self.table_number.pack(side="left", fill="x", expand=True, padx=5)
+        ctk.CTkButton(table_frame, text="Settle", width=60,
+                      command=self.settle_tab).pack(side="right", padx=5)
+        ctk.CTkButton(table_frame, text="Open Tab", width=70,
+                      command=self.open_tab).pack(side="right")
 
         # Notes
         notes_frame = ctk.CTkFrame(order_frame)
@@ -355,6 +591,7 @@ class ModernCoffeeMachine:
                     height=30,
                     font=("Arial", 14, "bold")).pack(pady=10)
 
+    def create_tip_section(self):
         # Coffee Tip of the Day
         tip_frame = ctk.CTkFrame(self.right_panel)
         tip_frame.pack(fill="x", pady=10, padx=10)
@@ -366,6 +603,7 @@ class ModernCoffeeMachine:
                                     wraplength=350)
         self.tip_label.pack(pady=5)
 
+    def create_recent_orders(self):
         # Recent Orders
         orders_frame = ctk.CTkFrame(self.right_panel)
         orders_frame.pack(fill="x", pady=10, padx=10)
@@ -374,18 +612,67 @@ class ModernCoffeeMachine:
                     font=("Arial", 16, "bold")).pack(pady=5)
         self.orders_display = ctk.CTkTextbox(orders_frame, height=200)
         self.orders_display.pack(fill="x", pady=5)
+
+        # Only one page of the history is rendered at a time
+        orders_nav = ctk.CTkFrame(orders_frame)
+        orders_nav.pack(fill="x", pady=2)
+        ctk.CTkButton(orders_nav, text="◀ Newer",
+                     command=lambda: self.page_recent_orders(-1),
+                     width=80).pack(side="left", padx=5)
+        ctk.CTkButton(orders_nav, text="Older ▶",
+                     command=lambda: self.page_recent_orders(1),
+                     width=80).pack(side="right", padx=5)
+        self.orders_page_label = ctk.CTkLabel(orders_nav, text="", font=("Arial", 10))
+        self.orders_page_label.pack(expand=True)
+
+        # Orders recovered from the journal go behind any taken since startup
+        newer = [self.recent_orders[index] for index in range(len(self.recent_orders))]
+        self.recent_orders.clear()
+        for event in self.recovered_orders:
+            self.recent_orders.append(OrderRecord.from_order(
+                self.order_from_event(event), datetime.fromtimestamp(event["ts"]),
+                event["price"]))
+        for record in newer:
+            self.recent_orders.append(record)
+        self.recovered_orders = []
+        self.render_orders_page()
+
+    def create_report_buttons(self):
+        # Sales Report
+        ctk.CTkButton(self.right_panel,
+                    text="SALES REPORT 📈",
+                    command=self.show_sales_report,
+                    height=30,
+                    font=("Arial", 14, "bold")).pack(pady=10)
+
+        # Diagnostics, only when metrics are collected
+        if self.metrics.enabled:
+            ctk.CTkButton(self.right_panel,
+                        text="DIAGNOSTICS 🩺",
+                        command=self.show_diagnostics,
+                        height=30,
+                        font=("Arial", 14, "bold")).pack(pady=5)
+
+        # Fleet totals, only when running next to other machines
+        if self.fleet is not None:
+            ctk.CTkButton(self.right_panel,
+                        text="FLEET 🏭",
+                        command=self.show_fleet_report,
+                        height=30,
+                        font=("Arial", 14, "bold")).pack(pady=5)
         
     def place_order(self):
-        if not self.coffee_var.get():
-            self.show_warning("⚠️ Please select a coffee!")
-            return
-        
-        if not self.customer_name.get():
-            self.show_warning("⚠️ Please enter customer name!")
-            return
-        
-        if not self.table_number.get():
-            self.show_warning("⚠️ Please enter table number!")
+        with self.metrics.span("order_phase_seconds", phase="place_order_validation"):
+            if not self.coffee_var.get():
+                error = "⚠️ Please select a coffee!"
+            elif not self.customer_name.get():
+                error = "⚠️ Please enter customer name!"
+            elif not self.table_number.get():
+                error = "⚠️ Please enter table number!"
+            else:
+                error = ""
+        if error:
+            self.show_warning(error)
             return
         
         # Start brewing process
@@ -395,223 +682,398 @@ class ModernCoffeeMachine:
         self.customer_name.delete(0, 'end')
         self.table_number.delete(0, 'end')
         self.order_notes.delete('1.0', 'end')
+        self.on_customer_typed()
+
+    def on_customer_typed(self, event=None):
+        # Prefix search over known customers as the name is typed
+        text = self.customer_name.get()
+        for button in self.suggestion_buttons:
+            button.destroy()
+        matches = self.customers.search(text, limit=5)
+        profile = self.customers.get(text) if text.strip() else None
+        if profile is not None and len(matches) == 1:
+            matches = []
+        self.suggestion_buttons = [
+            ctk.CTkButton(self.suggestion_frame, text=match.name, height=24, width=80,
+                          fg_color="gray30", command=lambda m=match: self.select_customer(m))
+            for match in matches]
+        for button in self.suggestion_buttons:
+            button.pack(side="left", padx=2, pady=2)
+        self.show_customer(profile)
+
+    def select_customer(self, profile):
+        self.customer_name.delete(0, 'end')
+        self.customer_name.insert(0, profile.name)
+        self.on_customer_typed()
+
+    def show_customer(self, profile):
+        if profile is None:
+            self.customer_info.configure(text="")
+            self.repeat_button.configure(state="disabled")
+            return
+        text = f"⭐ {profile.points} points | {profile.orders} orders"
+        favorite = profile.favorite()
+        if favorite is not None:
+            coffee, size, extras = favorite
+            text += f"\nFavorite: {size} {coffee}" + (f" + {', '.join(extras)}" if extras else "")
+        self.customer_info.configure(text=text)
+        self.repeat_button.configure(state="normal" if profile.last_order else "disabled")
+
+    def repeat_last_order(self):
+        # One tap: load the customer's last order into the form and brew it
+        profile = self.customers.get(self.customer_name.get())
+        if profile is None or not profile.last_order:
+            return
+        last = profile.last_order
+        if last["coffee"] not in self.coffee_menu:
+            self.show_warning(f"⚠️ {last['coffee']} is no longer on the menu")
+            return
+        self.coffee_var.set(last["coffee"])
+        self.size_var.set(last["size"])
+        for extra, var in self.extra_vars.items():
+            var.set(extra in last["extras"])
+        self.temp_slider.set(last["temperature"])
+        self.update_temperature(last["temperature"])
+        self.start_brewing()
         
-    def add_to_recent_orders(self, coffee_type, size, extras):
-        # Get current time
-        current_time = datetime.now().strftime("%H:%M:%S")
-        
-        # Get customer details
-        customer = self.customer_name.get()
-        table = self.table_number.get()
-        notes = self.order_notes.get("1.0", "end-1c")
-        
+    def add_to_recent_orders(self, order, when=None, price=0.0):
+        with self.metrics.span("order_phase_seconds", phase="add_to_recent_orders"):
+            self._add_to_recent_orders(order, when, price)
+
+    def _add_to_recent_orders(self, order, when, price):
+        record = OrderRecord.from_order(order, when, price)
+        self.recent_orders.append(record)
+
+        if self.orders_display is None:
+            # Panel not built yet; it renders the buffer when created
+            return
+        if self.orders_offset:
+            # Browsing older pages: keep showing the same orders
+            self.orders_offset = min(self.orders_offset + 1, len(self.recent_orders) - 1)
+        else:
+            self._orders_to_render += 1
+        self.view.mark("orders")
+
+    def render_new_orders(self):
+        # Insert only the entries added since the last frame and trim the oldest
+        pending = min(self._orders_to_render, len(self.recent_orders))
+        self._orders_to_render = 0
+        if pending >= self.visible_orders:
+            self.render_orders_page()
+            return
+        for record in reversed(self.recent_orders.newest(pending)):
+            self.render_order_entry(record)
+        while len(self._rendered_orders) > self.visible_orders:
+            self.remove_order_entry(self._rendered_orders.pop())
+        self.update_orders_page_label()
+
+    def format_order(self, record):
         # Create order details string
+        current_time = datetime.fromtimestamp(record.timestamp).strftime("%H:%M:%S")
         order_details = f"Time: {current_time}\n"
-        order_details += f"Customer: {customer}\n"
-        order_details += f"Table: {table}\n"
-        order_details += f"Coffee: {coffee_type}\n"
-        order_details += f"Size: {size}\n"
+        order_details += f"Customer: {record.customer}\n"
+        order_details += f"Table: {record.table}\n"
+        order_details += f"Coffee: {record.coffee_type}\n"
+        order_details += f"Size: {record.size}\n"
         
         # Add selected extras
-        selected_extras = [extra for extra, var in extras.items() if var.get()]
-        if selected_extras:
-            order_details += f"Extras: {', '.join(selected_extras)}\n"
+        if record.extras:
+            order_details += f"Extras: {', '.join(record.extras)}\n"
         
         # Add notes if any
-        if notes.strip():
-            order_details += f"Notes: {notes}\n"
+        if record.notes.strip():
+            order_details += f"Notes: {record.notes}\n"
         
         order_details += "-" * 30 + "\n"
-        
-        # Add to recent orders list
-        self.recent_orders.append(order_details)
-        
-        # Keep only the last 5 orders
-        if len(self.recent_orders) > self.max_recent_orders:
-            self.recent_orders.pop(0)
-        
-        # Update orders display
+        return order_details
+
+    def render_order_entry(self, record):
+        # Newest entries go on top; each entry is tagged so it can be removed
+        tag = f"order{self._next_order_tag}"
+        self._next_order_tag += 1
+        self.orders_display.insert("1.0", self.format_order(record), tag)
+        self._rendered_orders.appendleft(tag)
+
+    def remove_order_entry(self, tag):
+        ranges = self.orders_display.tag_ranges(tag)
+        if ranges:
+            self.orders_display.delete(ranges[0], ranges[-1])
+        self.orders_display.tag_delete(tag)
+
+    def render_orders_page(self):
+        self._orders_to_render = 0
+        while self._rendered_orders:
+            self.orders_display.tag_delete(self._rendered_orders.pop())
         self.orders_display.delete("1.0", "end")
-        for order in reversed(self.recent_orders):
-            self.orders_display.insert("1.0", order)
+        page = self.recent_orders.newest(self.visible_orders, self.orders_offset)
+        for record in reversed(page):
+            self.render_order_entry(record)
+        self.update_orders_page_label()
+
+    def page_recent_orders(self, direction):
+        offset = self.orders_offset + direction * self.visible_orders
+        offset = max(0, min(offset, len(self.recent_orders) - 1))
+        if offset != self.orders_offset:
+            self.orders_offset = offset
+            self.render_orders_page()
+
+    def update_orders_page_label(self):
+        total = len(self.recent_orders)
+        first = min(total, self.orders_offset + 1)
+        last = min(total, self.orders_offset + self.visible_orders)
+        self.orders_page_label.configure(text=f"{first}-{last} of {total}")
             
-    def check_resources(self, coffee_type, size_multiplier):
-        insufficient = []
-        coffee_details = self.coffee_menu[coffee_type]
-        
-        # Check basic resources
-        if self.water_level < coffee_details['water'] * size_multiplier:
-            insufficient.append('water')
-        if self.coffee_beans < coffee_details['coffee'] * size_multiplier:
-            insufficient.append('coffee beans')
-        if coffee_details['milk'] > 0 and self.milk_level < coffee_details['milk'] * size_multiplier:
-            insufficient.append('milk')
-        
-        # Check extras
-        for extra, var in self.extra_vars.items():
-            if var.get():
-                if extra == "Extra Shot" and self.coffee_beans < self.extras[extra]["coffee"]:
-                    insufficient.append('coffee beans')
-                elif "syrup" in self.extras[extra]:
-                    syrup_name = extra.lower().replace(" ", "_")
-                    if getattr(self, syrup_name) < self.extras[extra]["syrup"]:
-                        insufficient.append(extra)
-        
-        return insufficient
+    def update_resource_bars(self):
+        levels = self.engine.resource_fractions()
+        self.water_progress.set(levels["Water"])
+        self.coffee_progress.set(levels["Coffee"])
+        self.milk_progress.set(levels["Milk"])
+        for extra, progress in self.resource_bars.items():
+            progress.set(levels[extra])
+        self.update_forecast()
 
-    def update_resources(self, coffee_type):
-        size_multiplier = self.size_options[self.size_var.get()]
-        coffee_details = self.coffee_menu[coffee_type]
-        
-        # Update basic resources
-        self.water_level -= coffee_details['water'] * size_multiplier
-        self.coffee_beans -= coffee_details['coffee'] * size_multiplier
-        if coffee_details['milk'] > 0:
-            self.milk_level -= coffee_details['milk'] * size_multiplier
-        
-        # Update progress bars
-        self.water_progress.set(self.water_level/2000)
-        self.coffee_progress.set(self.coffee_beans/1000)
-        self.milk_progress.set(self.milk_level/2000)
-        
-        # Update extras
-        for extra, var in self.extra_vars.items():
-            if var.get():
-                if extra == "Extra Shot":
-                    self.coffee_beans -= self.extras[extra]["coffee"]
-                    self.coffee_progress.set(self.coffee_beans/1000)
-                elif "syrup" in self.extras[extra]:
-                    syrup_name = extra.lower().replace(" ", "_")
-                    current_amount = getattr(self, syrup_name)
-                    setattr(self, syrup_name, current_amount - self.extras[extra]["syrup"])
-                    self.resource_bars[extra].set(getattr(self, syrup_name)/1000)
+    def update_forecast(self):
+        now = time.time()
+        forecast = self.forecaster.forecast(now)
+        for name, label in self.forecast_labels.items():
+            label.configure(text=format_duration(forecast[name]))
+
+        soon = [f"{name} {format_duration(seconds)}"
+                for name, seconds in forecast.items()
+                if seconds is not None and seconds <= self.forecaster.alert_horizon]
+        self.forecast_alert_label.configure(
+            text=f"⚠️ Running out: {', '.join(soon)}" if soon else "")
+        for name, seconds in self.forecaster.new_alerts(forecast):
+            self.show_warning(f"⚠️ {name} will run out in {format_duration(seconds)}. Please refill!")
+
+    def render_money(self):
+        text = f"Balance: ${self.engine.money:.2f}"
+        tabs = self.engine.ledger.tabs()
+        if tabs:
+            owed = -sum(balance for balance, _ in tabs.values()) / 100
+            text += f"  |  {len(tabs)} open tab(s): ${owed:.2f}"
+        self.money_label.configure(text=text)
+
+    def render_status(self):
+        self.status_label.configure(text=self.status_text)
+
+    def set_status(self, text):
+        self.status_text = text
+        self.view.mark("status")
 
     def refill_resource(self, resource):
-        if resource == "Water":
-            self.water_level = 2000
-            self.water_progress.set(1.0)
-        elif resource == "Coffee":
-            self.coffee_beans = 1000
-            self.coffee_progress.set(1.0)
-        elif resource == "Milk":
-            self.milk_level = 2000
-            self.milk_progress.set(1.0)
-        else:
-            # Handle extra ingredients
-            resource_var = resource.lower().replace(" ", "_")
-            setattr(self, resource_var, 1000)
-            self.resource_bars[resource].set(1.0)
+        self.engine.refill_resource(resource)
+        self.view.mark("resources")
+
     def start_clock_update(self):
         def update_clock():
-            while True:
-                current_time = datetime.now().strftime("%H:%M:%S")
-                self.clock_label.configure(text=current_time)
-                time.sleep(1)
+            current_time = datetime.now().strftime("%H:%M:%S")
+            self.clock_label.configure(text=current_time)
         
-        clock_thread = threading.Thread(target=update_clock, daemon=True)
-        clock_thread.start()
+        self.clock_timer = self.timeline.every(1, update_clock)
 
     def start_tip_rotation(self):
+        tip_index = 0
+
         def rotate_tips():
-            tip_index = 0
-            while True:
-                self.tip_label.configure(text=self.coffee_tips[tip_index])
-                tip_index = (tip_index + 1) % len(self.coffee_tips)
-                time.sleep(10)
+            nonlocal tip_index
+            if not self.coffee_tips:
+                return
+            # The tip list can change length when the menu is reloaded
+            tip_index %= len(self.coffee_tips)
+            self.tip_label.configure(text=self.coffee_tips[tip_index])
+            tip_index = (tip_index + 1) % len(self.coffee_tips)
         
-        tip_thread = threading.Thread(target=rotate_tips, daemon=True)
-        tip_thread.start()
+        self.tip_timer = self.timeline.every(10, rotate_tips)
 
     def update_daily_special(self):
-        day = datetime.now().strftime("%A")
-        special = self.daily_specials[day]
-        special_text = f"{special['drink']}\n{special['discount']}% OFF TODAY!"
-        
-        special_label = ctk.CTkLabel(self.right_panel,
-                                   text=special_text,
-                                   font=("Arial", 14))
-        special_label.pack(pady=5)
+        active = self.engine.promotions.active_now()
+        special_text = "\n".join(promotion.label() for promotion in active)
+        self.special_label.configure(text=special_text or "No specials right now")
 
     def update_temperature(self, value):
         self.temperature = int(value)
         self.temp_label.configure(text=f"{self.temperature}°C")
 
     def add_money(self, amount):
-        self.money += amount
-        self.money_label.configure(text=f"Balance: ${self.money:.2f}")
+        self.engine.add_money(amount)
+        self.view.mark("money")
 
-    def start_brewing(self):
-        if self.is_brewing:
-            self.show_warning("⚠️ Coffee is being prepared, please wait!")
+    def current_table(self):
+        return self.table_number.get().strip() if self.table_number else ""
+
+    def open_tab(self):
+        # Orders for this table are charged to the tab until it is settled
+        table = self.current_table()
+        if not table:
+            self.show_warning("⚠️ Enter a table number to open a tab")
             return
+        self.engine.open_tab(table)
+        self.set_status(f"Tab opened for table {table} 🧾")
+        self.view.mark("money")
 
-        selected_coffee = self.coffee_var.get()
-        if not selected_coffee:
-            self.show_warning("⚠️ Please select a coffee!")
+    def settle_tab(self):
+        table = self.current_table()
+        paid = self.engine.settle_tab(table) if table else None
+        if paid is None:
+            self.show_warning(f"⚠️ No open tab for table {table or '?'}")
             return
+        if paid >= 0:
+            self.set_status(f"Table {table} paid ${paid:.2f} ✔")
+        else:
+            self.set_status(f"Table {table} gets ${-paid:.2f} back")
+        self.view.mark("money")
 
-        total_price = self.calculate_price()
-        
-        # Apply daily special discount
-        day = datetime.now().strftime("%A")
-        special = self.daily_specials[day]
-        if selected_coffee == special["drink"] or special["drink"] == "All Drinks":
-            discount = special["discount"] / 100
-            total_price = total_price * (1 - discount)
-
-        if self.money < total_price:
-            self.show_warning("⚠️ Insufficient balance!")
+    def current_order(self):
+        # Build an order from the current form state
+        return Order(
+            coffee_type=self.coffee_var.get(),
+            size=self.size_var.get(),
+            extras=[extra for extra, var in self.extra_vars.items() if var.get()],
+            customer=self.customer_name.get() if self.customer_name else "",
+            table=self.table_number.get() if self.table_number else "",
+            notes=self.order_notes.get("1.0", "end-1c") if self.order_notes else "",
+            temperature=self.temperature
+        )
+
+    def start_brewing(self):
+        if self.fleet is not None and self.send_to_fleet(self.current_order()):
             return
 
-        # Resource check
-        insufficient = self.check_resources(selected_coffee, 
-                                         self.size_options[self.size_var.get()])
-        if insufficient:
-            self.show_warning(f"⚠️ Insufficient {', '.join(insufficient)}!")
+        if self.scheduler.is_full():
+            self.show_warning("⚠️ Brew queue is full, please wait!")
             return
 
-        # Start brewing process
-        self.is_brewing = True
-        self.money -= total_price
-        self.total_sales += total_price
-        self.drinks_sold[selected_coffee] = self.drinks_sold.get(selected_coffee, 0) + 1
-        
+        order = self.current_order()
+        result = self.engine.process_order(order)
+        if not result.ok:
+            self.show_warning(result.error)
+            return
+
+        # Queue the drink on the next free brew station
+        job = self.brew_coffee(result)
+
         # Update displays
-        self.money_label.configure(text=f"Balance: ${self.money:.2f}")
-        self.update_resources(selected_coffee)
+        self.view.mark("money", "resources")
         
         # Add to recent orders
-        self.add_to_recent_orders(
-            coffee_type=selected_coffee,
-            size=self.size_var.get(),
-            extras=self.extra_vars
-        )
-        
-        # Start brewing thread
-        brewing_thread = threading.Thread(target=lambda: self.brew_coffee(selected_coffee))
-        brewing_thread.start()
-
-    def brew_coffee(self, coffee_type):
-        steps = [
-            ("☕ Starting to prepare your coffee...", 1),
-            ("⚙️ Grinding coffee beans...", 2),
-            (f"🌡️ Heating water to {self.temperature}°C...", 2),
-            ("⏳ Preparing espresso...", 2),
-            ("🥛 Heating milk..." if self.coffee_menu[coffee_type]["milk"] > 0 else None, 2),
-            ("🌪️ Frothing milk..." if self.coffee_menu[coffee_type]["milk"] > 0 else None, 2),
-            (f"👨‍🍳 Preparing {coffee_type}...", 2),
-            ("🍯 Adding extras..." if any(var.get() for var in self.extra_vars.values()) else None, 1),
-            ("✨ Your coffee is ready! Enjoy!", 2)
-        ]
-
-        steps = [(step, duration) for step, duration in steps if step is not None]
-
-        for step, duration in steps:
-            self.status_label.configure(text=step)
-            time.sleep(duration)
-
-        self.is_brewing = False
-        self.status_label.configure(text="Coffee Machine Ready ☕")
+        if job is not None:
+            self.add_to_recent_orders(order, price=result.price)
+
+    def register_with_fleet(self):
+        # True once the coordinator knows this machine; stops the retry timer
+        from fleet import CoordinatorUnavailable
+        try:
+            self.fleet.register(self.fleet_node)
+        except CoordinatorUnavailable:
+            return False
+        if self.fleet_timer is not None:
+            self.fleet_timer.cancel()
+            self.fleet_timer = None
+        return True
+
+    def send_to_fleet(self, order):
+        # Pay here, brew on whichever machine the coordinator picks. Returns
+        # False when the order should be served locally instead.
+        from fleet import CoordinatorUnavailable
+        error = self.engine.validate(order)
+        if error:
+            self.show_warning(error)
+            return True
+        price, _ = self.engine.quote(order)
+        if not self.engine.take_payment(price, table=order.table):
+            self.show_warning("⚠️ Insufficient balance!")
+            return True
+
+        try:
+            machine, result = self.fleet.submit(order)
+        except CoordinatorUnavailable:
+            # Coordinator is down: refund and serve from local state
+            self.engine.add_money(price, table=order.table)
+            return False
+
+        if result is None:
+            self.engine.add_money(price, table=order.table)
+            self.show_warning("⚠️ No machine in the fleet can make this order right now")
+        elif machine != self.name:
+            self.set_status(f"Order sent to {machine} 🚚")
+        self.view.mark("money")
+        return True
+
+    def accept_fleet_order(self, order):
+        # Order routed here by the fleet coordinator, paid on the machine
+        # that took it
+        try:
+            result, _ = self.accept_order(order, prepaid=True)
+        except QueueFullError:
+            return None
+        return result
+
+    def accept_order(self, order, prepaid=False):
+        # Order from a tablet or the POS (charged to the table's tab or the
+        # walk-in balance, topped up through POST /payments) or from the
+        # fleet (prepaid): reserve stock and queue the brew. Raises
+        # QueueFullError when the queue is full.
+        result = self.engine.process_order(order, prepaid=prepaid)
+        if not result.ok:
+            return result, None
+        try:
+            job = self.scheduler.submit(order)
+        except QueueFullError:
+            self.engine.cancel_order(result)
+            raise
+        self.brewing_orders[job.job_id] = result
+        self.view.mark("money", "resources", "queue")
+        self.add_to_recent_orders(order, price=result.price)
+        return result, job
+
+    def brew_coffee(self, result):
+        try:
+            job = self.scheduler.submit(result.order)
+        except QueueFullError as error:
+            self.engine.cancel_order(result)
+            self.show_warning(f"⚠️ {error}")
+            return None
+
+        self.brewing_orders[job.job_id] = result
+        self.view.mark("queue")
+        return job
+
+    def on_post_order_result(self, event_type, result, points):
+        # Brewed orders count towards the customer's profile once the
+        # worker has booked them
+        if event_type == "complete":
+            self.customers.record_order(result.order, result.price,
+                                        result.timestamp.timestamp(), points)
+
+    def on_brew_step(self, job, step):
+        self.set_status(step)
+        self.view.mark("queue")
+
+    def on_brew_done(self, job):
+        result = self.brewing_orders.pop(job.job_id)
+        if job.status == "done":
+            self.engine.complete_order(result)
+        else:
+            message = f"⚠️ {job.order.coffee_type} could not be brewed"
+            if self.engine.cancel_order(result):
+                # A prepaid order was routed here and paid at another machine,
+                # which the fleet coordinator refunds
+                message += (", the machine that took the payment refunds it"
+                            if result.prepaid else " and was refunded")
+            self.view.mark("money")
+            self.show_warning(message)
+        self.view.mark("resources", "queue")
+
+        if not self.scheduler.in_progress() and not self.scheduler.queue_depth():
+            self.set_status("Coffee Machine Ready ☕")
+
+    def update_queue_status(self):
+        etas = self.scheduler.etas()
+        text = f"Queue: {self.scheduler.queue_depth()} | Brewing: {self.scheduler.in_progress()}"
+        if etas:
+            text += f" | All ready in {max(etas.values()):.0f}s"
+        self.queue_label.configure(text=text)
 
     def show_warning(self, message):
         warning_window = ctk.CTkToplevel(self.app)
@@ -626,16 +1088,205 @@ class ModernCoffeeMachine:
         if not self.coffee_var.get():
             return 0
         
-        base_price = self.coffee_menu[self.coffee_var.get()]["price"]
-        size_multiplier = self.size_options[self.size_var.get()]
-        extras_price = sum(self.extras[extra]["price"] 
-                         for extra, var in self.extra_vars.items() if var.get())
-        
-        return (base_price * size_multiplier) + extras_price
+        return self.engine.calculate_price(self.current_order())
+
+    def order_from_event(self, event):
+        return Order(event["coffee"], event["size"], event["extras"],
+                     customer=event["customer"], table=event["table"],
+                     notes=event["notes"])
+
+    def show_sales_report(self):
+        report_window = ctk.CTkToplevel(self.app)
+        report_window.title("Sales Report")
+        report_window.geometry("420x520")
+
+        report = ctk.CTkTextbox(report_window)
+        report.pack(fill="both", expand=True, padx=10, pady=10)
+        report.insert("1.0", self.format_sales_report())
+        report.configure(state="disabled")
+
+        # Reconciling fsyncs the journal and replays it, so it runs on its
+        # own thread; the timer shows the outcome once it is there
+        outcome = []
+        threading.Thread(target=lambda: outcome.append(self.format_reconciliation()),
+                         name="reconcile", daemon=True).start()
+
+        def show_reconciliation():
+            if not report_window.winfo_exists():
+                timer.cancel()
+                return
+            if not outcome:
+                return
+            timer.cancel()
+            report.configure(state="normal")
+            report.insert("end", "\n" + outcome[0])
+            report.configure(state="disabled")
+
+        timer = self.timeline.every(0.1, show_reconciliation)
+
+    def format_sales_report(self):
+        today = self.analytics.today()
+        lines = ["TODAY",
+                 f"Orders: {today['orders']}",
+                 f"Revenue: ${today['revenue']:.2f}",
+                 f"Average ticket: ${today['average_ticket']:.2f}",
+                 f"Discounts given: ${today['discount_cost']:.2f}",
+                 "",
+                 "DRINK MIX"]
+        for drink, count in sorted(today["drink_mix"].items(), key=lambda item: -item[1]):
+            lines.append(f"{drink}: {count}")
+        lines += ["", "EXTRAS ATTACH RATE"]
+        for extra, rate in sorted(today["extras_attach_rate"].items()):
+            lines.append(f"{extra}: {rate:.0%}")
+        lines += ["", "LAST 24 HOURS"]
+        for hour_start, summary in self.analytics.hourly_report(24):
+            hour = datetime.fromtimestamp(hour_start).strftime("%d.%m %H:00")
+            lines.append(f"{hour}  {summary['orders']:>4} orders  ${summary['revenue']:.2f}")
+        lines += ["", "LAST 7 DAYS"]
+        for day, summary in self.analytics.daily_report(7):
+            lines.append(f"{day:%d.%m.%Y}  {summary['orders']:>4} orders  ${summary['revenue']:.2f}")
+        lines += ["", "LEDGER",
+                  f"Total sales: ${self.engine.total_sales:.2f}"]
+        for account, (balance, limit) in sorted(self.engine.ledger.tabs().items()):
+            lines.append(f"Tab {account.split(':', 1)[1]}: ${-balance / 100:.2f} owed "
+                         f"(limit ${limit / 100:.2f})")
+        return "\n".join(lines)
+
+    def format_reconciliation(self):
+        # Runs off the Tk thread
+        try:
+            differences = self.engine.reconcile()
+        except RuntimeError as error:
+            return f"⚠️ Journal not reconciled: {error}"
+        if not differences:
+            return "Journal reconciled to the cent ✔"
+        lines = ["⚠️ Journal does not match the ledger:"]
+        lines += [f"{what}: live {live} / journal {journal}"
+                  for what, live, journal in differences]
+        return "\n".join(lines)
+
+    def show_diagnostics(self):
+        diagnostics_window = ctk.CTkToplevel(self.app)
+        diagnostics_window.title("Diagnostics")
+        diagnostics_window.geometry("520x480")
+
+        panel = ctk.CTkTextbox(diagnostics_window, font=("Courier", 12))
+        panel.pack(fill="both", expand=True, padx=10, pady=10)
+        last_orders = [self.count_orders(), time.monotonic()]
+
+        def refresh():
+            if not diagnostics_window.winfo_exists():
+                timer.cancel()
+                return
+            # Orders per second since the previous refresh
+            orders, now = self.count_orders(), time.monotonic()
+            rate = (orders - last_orders[0]) / max(now - last_orders[1], 1e-6)
+            last_orders[:] = [orders, now]
+
+            snapshot = self.metrics.snapshot()
+            lines = [f"orders/sec: {rate:.2f}", ""]
+            for counter in sorted(snapshot["counters"], key=lambda c: c["name"]):
+                labels = ",".join(f"{k}={v}" for k, v in counter["labels"].items())
+                lines.append(f"{counter['name']}[{labels}] = {counter['value']}")
+            lines.append("")
+            for histogram in sorted(snapshot["histograms"], key=lambda h: h["name"]):
+                labels = ",".join(f"{k}={v}" for k, v in histogram["labels"].items())
+                average = histogram["sum"] / histogram["count"] if histogram["count"] else 0
+                lines.append(f"{histogram['name']}[{labels}] n={histogram['count']} "
+                             f"avg={average * 1000:.3f}ms p99<={histogram['p99'] * 1000:g}ms")
+            panel.delete("1.0", "end")
+            panel.insert("1.0", "\n".join(lines))
+
+        timer = self.timeline.every(1, refresh)
+
+    def show_fleet_report(self):
+        fleet_window = ctk.CTkToplevel(self.app)
+        fleet_window.title("Fleet")
+        fleet_window.geometry("480x480")
+
+        panel = ctk.CTkTextbox(fleet_window, font=("Courier", 12))
+        panel.pack(fill="both", expand=True, padx=10, pady=10)
+
+        def refresh():
+            if not fleet_window.winfo_exists():
+                timer.cancel()
+                return
+            panel.delete("1.0", "end")
+            panel.insert("1.0", self.format_fleet_report())
+
+        timer = self.timeline.every(2, refresh)
+
+    def format_fleet_report(self):
+        from fleet import CoordinatorUnavailable
+        try:
+            fleet = self.fleet.aggregate()
+        except CoordinatorUnavailable:
+            return "⚠️ Fleet coordinator is down, serving from local state"
+        lines = [f"Machines: {len(fleet['machines'])}",
+                 f"Sales: ${fleet['total_sales']:.2f}",
+                 f"Balance: ${fleet['money']:.2f}",
+                 f"Queued or brewing: {fleet['queue']}",
+                 ""]
+        for machine in sorted(fleet["machines"], key=lambda m: m["name"]):
+            lines.append(f"{machine['name']}: queue {machine['queue']} | "
+                         f"brewing {machine['brewing']} | routed {machine['routed']} | "
+                         f"sales ${machine['total_sales']:.2f}")
+        lines += ["", "DRINKS SOLD"]
+        for drink, count in sorted(fleet["drinks_sold"].items(), key=lambda item: -item[1]):
+            lines.append(f"{drink}: {count}")
+        lines += ["", "STOCK"]
+        for name, amount in fleet["available"].items():
+            lines.append(f"{name}: {amount:.0f}")
+        return "\n".join(lines)
+
+    def count_orders(self):
+        return sum(counter["value"] for counter in self.metrics.snapshot()["counters"]
+                   if counter["name"] == "orders_total")
+
+    def close(self):
+        self.view.stop()
+        if self.fleet is not None:
+            from fleet import CoordinatorUnavailable
+            try:
+                self.fleet.unregister()
+            except CoordinatorUnavailable:
+                pass
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.ingest is not None:
+            self.ingest.stop()
+        self.post_orders.close()
+        self.analytics.store.flush()
+        self.customers.flush()
+        self.journal.close()
+        self.app.destroy()
 
     def run(self):
         self.app.mainloop()
 
 if __name__ == "__main__":
-    coffee_machine = ModernCoffeeMachine()
-    coffee_machine.run()
\ No newline at end of file
+    # --fleet N runs N machines in this process behind one coordinator
+    if "--fleet" in sys.argv:
+        from fleet import FleetCoordinator, LocalTransport
+        count = int(sys.argv[sys.argv.index("--fleet") + 1])
+        coordinator = FleetCoordinator()
+        machines = []
+        for number in range(1, count + 1):
+            machines.append(ModernCoffeeMachine(
+                os.path.join(DATA_DIR, f"machine-{number}"), name=f"Machine {number}",
+                fleet=LocalTransport(coordinator, f"Machine {number}"),
+                master=machines[0].app if machines else None))
+
+        def close_fleet():
+            # Closing the first machine takes down its windows, so the
+            # others shut down cleanly first
+            for machine in machines[1:]:
+                if machine.app.winfo_exists():
+                    machine.close()
+            machines[0].close()
+
+        machines[0].app.protocol("WM_DELETE_WINDOW", close_fleet)
+        machines[0].run()
+    else:
+        coffee_machine = ModernCoffeeMachine()
+        coffee_machine.run()
\ No newline at end of file
@@ -0,0 +1,293 @@
+import itertools
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from decimal import ROUND_HALF_UP, Decimal
+
+
+CASH = ""  # the walk-in balance topped up at the machine
+CENT = Decimal("0.01")
+
+
+def to_cents(amount):
+    # Money amount to integer cents, rounded half up. Only amounts within a
+    # hair of half a cent need the exact (and slower) decimal rounding.
+    if isinstance(amount, int):
+        return amount * 100
+    scaled = amount * 100
+    if abs(scaled - math.floor(scaled) - 0.5) > 1e-6:
+        return round(scaled)
+    return int(Decimal(str(amount)).quantize(CENT, ROUND_HALF_UP) * 100)
+
+
+def tab_account(table):
+    return f"table:{str(table).strip()}"
+
+
+class ShardedCounter:
+    # Running total split over cells so concurrent writers rarely share a
+    # lock. Each thread is pinned to one cell; value() sums them.
+    def __init__(self, shards=16):
+        self._cells = [[0, threading.Lock()] for _ in range(shards)]
+        self._local = threading.local()
+        self._next = itertools.count()
+
+    def _cell(self):
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            cell = self._local.cell = self._cells[next(self._next) % len(self._cells)]
+        return cell
+
+    def add(self, amount):
+        cell = self._cell()
+        with cell[1]:
+            cell[0] += amount
+
+    def value(self):
+        return sum(cell[0] for cell in self._cells)
+
+    def reset(self, value=0):
+        for cell in self._cells:
+            cell[0] = 0
+        self._cells[0][0] = value
+
+
+class Transaction:
+    __slots__ = ("txn_id", "account", "cents", "ok", "balance", "duplicate")
+
+    def __init__(self, txn_id, account, cents, ok, balance, duplicate=False):
+        self.txn_id = txn_id
+        self.account = account
+        self.cents = cents
+        self.ok = ok
+        self.balance = balance
+        self.duplicate = duplicate
+
+
+class _Shard:
+    __slots__ = ("lock", "balances", "limits", "txns")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.balances = {}     # account -> cents
+        self.limits = {}       # open tab -> how far below zero it may go, in cents
+        self.txns = OrderedDict()  # (account, txn id) -> Transaction, oldest first
+
+
+class Ledger:
+    # Balances in integer cents: the walk-in CASH balance plus one account
+    # per open table tab. Accounts are spread over shards with their own
+    # locks, so deposits from several ingestion threads don't queue behind
+    # each other or behind the order path. A transaction id that was already
+    # applied to an account returns the first result instead of posting twice.
+    # Postings are journaled under their shard lock; hold locked() to see a
+    # state that matches the journal's sequence number.
+    def __init__(self, shards=16, remember=2000, record=None):
+        self._shards = [_Shard() for _ in range(shards)]
+        self.remember = remember  # transaction ids kept per shard for retries
+        self.record = record  # record(event_type, **fields) -> journal seq
+        self.sales = ShardedCounter()
+        self.open_tabs = 0  # lets the order path skip tab lookups when there are none
+        self._tabs_lock = threading.Lock()
+
+    def _shard(self, account):
+        return self._shards[hash(account) % len(self._shards)]
+
+    @contextmanager
+    def locked(self):
+        # Every shard, always in the same order
+        with ExitStack() as stack:
+            for shard in self._shards:
+                stack.enter_context(shard.lock)
+            yield
+
+    def balance(self, account=CASH):
+        return self._shard(account).balances.get(account, 0)
+
+    def post(self, account, cents, txn_id=None, event_type="money", **fields):
+        # Journaled credit (cents > 0) or debit. Debits may not take the
+        # account below its tab limit (zero for CASH).
+        shard = self._shard(account)
+        with shard.lock:
+            if txn_id is not None:
+                done = shard.txns.get((account, txn_id))
+                if done is not None:
+                    return Transaction(txn_id, account, done.cents, done.ok, done.balance,
+                                       duplicate=True)
+            balance = shard.balances.get(account, 0) + cents
+            if cents < 0 and balance < -shard.limits.get(account, 0):
+                return Transaction(txn_id, account, cents, False, balance - cents)
+            shard.balances[account] = balance
+            if self.record is not None:
+                self.record(event_type, account=account, cents=cents, txn=txn_id, **fields)
+            transaction = Transaction(txn_id, account, cents, True, balance)
+            if txn_id is not None:
+                self._remember(shard, transaction)
+            return transaction
+
+    def _remember(self, shard, transaction):
+        shard.txns[transaction.account, transaction.txn_id] = transaction
+        while len(shard.txns) > self.remember:
+            shard.txns.popitem(last=False)
+
+    def charge(self, account, cents):
+        # Debit for an order; the caller journals the order itself
+        shard = self._shard(account)
+        with shard.lock:
+            balance = shard.balances.get(account, 0) - cents
+            if balance < -shard.limits.get(account, 0):
+                return False
+            shard.balances[account] = balance
+            return True
+
+    def credit(self, account, cents):
+        # Refund of a cancelled order; journaled by the caller
+        shard = self._shard(account)
+        with shard.lock:
+            shard.balances[account] = shard.balances.get(account, 0) + cents
+
+    def has_tab(self, account):
+        return account in self._shard(account).limits
+
+    def open_tab(self, account, limit_cents):
+        shard = self._shard(account)
+        with shard.lock:
+            self._open(shard, account, limit_cents)
+            if self.record is not None:
+                self.record("tab", account=account, limit=limit_cents)
+
+    def settle_tab(self, account, txn_id=None):
+        # Customer pays what the tab owes (or gets prepaid credit back) and
+        # the tab closes. Returns the Transaction of the settling payment;
+        # a retried txn id gets the first settlement back, even though the
+        # tab is closed by then. None when there is no open tab.
+        shard = self._shard(account)
+        with shard.lock:
+            if txn_id is not None and (account, txn_id) in shard.txns:
+                return self.post(account, 0, txn_id)
+            if account not in shard.limits:
+                return None
+            owed = -shard.balances.get(account, 0)
+            transaction = self.post(account, owed, txn_id, event_type="settle")
+            self._close(shard, account)
+            return transaction
+
+    def _open(self, shard, account, limit_cents):
+        if account not in shard.limits:
+            with self._tabs_lock:
+                self.open_tabs += 1
+        shard.limits[account] = limit_cents
+        shard.balances.setdefault(account, 0)
+
+    def _close(self, shard, account):
+        if shard.limits.pop(account, None) is not None:
+            with self._tabs_lock:
+                self.open_tabs -= 1
+        shard.balances.pop(account, None)
+
+    def tabs(self):
+        # {account: (balance, limit)} for every open tab
+        tabs = {}
+        for shard in self._shards:
+            with shard.lock:
+                for account, limit in shard.limits.items():
+                    tabs[account] = (shard.balances.get(account, 0), limit)
+        return tabs
+
+    def state(self):
+        with self.locked():
+            balances, limits, txns = {}, {}, []
+            for shard in self._shards:
+                balances.update(shard.balances)
+                limits.update(shard.limits)
+                txns.extend([t.account, t.txn_id, t.cents, t.ok, t.balance]
+                            for t in shard.txns.values())
+            return {"balances": balances, "limits": limits, "sales": self.sales.value(),
+                    "txns": txns}
+
+    def restore(self, state):
+        for shard in self._shards:
+            shard.balances.clear()
+            shard.limits.clear()
+            shard.txns.clear()
+        for account, cents in state["balances"].items():
+            self._shard(account).balances[account] = cents
+        self.open_tabs = 0
+        for account, limit in state.get("limits", {}).items():
+            self._open(self._shard(account), account, limit)
+        for account, txn_id, cents, ok, balance in state.get("txns", []):
+            self._remember(self._shard(account), Transaction(txn_id, account, cents, ok, balance))
+        self.sales.reset(state["sales"])
+
+    def apply_event(self, event):
+        # Replay the money side of one journaled event
+        event_type = event["type"]
+        if event_type == "money":
+            account, txn_id = event["account"], event.get("txn")
+            self.credit(account, event["cents"])
+            if txn_id is not None:
+                shard = self._shard(account)
+                self._remember(shard, Transaction(txn_id, account, event["cents"], True,
+                                                  shard.balances[account]))
+        elif event_type in ("order", "cancel"):
+            sign = 1 if event_type == "order" else -1
+            if not event["prepaid"]:
+                self.credit(event["account"], -sign * event["cents"])
+            self.sales.add(sign * event["cents"])
+        elif event_type == "tab":
+            self._open(self._shard(event["account"]), event["account"], event["limit"])
+        elif event_type == "settle":
+            shard = self._shard(event["account"])
+            self._close(shard, event["account"])
+            if event.get("txn") is not None:
+                self._remember(shard, Transaction(event["txn"], event["account"],
+                                                  event["cents"], True, 0))
+
+
+def replay_journal(directory, until_seq=None):
+    # Ledger rebuilt from a journal directory's snapshot plus log, or None
+    # when the snapshot is already past until_seq
+    ledger = Ledger()
+    snapshot_seq = 0
+    snapshot_path = os.path.join(directory, "snapshot.json")
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, encoding="utf-8") as handle:
+            snapshot = json.load(handle)
+        snapshot_seq = snapshot["seq"]
+        if until_seq is not None and snapshot_seq > until_seq:
+            return None
+        ledger.restore(snapshot["state"]["ledger"])
+
+    log_path = os.path.join(directory, "journal.log")
+    if os.path.exists(log_path):
+        with open(log_path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break
+                if event["seq"] <= snapshot_seq:
+                    continue
+                if until_seq is not None and event["seq"] > until_seq:
+                    break
+                ledger.apply_event(event)
+    return ledger
+
+
+def compare_states(live, replayed):
+    # Differences between two ledger states, [] when they agree to the cent
+    differences = []
+    if live["sales"] != replayed["sales"]:
+        differences.append(("sales", live["sales"], replayed["sales"]))
+    accounts = set(live["balances"]) | set(replayed["balances"])
+    for account in sorted(accounts):
+        mine = live["balances"].get(account, 0)
+        theirs = replayed["balances"].get(account, 0)
+        if mine != theirs:
+            differences.append((account or "cash", mine, theirs))
+    if live["limits"] != replayed["limits"]:
+        differences.append(("tabs", live["limits"], replayed["limits"]))
+    return differences
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import marshal
+import os
+
+from inventory import INGREDIENT_IDS
+from promotions import Promotion
+from recipes import BASE_STOCK_KEYS, EXTRA_STOCK_KEYS, RecipeTable
+
+
+MENU_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "menu.json")
+CACHE_VERSION = 2
+MAX_EXTRAS = 12  # recipe rows grow as 2 ** extras per drink and size
+
+
+class MenuConfigError(ValueError):
+    pass
+
+
+class MenuConfig:
+    # Validated menu plus its precompiled RecipeTable; rows come from the
+    # cache when the menu was compiled before
+    def __init__(self, coffee_menu, size_options, extras, promotions, tips, digest,
+                 rows=None):
+        self.coffee_menu = coffee_menu
+        self.size_options = size_options
+        self.extras = extras
+        self.promotions = promotions
+        self.tips = tips
+        self.digest = digest
+        self.recipes = RecipeTable(coffee_menu, size_options, extras, rows)
+
+
+def _number(value, where, minimum=0.0, allow_equal=True):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise MenuConfigError(f"{where} must be a number")
+    if value < minimum or (value == minimum and not allow_equal):
+        raise MenuConfigError(f"{where} must be {'at least' if allow_equal else 'above'} {minimum}")
+    return value
+
+
+def validate_menu(data):
+    # Raises MenuConfigError describing the first problem found
+    if not isinstance(data, dict):
+        raise MenuConfigError("menu config must be a JSON object")
+    for key in ("coffee_menu", "size_options", "extras"):
+        if not isinstance(data.get(key), dict) or not data[key]:
+            raise MenuConfigError(f"{key} must be a non-empty object")
+
+    for name, details in data["coffee_menu"].items():
+        if not isinstance(details, dict):
+            raise MenuConfigError(f"coffee_menu.{name} must be an object")
+        _number(details.get("price"), f"coffee_menu.{name}.price", allow_equal=False)
+        for key in BASE_STOCK_KEYS:
+            _number(details.get(key, 0), f"coffee_menu.{name}.{key}")
+        if not isinstance(details.get("description", ""), str):
+            raise MenuConfigError(f"coffee_menu.{name}.description must be a string")
+
+    for name, multiplier in data["size_options"].items():
+        _number(multiplier, f"size_options.{name}", allow_equal=False)
+
+    if len(data["extras"]) > MAX_EXTRAS:
+        raise MenuConfigError(f"at most {MAX_EXTRAS} extras are supported")
+    for name, details in data["extras"].items():
+        if not isinstance(details, dict):
+            raise MenuConfigError(f"extras.{name} must be an object")
+        _number(details.get("price"), f"extras.{name}.price")
+        for key, amount in details.items():
+            if key == "price":
+                continue
+            if key in EXTRA_STOCK_KEYS:
+                if name not in INGREDIENT_IDS:
+                    raise MenuConfigError(f"extras.{name} uses {key} but there is no "
+                                          f"{name} in the inventory")
+            elif key not in BASE_STOCK_KEYS:
+                raise MenuConfigError(f"extras.{name}.{key} is not an ingredient")
+            _number(amount, f"extras.{name}.{key}")
+
+    for rule in data.get("promotions", []):
+        Promotion(rule)  # raises ValueError with the rule name
+    tips = data.get("tips", [])
+    if not isinstance(tips, list) or not all(isinstance(tip, str) for tip in tips):
+        raise MenuConfigError("tips must be a list of strings")
+
+
+def load_menu(path=MENU_PATH, cache_dir=None):
+    # Parse, validate and compile a menu file. With cache_dir, the compiled
+    # result is kept under the file's SHA-256 so an unchanged file skips
+    # parsing, validation and recipe building on the next start. The cache
+    # is plain data (marshal of dicts, lists and raw doubles), so a planted
+    # or stale file can at worst fail to load, never run code.
+    with open(path, "rb") as handle:
+        raw = handle.read()
+    digest = hashlib.sha256(raw).hexdigest()
+
+    cache_path = None
+    if cache_dir is not None:
+        # Caches are named per menu file, so stores sharing a data directory
+        # don't evict each other's
+        source = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+        prefix = f"menu-{source}-"
+        cache_path = os.path.join(cache_dir, f"{prefix}{CACHE_VERSION}-{digest[:32]}.cache")
+        config = _read_cache(cache_path, digest)
+        if config is not None:
+            return config
+
+    try:
+        data = json.loads(raw.decode("utf-8"))
+    except ValueError as error:
+        raise MenuConfigError(f"{path}: {error}") from None
+    try:
+        validate_menu(data)
+    except ValueError as error:
+        raise MenuConfigError(f"{path}: {error}") from None
+    config = MenuConfig(data["coffee_menu"], data["size_options"], data["extras"],
+                        data.get("promotions", []), data.get("tips", []), digest)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Drop caches of earlier versions of this file
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix) and name != os.path.basename(cache_path):
+                os.remove(os.path.join(cache_dir, name))
+        temp_path = cache_path + ".tmp"
+        with open(temp_path, "wb") as handle:
+            marshal.dump({"version": CACHE_VERSION, "digest": digest,
+                          "coffee_menu": config.coffee_menu,
+                          "size_options": config.size_options, "extras": config.extras,
+                          "promotions": config.promotions, "tips": config.tips,
+                          "rows": config.recipes.export_rows()}, handle)
+        os.replace(temp_path, cache_path)
+    return config
+
+
+def _read_cache(cache_path, digest):
+    # MenuConfig from a cache file, or None when it is missing or unusable
+    try:
+        with open(cache_path, "rb") as handle:
+            data = marshal.load(handle)
+        if data["version"] != CACHE_VERSION or data["digest"] != digest:
+            return None
+        validate_menu(data)
+        return MenuConfig(data["coffee_menu"], data["size_options"], data["extras"],
+                          data["promotions"], data["tips"], digest, rows=data["rows"])
+    except (OSError, EOFError, ValueError, TypeError, KeyError, IndexError, AttributeError):
+        return None
+
+
+class MenuWatcher:
+    # Polls the menu file and calls on_change(config) with the new, valid
+    # config; on_error(error) gets a MenuConfigError and the old menu stays
+    def __init__(self, path, on_change, on_error=None, cache_dir=None):
+        self.path = path
+        self.on_change = on_change
+        self.on_error = on_error
+        self.cache_dir = cache_dir
+        self._stamp = self._file_stamp()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self):
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            config = load_menu(self.path, self.cache_dir)
+        except (OSError, MenuConfigError) as error:
+            if self.on_error:
+                self.on_error(error)
+            return False
+        self.on_change(config)
+        return True
@@ -0,0 +1,386 @@
+import os
+import queue
+import struct
+from collections import deque
+from datetime import datetime
+
+from analytics import ColumnStore
+from metrics import Metrics
+
+
+# Record kinds; STOP tells a worker to flush and exit
+STOP, ORDER, COMPLETE, CANCEL = 0, 1, 2, 3
+KINDS = {"order": ORDER, "complete": COMPLETE, "cancel": CANCEL}
+
+IDLE_FLUSH = 1.0  # seconds without records before a worker flushes to disk
+
+# A ring's shared memory starts with the count of records its worker has
+# taken, so the records left behind by a dead worker can be found
+TAIL = struct.Struct("<Q")
+
+
+def _field_bytes(names, minimum=16):
+    # Widest UTF-8 name, rounded up to 8 bytes
+    longest = max((len(name.encode("utf-8")) for name in names), default=0)
+    return max(minimum, -(-longest // 8) * 8)
+
+
+class RecordLayout:
+    # Fixed-size order record for one menu: kind, seq, timestamp (the
+    # brew's completion for COMPLETE, else the order's), price, discount,
+    # temperature, extras as a bitmask over the menu's extras, then drink,
+    # size, customer and table as UTF-8. The drink and size
+    # fields fit every name on the menu. pack() returns None for an order
+    # that doesn't fit (a long customer name, an extra added by a later
+    # menu reload); the pool handles those in-process instead of cutting
+    # them short.
+    def __init__(self, extra_names, drink_bytes, size_bytes, customer_bytes=64,
+                 table_bytes=16):
+        self.extra_names = tuple(extra_names)
+        self.extra_bits = {name: 1 << index for index, name in enumerate(self.extra_names)}
+        self.widths = (drink_bytes, size_bytes, customer_bytes, table_bytes)
+        self.struct = struct.Struct("<BQdddBQ%ds%ds%ds%ds" % self.widths)
+        self.size = self.struct.size
+        self._stop = self.struct.pack(STOP, 0, 0.0, 0.0, 0.0, 0, 0, b"", b"", b"", b"")
+
+    @classmethod
+    def for_menu(cls, coffee_menu, size_options, extra_names):
+        if len(extra_names) > 64:
+            raise ValueError("the extras bitmask holds at most 64 extras")
+        return cls(extra_names, _field_bytes(coffee_menu), _field_bytes(size_options))
+
+    def spec(self):
+        # Constructor arguments, for rebuilding the layout in a worker
+        return (self.extra_names,) + self.widths
+
+    def pack(self, kind, seq, result):
+        # Record bytes, or None when the order doesn't fit this layout
+        order = result.order
+        mask = 0
+        for extra in order.extras:
+            bit = self.extra_bits.get(extra)
+            if bit is None:
+                return None
+            mask |= bit
+        fields = (order.coffee_type.encode("utf-8"), order.size.encode("utf-8"),
+                  order.customer.strip().encode("utf-8"),
+                  str(order.table).strip().encode("utf-8"))
+        for field, width in zip(fields, self.widths):
+            if len(field) > width:
+                return None
+        return self.struct.pack(kind, seq, record_time(kind, result), result.price,
+                                result.discount, int(order.temperature), mask, *fields)
+
+    def pack_stop(self):
+        return self._stop
+
+    def unpack(self, buffer, offset):
+        # dict of the record's fields, or None for STOP
+        (kind, seq, timestamp, price, discount, temperature, mask, drink, size,
+         customer, table) = self.struct.unpack_from(buffer, offset)
+        if kind == STOP:
+            return None
+        drink, size, customer, table = [field.rstrip(b"\0").decode("utf-8")
+                                        for field in (drink, size, customer, table)]
+        extras = [name for index, name in enumerate(self.extra_names) if mask >> index & 1]
+        return {"kind": kind, "seq": seq, "timestamp": timestamp, "price": price,
+                "discount": discount, "temperature": temperature, "drink": drink,
+                "size": size, "extras": extras, "customer": customer, "table": table}
+
+
+def record_time(kind, result):
+    # Brewed orders go to the history when they finish, stamped with that
+    # time so each shard's timestamps stay ascending
+    if kind == COMPLETE and result.completed_at is not None:
+        return result.completed_at.timestamp()
+    return result.timestamp.timestamp()
+
+
+def inline_record(kind, seq, result):
+    # The same fields as RecordLayout.unpack, straight from the result
+    order = result.order
+    return {"kind": kind, "seq": seq, "timestamp": record_time(kind, result),
+            "price": result.price, "discount": result.discount,
+            "temperature": int(order.temperature), "drink": order.coffee_type,
+            "size": order.size, "extras": list(order.extras),
+            "customer": order.customer.strip(), "table": str(order.table).strip()}
+
+
+def format_receipt(record):
+    width = 32
+    when = datetime.fromtimestamp(record["timestamp"])
+    lines = ["Modern Coffee Machine".center(width), f"{when:%Y-%m-%d %H:%M:%S}",
+             "-" * width, f"{record['drink']} ({record['size']}, {record['temperature']}°C)"]
+    lines.extend(f"  + {extra}" for extra in record["extras"])
+    discount = record["discount"]
+    if 0 < discount < 1:
+        subtotal = record["price"] / (1 - discount)
+        lines.append(f"{'Subtotal':<20}{subtotal:>12.2f}")
+        lines.append(f"{f'Discount {discount:.0%}':<20}{record['price'] - subtotal:>12.2f}")
+    lines.append(f"{'Total':<20}{record['price']:>12.2f}")
+    if record["customer"]:
+        lines.append(f"Customer: {record['customer']}")
+    if record["table"]:
+        lines.append(f"Table: {record['table']}")
+    if record["kind"] == CANCEL:
+        lines.insert(1, "*** VOID - REFUNDED ***".center(width))
+    return "\n".join(lines) + "\n" + "=" * width + "\n"
+
+
+class PostOrderProcessor:
+    # The work done for every committed order once it has left the order
+    # path: receipts for charged and voided orders, brewed orders into the
+    # columnar history and loyalty points. Runs inside a worker process, or
+    # in-process when no worker can take the record.
+    def __init__(self, directory, store, receipts_suffix="", points_per_unit=1):
+        self.directory = directory
+        self.store = store
+        self.receipts_suffix = receipts_suffix
+        self.points_per_unit = points_per_unit
+        self._receipts = []
+
+    def handle(self, record):
+        # (seq, kind, loyalty points earned) for the main process
+        kind = record["kind"]
+        points = 0
+        if kind in (ORDER, CANCEL):
+            self._receipts.append((record["timestamp"], format_receipt(record)))
+        elif kind == COMPLETE:
+            self.store.append(record["timestamp"], record["drink"], record["extras"],
+                              record["price"], record["discount"])
+            if record["customer"]:
+                points = int(record["price"] * self.points_per_unit)
+        return record["seq"], kind, points
+
+    def flush(self):
+        self.store.flush()
+        receipts, self._receipts = self._receipts, []
+        if not receipts:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        by_day = {}
+        for timestamp, text in receipts:
+            day = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+            by_day.setdefault(day, []).append(text)
+        for day, texts in by_day.items():
+            path = os.path.join(self.directory, f"receipts-{day}{self.receipts_suffix}.txt")
+            with open(path, "a", encoding="utf-8") as handle:
+                handle.writelines(texts)
+
+
+def _worker_main(shm_name, slots, layout_spec, items, spaces, results, receipts_dir,
+                 store_dir, shard, points_per_unit):
+    # Single consumer of one ring. Each worker owns its history shard and
+    # receipt file, so workers never write to the same file.
+    from multiprocessing import shared_memory
+    ring = shared_memory.SharedMemory(name=shm_name)
+    layout = RecordLayout(*layout_spec)
+    processor = PostOrderProcessor(receipts_dir, ColumnStore(store_dir),
+                                   f"-w{shard}", points_per_unit)
+    tail = 0
+    try:
+        while True:
+            if not items.acquire(timeout=IDLE_FLUSH):
+                processor.flush()
+                continue
+            record = layout.unpack(ring.buf, TAIL.size + (tail % slots) * layout.size)
+            tail += 1
+            TAIL.pack_into(ring.buf, 0, tail)
+            spaces.release()
+            if record is None:
+                break
+            results.put(processor.handle(record))
+    finally:
+        processor.flush()
+        ring.close()
+
+
+class _Ring:
+    # Single-producer, single-consumer ring of fixed-size records in shared
+    # memory. The semaphores count filled and free slots, so neither side
+    # ever reads the other's index.
+    def __init__(self, context, slots, record_size):
+        from multiprocessing import shared_memory
+        self.slots = slots
+        self.record_size = record_size
+        self.memory = shared_memory.SharedMemory(create=True,
+                                                 size=TAIL.size + slots * record_size)
+        TAIL.pack_into(self.memory.buf, 0, 0)
+        self.items = context.Semaphore(0)
+        self.spaces = context.Semaphore(slots)
+        self.head = 0
+
+    def put(self, record, block=False, timeout=None):
+        if not self.spaces.acquire(block, timeout):
+            return False
+        offset = TAIL.size + (self.head % self.slots) * self.record_size
+        self.memory.buf[offset:offset + self.record_size] = record
+        self.head += 1
+        self.items.release()
+        return True
+
+    def leftovers(self, layout):
+        # Records the consumer never took; only safe once it has exited
+        tail = TAIL.unpack_from(self.memory.buf, 0)[0]
+        records = (layout.unpack(self.memory.buf, TAIL.size + (position % self.slots)
+                                 * self.record_size) for position in range(tail, self.head))
+        return [record for record in records if record is not None]
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+class PostOrderPool:
+    # Hands committed orders to worker processes so receipt formatting,
+    # history writes and loyalty arithmetic stay off the Tk main loop and
+    # out of its GIL. The engine listener only copies the order into a
+    # shared-memory ring; poll() (on the main loop) delivers the results as
+    # on_result(event_type, result, points). When every ring is full, the
+    # workers are gone or the order doesn't fit the record layout, records
+    # are processed in-process instead. Records a dead worker left in its
+    # ring are processed in-process too; ones it took but never answered
+    # are dropped and counted in lost.
+    def __init__(self, directory, store, layout, workers=2, slots=1024, points_per_unit=1,
+                 on_result=None, metrics=None):
+        self.directory = directory
+        self.receipts_dir = os.path.join(directory, "receipts")
+        self.store = store
+        self.layout = layout  # fixed when the workers start; see RecordLayout
+        self.workers = workers
+        self.slots = slots
+        self.points_per_unit = points_per_unit
+        self.on_result = on_result
+        self.metrics = metrics or Metrics()
+        self.inline = PostOrderProcessor(self.receipts_dir, store, "", points_per_unit)
+        self.pending = {}  # seq -> (event type, OrderResult) awaiting its result
+        self.handled_inline = 0
+        self.lost = 0
+        self._owners = {}  # seq -> ring it was handed to
+        self._seq = 0
+        self._next = 0
+        self._rings = []
+        self._processes = []
+        self._inline_results = deque()
+        self._results = None
+
+    def start(self):
+        # Workers are spawned, not forked, so they never inherit Tk state.
+        # multiprocessing is imported here, not at load: it is most of the
+        # module's import time and isn't needed until the workers start.
+        if not self.workers:
+            return
+        import multiprocessing
+        context = multiprocessing.get_context("spawn")
+        self._results = context.Queue()
+        for shard in range(self.workers):
+            ring = _Ring(context, self.slots, self.layout.size)
+            process = context.Process(
+                target=_worker_main, name=f"post-order-{shard}", daemon=True,
+                args=(ring.memory.name, self.slots, self.layout.spec(), ring.items,
+                      ring.spaces, self._results, self.receipts_dir,
+                      os.path.join(self.store.directory, f"shard-{shard}"),
+                      shard, self.points_per_unit))
+            process.start()
+            self._rings.append(ring)
+            self._processes.append(process)
+
+    def on_order_event(self, event_type, result):
+        # Engine listener: the whole cost on the order path is one record copy
+        kind = KINDS.get(event_type)
+        if kind is None:
+            return
+        self._seq += 1
+        seq = self._seq
+        self.pending[seq] = (event_type, result)
+        rings = self._rings
+        record = self.layout.pack(kind, seq, result) if rings else None
+        if record is not None:
+            for attempt in range(len(rings)):
+                ring = rings[(self._next + attempt) % len(rings)]
+                if ring.put(record):
+                    self._owners[seq] = ring
+                    self._next = (self._next + attempt + 1) % len(rings)
+                    return
+        self.handled_inline += 1
+        self._inline_results.append(self.inline.handle(inline_record(kind, seq, result)))
+
+    def poll(self):
+        # Deliver finished results on the calling (main) thread
+        delivered = 0
+        if self._rings and not all(process.is_alive() for process in self._processes):
+            # A worker died: stop handing it records
+            delivered += self._retire_dead_workers()
+        while self._inline_results:
+            self._deliver(self._inline_results.popleft())
+            delivered += 1
+        return delivered + self._drain_results()
+
+    def _drain_results(self):
+        delivered = 0
+        if self._results is not None:
+            while True:
+                try:
+                    item = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                self._deliver(item)
+                delivered += 1
+        return delivered
+
+    def _deliver(self, item):
+        seq, _, points = item
+        self._owners.pop(seq, None)
+        entry = self.pending.pop(seq, None)
+        if entry is not None and self.on_result is not None:
+            self.on_result(entry[0], entry[1], points)
+
+    def _retire_dead_workers(self):
+        # Everything a dead worker answered is already queued, so collect
+        # that first; what is still in its ring runs in-process and the
+        # records it took without answering are lost
+        delivered = self._drain_results()
+        rings, processes, dead = [], [], []
+        for ring, process in zip(self._rings, self._processes):
+            if process.is_alive():
+                rings.append(ring)
+                processes.append(process)
+            else:
+                dead.append(ring)
+        self._rings, self._processes = rings, processes
+        self._next = 0
+        for ring in dead:
+            recovered = set()
+            for record in ring.leftovers(self.layout):
+                recovered.add(record["seq"])
+                self.handled_inline += 1
+                self._inline_results.append(self.inline.handle(record))
+            for seq, owner in list(self._owners.items()):
+                if owner is ring and seq not in recovered:
+                    del self._owners[seq]
+                    self.pending.pop(seq, None)
+                    self.lost += 1
+                    self.metrics.inc("post_orders_lost_total")
+            ring.close()
+        return delivered
+
+    def flush(self):
+        # Workers flush on their own when idle; this covers in-process records
+        self.inline.flush()
+
+    def backlog(self):
+        return len(self.pending)
+
+    def close(self, timeout=5.0):
+        rings, processes = self._rings, self._processes
+        self._rings, self._processes = [], []
+        for ring in rings:
+            ring.put(self.layout.pack_stop(), block=True, timeout=timeout)
+        for process in processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.poll()
+        for ring in rings:
+            ring.close()
+        self.inline.flush()
@@ -0,0 +1,180 @@
+import json
+import threading
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# Promotions are plain data (see "promotions" in config/menu.json). Optional
+# keys narrow where a rule applies:
+#   drinks / sizes  - menu names, every drink or size when missing
+#   extras          - extras the order must include (combos, per-extra promos)
+#   days            - weekday names, every day when missing
+#   hours           - ["HH:MM", "HH:MM"] time-of-day window (happy hours)
+#   min_visits      - previous orders the customer needs (loyalty)
+# The best matching discount wins; promotions don't stack.
+
+
+def _parse_minute(text):
+    hours, minutes = text.split(":")
+    minute = int(hours) * 60 + int(minutes)
+    if not 0 <= minute <= 24 * 60:
+        raise ValueError(text)
+    return minute
+
+
+class Promotion:
+    __slots__ = ("name", "discount", "drinks", "sizes", "extras", "days", "start",
+                 "end", "min_visits")
+
+    def __init__(self, rule):
+        try:
+            self.name = rule["name"]
+            self.discount = rule["discount"] / 100
+            if not 0 < self.discount < 1:
+                raise ValueError("discount must be between 0 and 100")
+            self.drinks = rule.get("drinks")
+            self.sizes = rule.get("sizes")
+            self.extras = tuple(rule.get("extras", ()))
+            self.days = {DAYS.index(day) for day in rule.get("days", DAYS)}
+            self.start, self.end = [_parse_minute(text) for text in rule.get("hours", ("00:00", "24:00"))]
+            if self.start >= self.end:
+                raise ValueError("hours must be a window within one day")
+            self.min_visits = int(rule.get("min_visits", 0))
+        except (KeyError, TypeError, ValueError) as error:
+            raise ValueError(f"Invalid promotion {rule.get('name', rule)!r}: {error}") from None
+
+    def active_at(self, moment):
+        minute = moment.hour * 60 + moment.minute
+        return moment.weekday() in self.days and self.start <= minute < self.end
+
+    def label(self):
+        what = " + ".join(self.drinks or ["All Drinks"])
+        if self.extras:
+            what += " with " + ", ".join(self.extras)
+        text = f"{what}: {self.discount:.0%} OFF"
+        if (self.start, self.end) != (0, 24 * 60):
+            text += f" ({self.start // 60:02d}:{self.start % 60:02d}-{self.end // 60:02d}:{self.end % 60:02d})"
+        if self.min_visits:
+            text += f" after {self.min_visits} visits"
+        return text
+
+
+def load_promotions(path):
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+class PromotionTable:
+    # Promotions compiled for the current time window into a table keyed like
+    # RecipeTable: (drink, size) -> best discount per extras bitmask. The table
+    # is rebuilt only when the set of active rules can change (midnight or a
+    # rule's start/end minute), so pricing an order is a lookup however many
+    # rules there are. Loyalty tiers sit next to it and are found by bisection.
+    def __init__(self, rules, recipes, visits=None):
+        self.rules = [Promotion(rule) for rule in rules]
+        self.recipes = recipes
+        self.visits = visits  # visits(customer) -> previous orders, for loyalty rules
+        self.active = []
+        self.compiles = 0
+        self._best = {}
+        self._loyalty = {}
+        self._window = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        # Menu, sizes or extras changed: recompile on the next lookup
+        self._window = None
+
+    def discount(self, order, now=None):
+        return self.applied(order, now)[0]
+
+    def applied(self, order, now=None):
+        # (discount fraction, promotion name or "") for an order
+        self._ensure(now or datetime.now())
+        key = (order.coffee_type, order.size)
+        rows = self._best.get(key)
+        if rows is None:
+            return 0.0, ""
+        mask = self.recipes.extras_mask(order.extras)
+        best = rows[mask]
+
+        tiers = self._loyalty.get(key)
+        if tiers is not None and self.visits is not None and order.customer:
+            thresholds, rewards = tiers[mask]
+            index = bisect_right(thresholds, self.visits(order.customer)) - 1
+            if index >= 0 and rewards[index][0] > best[0]:
+                best = rewards[index]
+        return best
+
+    def active_now(self, now=None):
+        self._ensure(now or datetime.now())
+        return list(self.active)
+
+    def _ensure(self, moment):
+        window = self._window
+        if window is not None and window[0] <= moment < window[1]:
+            return
+        with self._lock:
+            window = self._window
+            if window is None or not window[0] <= moment < window[1]:
+                self._compile(moment)
+
+    def _compile(self, moment):
+        day_start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        minute = moment.hour * 60 + moment.minute
+        # The active set stays the same until the next rule boundary today
+        boundaries = [edge for rule in self.rules for edge in (rule.start, rule.end)
+                      if edge > minute]
+        start = max([edge for rule in self.rules for edge in (rule.start, rule.end)
+                     if edge <= minute] + [0])
+        end = min(boundaries + [24 * 60])
+
+        recipes = self.recipes
+        full = 1 << len(recipes.extra_names)
+        active = [rule for rule in self.rules if rule.active_at(moment)]
+        best = {}
+        loyalty = {}
+        for drink in recipes.coffee_menu:
+            for size in recipes.size_options:
+                best[drink, size] = [(0.0, "")] * full
+        for rule in active:
+            if any(extra not in recipes.extra_bits for extra in rule.extras):
+                continue
+            rule_mask = recipes.extras_mask(rule.extras)
+            for drink in rule.drinks or recipes.coffee_menu:
+                for size in rule.sizes or recipes.size_options:
+                    rows = best.get((drink, size))
+                    if rows is None:
+                        continue
+                    # Every extras mask that contains the rule's extras
+                    mask = rule_mask
+                    while mask < full:
+                        if rule.min_visits:
+                            tiers = loyalty.setdefault((drink, size), {})
+                            tiers.setdefault(mask, []).append((rule.min_visits, rule.discount,
+                                                               rule.name))
+                        elif rule.discount > rows[mask][0]:
+                            rows[mask] = (rule.discount, rule.name)
+                        mask = (mask + 1) | rule_mask
+
+        # Loyalty tiers: ascending visit thresholds with the best reward so far
+        compiled_loyalty = {}
+        for key, by_mask in loyalty.items():
+            table = []
+            for mask in range(full):
+                thresholds, rewards = [], []
+                for visits, discount, name in sorted(by_mask.get(mask, ())):
+                    if rewards and rewards[-1][0] >= discount:
+                        continue
+                    thresholds.append(visits)
+                    rewards.append((discount, name))
+                table.append((thresholds, rewards))
+            compiled_loyalty[key] = table
+
+        self._best = best
+        self._loyalty = compiled_loyalty
+        self.active = active
+        self.compiles += 1
+        self._window = (day_start + timedelta(minutes=start), day_start + timedelta(minutes=end))
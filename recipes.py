@@ -0,0 +1,124 @@
+from array import array
+
+from inventory import COFFEE, INGREDIENT_IDS, INGREDIENTS, MILK, WATER, empty_vector
+
+
+# Extra quantity keys that consume the ingredient named after the extra
+EXTRA_STOCK_KEYS = ("syrup", "sauce", "cream")
+BASE_STOCK_KEYS = {"water": WATER, "coffee": COFFEE, "milk": MILK}
+
+
+class Recipe:
+    __slots__ = ("price", "amounts")
+
+    def __init__(self, price, amounts):
+        self.price = price
+        self.amounts = amounts
+
+
+class RecipeTable:
+    # Every (drink, size, extras bitmask) combination, priced once up front.
+    # rows (from export_rows) skips the pricing for a menu that was
+    # compiled before.
+    def __init__(self, coffee_menu, size_options, extras, rows=None):
+        self.coffee_menu = coffee_menu
+        self.size_options = size_options
+        self.extras = extras
+        self._rows = {}
+        if rows is None:
+            self.rebuild()
+        else:
+            self._index_extras()
+            self._import_rows(rows)
+
+    def rebuild(self):
+        self._index_extras()
+        self._rows = {}
+        for drink in self.coffee_menu:
+            self.update_drink(drink)
+
+    def _index_extras(self):
+        self.extra_names = list(self.extras)
+        self.extra_bits = {name: 1 << index for index, name in enumerate(self.extra_names)}
+        self._extra_vectors = [self._extra_vector(name) for name in self.extra_names]
+
+    def export_rows(self):
+        # {(drink, size): (prices, amounts)} as raw doubles: plain data a
+        # cache can store and read back without running any code
+        exported = {}
+        for key, rows in self._rows.items():
+            amounts = array("d")
+            for row in rows:
+                amounts.extend(row.amounts)
+            exported[key] = (array("d", [row.price for row in rows]).tobytes(),
+                             amounts.tobytes())
+        return exported
+
+    def _import_rows(self, exported):
+        # Raises ValueError when the rows don't match this menu
+        width = len(INGREDIENTS)
+        count = 1 << len(self.extra_names)
+        for drink in self.coffee_menu:
+            for size in self.size_options:
+                prices, amounts = array("d"), array("d")
+                prices.frombytes(exported[drink, size][0])
+                amounts.frombytes(exported[drink, size][1])
+                if len(prices) != count or len(amounts) != count * width:
+                    raise ValueError(f"cached rows for {drink} {size} don't match the menu")
+                self._rows[drink, size] = [
+                    Recipe(price, amounts[index * width:(index + 1) * width])
+                    for index, price in enumerate(prices)]
+
+    def extras_mask(self, extras):
+        mask = 0
+        for extra in extras:
+            mask |= self.extra_bits[extra]
+        return mask
+
+    def recipe_for(self, order):
+        return self._rows[order.coffee_type, order.size][self.extras_mask(order.extras)]
+
+    def update_drink(self, drink):
+        for size in self.size_options:
+            self._build_rows(drink, size)
+
+    def remove_drink(self, drink):
+        for size in self.size_options:
+            self._rows.pop((drink, size), None)
+
+    def update_size(self, size):
+        for drink in self.coffee_menu:
+            self._build_rows(drink, size)
+
+    def remove_size(self, size):
+        for drink in self.coffee_menu:
+            self._rows.pop((drink, size), None)
+
+    def _extra_vector(self, name):
+        amounts = empty_vector()
+        for key, value in self.extras[name].items():
+            if key in BASE_STOCK_KEYS:
+                amounts[BASE_STOCK_KEYS[key]] += value
+            elif key in EXTRA_STOCK_KEYS:
+                amounts[INGREDIENT_IDS[name]] += value
+        return amounts
+
+    def _build_rows(self, drink, size):
+        details = self.coffee_menu[drink]
+        multiplier = self.size_options[size]
+        base = empty_vector()
+        for key, ingredient in BASE_STOCK_KEYS.items():
+            base[ingredient] = details.get(key, 0) * multiplier
+
+        prices = [self.extras[name]["price"] for name in self.extra_names]
+        rows = [Recipe(details["price"] * multiplier, base)]
+
+        # Each mask extends the row without its lowest extra bit
+        for mask in range(1, 1 << len(self.extra_names)):
+            low = (mask & -mask).bit_length() - 1
+            previous = rows[mask & (mask - 1)]
+            extra = self._extra_vectors[low]
+            amounts = array("d", [a + b for a, b in zip(previous.amounts, extra)])
+            rows.append(Recipe(previous.price + prices[low], amounts))
+
+        self._rows[drink, size] = rows
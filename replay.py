@@ -0,0 +1,392 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from array import array
+from datetime import datetime
+
+from bench import OrderGenerator
+from brewmodel import BrewModel
+from engine import Order, OrderEngine
+from forecast import format_duration
+from inventory import INGREDIENT_IDS, INGREDIENTS
+from scheduler import BatchingPolicy, EventBrewScheduler, FifoPolicy, QueueFullError
+from simulate import parse_temperatures
+from timeline import VirtualTimeline
+
+
+# Trace files are JSON lines, one event per line in time order:
+#   {"t": 12.5, "coffee": "Latte", "size": "Large", "extras": ["Extra Shot"],
+#    "customer": "Ayşe", "table": "4", "temperature": 85}
+#   {"t": 600, "refill": "Milk"}      refill one ingredient, or "all"
+#   {"t": 900, "stockout": "Milk"}    the ingredient runs dry
+# "t" is seconds from the start of the trace. Events with an epoch "ts"
+# instead also work, so a machine's journal.log replays as a recorded
+# trace (its order and refill events; everything else is skipped). A .csv
+# trace has the same columns, with extras separated by ";".
+SPARK = " ▁▂▃▄▅▆▇█"
+WAIT_BUCKETS = (30, 60, 120, 300, 600)  # upper bounds of the wait histogram, seconds
+
+
+def _trace_events(path):
+    with open(path, encoding="utf-8", newline="") as handle:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(handle):
+                row = {key: value for key, value in row.items() if value not in (None, "")}
+                row["extras"] = [extra for extra in row.get("extras", "").split(";") if extra]
+                for key in ("t", "ts", "temperature"):
+                    if key in row:
+                        row[key] = float(row[key])
+                yield row
+        else:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_trace(path):
+    # Yields (seconds from the trace start, kind, event) one line at a time;
+    # kind is "order", "refill" or "stockout"
+    start = None
+    for event in _trace_events(path):
+        kind = event.get("type")
+        if kind is None:
+            kind = ("refill" if "refill" in event else
+                    "stockout" if "stockout" in event else "order")
+        elif kind == "refill":
+            event = {"ts": event["ts"], "refill": event["resource"]}
+        elif kind != "order":
+            continue
+        at = event.get("t", event.get("ts"))
+        if at is None:
+            raise ValueError(f"{path}: trace event without a time: {event}")
+        if start is None:
+            start = 0.0 if "t" in event else at
+        yield at - start, kind, event
+
+
+def write_synthetic_trace(path, hours, rate_per_hour, burst_factor=3.0, seed=1,
+                          temperatures=None):
+    # Generated orders streamed to a trace file; returns how many were written
+    generator = OrderGenerator(rate=rate_per_hour / 3600, burst_every=4 * 3600,
+                               burst_length=3600, burst_factor=burst_factor, seed=seed,
+                               temperatures=temperatures)
+    horizon = hours * 3600
+    written = 0
+    with open(path, "w", encoding="utf-8") as handle:
+        for at, order in generator.stream(10 ** 12):
+            if at >= horizon:
+                break
+            handle.write(json.dumps({"t": round(at, 3), "coffee": order.coffee_type,
+                                     "size": order.size, "extras": list(order.extras),
+                                     "customer": order.customer, "table": order.table,
+                                     "temperature": order.temperature},
+                                    ensure_ascii=False) + "\n")
+            written += 1
+    return written
+
+
+def ingredient_name(text):
+    for name in INGREDIENTS:
+        if name.casefold() == str(text).strip().casefold():
+            return name
+    raise ValueError(f"unknown ingredient {text!r} (one of: {', '.join(INGREDIENTS)})")
+
+
+def parse_injections(text):
+    # "Milk@3600,all@7200" -> [(3600.0, "Milk"), (7200.0, "all")]
+    injections = []
+    for part in filter(None, text.split(",")):
+        name, _, at = part.rpartition("@")
+        injections.append((float(at), "all" if name == "all" else ingredient_name(name)))
+    return injections
+
+
+class WaitHistogram:
+    # Queue waits counted per whole second, so percentiles of a week-long
+    # trace take no more memory than those of an hour
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        second = int(seconds)
+        self.counts[second] = self.counts.get(second, 0) + 1
+        self.total += 1
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        target = fraction * (self.total - 1)
+        seen = 0
+        for second in sorted(self.counts):
+            seen += self.counts[second]
+            if seen > target:
+                return second
+        return 0
+
+    def share_below(self, seconds):
+        if not self.total:
+            return 0.0
+        return sum(count for second, count in self.counts.items() if second < seconds) / self.total
+
+
+class ReplayMachine:
+    # The order path of the ModernCoffeeMachine window without the window:
+    # the same checks as start_brewing and on_brew_done, brewing on a
+    # virtual clock, with counters for the replay report
+    def __init__(self, stations=2, max_queue=10, policy=None, sample_every=300.0):
+        self.engine = OrderEngine()
+        self.engine.add_money(10 ** 9)  # replayed customers always have the money
+        self.timeline = VirtualTimeline()
+        self.scheduler = EventBrewScheduler(self.engine.coffee_menu, self.timeline,
+                                            stations=stations, max_queue=max_queue,
+                                            on_done=self.on_brew_done,
+                                            model=BrewModel(self.engine.recipes),
+                                            policy=policy)
+        self.brewing_orders = {}
+        self.orders = 0
+        self.served = 0
+        self.failed = 0
+        self.rejected = {}  # reason -> orders
+        self.revenue = {}   # drink -> cents of brewed orders
+        self.waits = WaitHistogram()
+        self.sample_every = sample_every
+        self.curves = [array("f") for _ in INGREDIENTS]  # fill level every sample_every
+        self.sample_times = array("d")  # trace seconds of each sample
+        self.injections = 0
+        self.skipped = {}  # reason -> trace events that couldn't be applied
+        self.wall_seconds = 0.0
+
+    def start(self):
+        self.scheduler.start()
+        self.timeline.every(self.sample_every, self.sample)
+
+    def sample(self):
+        self.sample_times.append(self.timeline.now())
+        inventory = self.engine.inventory
+        for index, curve in enumerate(self.curves):
+            curve.append(inventory.fraction(index))
+
+    def reject(self, reason):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    def place(self, order, now=None):
+        self.orders += 1
+        if self.scheduler.is_full():
+            self.reject("queue full")
+            return
+        result = self.engine.process_order(order, now)
+        if not result.ok:
+            if result.insufficient:
+                self.reject(f"out of {', '.join(result.insufficient)}")
+            elif "balance" in result.error:
+                self.reject("insufficient balance")
+            else:
+                self.reject("invalid order")
+            return
+        try:
+            job = self.scheduler.submit(order)
+        except QueueFullError:
+            self.engine.cancel_order(result)
+            self.reject("queue full")
+            return
+        self.brewing_orders[job.job_id] = result
+
+    def on_brew_done(self, job):
+        result = self.brewing_orders.pop(job.job_id)
+        if job.status == "done":
+            self.engine.complete_order(result)
+            self.served += 1
+            self.waits.add(job.started_at - job.enqueued_at)
+            drink = job.order.coffee_type
+            self.revenue[drink] = self.revenue.get(drink, 0) + round(result.price * 100)
+        else:
+            self.engine.cancel_order(result)
+            self.failed += 1
+
+    def inject(self, kind, name):
+        # kind "refill" or "stockout"; name an ingredient or "all". A trace
+        # event naming an unknown ingredient is counted and skipped.
+        try:
+            names = INGREDIENTS if name == "all" else [ingredient_name(name)]
+        except ValueError:
+            reason = f"{kind} of unknown ingredient {name!r}"
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+            return
+        for ingredient in names:
+            if kind == "refill":
+                self.engine.refill_resource(ingredient)
+            else:
+                self.engine.inventory.drain(INGREDIENT_IDS[ingredient])
+        self.injections += 1
+
+
+def replay(path, speed=None, stations=2, max_queue=10, policy=None, refill_every=None,
+           injections=(), sample_every=300.0, start=None, sleep=time.sleep,
+           clock=time.perf_counter):
+    # Replay a trace file through a ReplayMachine and return it. speed is
+    # trace seconds per wall-clock second (1 is real time); None runs flat
+    # out. Orders are priced at start (epoch seconds, default now) plus
+    # their trace time, or at their own "ts".
+    machine = ReplayMachine(stations, max_queue, policy, sample_every)
+    timeline = machine.timeline
+    for at, kind, name in injections:
+        timeline.call_later(at, machine.inject, kind, name)
+    if refill_every:
+        timeline.every(refill_every, machine.inject, "refill", "all", delay=refill_every)
+    machine.start()
+    start = time.time() if start is None else start
+
+    wall_start = clock()
+    for at, kind, event in read_trace(path):
+        if speed:
+            delay = wall_start + at / speed - clock()
+            if delay > 0:
+                sleep(delay)
+        timeline.run(until=max(at, timeline.now()))
+        if kind != "order":
+            machine.inject(kind, event[kind])
+            continue
+        machine.place(Order(event.get("coffee", ""), event.get("size", "Medium"),
+                            event.get("extras", ()), customer=event.get("customer", ""),
+                            table=str(event.get("table", "")),
+                            temperature=event.get("temperature", 90)),
+                      datetime.fromtimestamp(event.get("ts", start + at)))
+
+    # Brew what is still queued; periodic timers keep the timeline busy
+    # forever, so stop as soon as the last order is done
+    while machine.brewing_orders:
+        timeline.run(max_events=1)
+    machine.sample()
+    machine.wall_seconds = clock() - wall_start
+    return machine
+
+
+def sparkline(values, width=60):
+    # Lowest level in each of up to width buckets, as block characters
+    if not values:
+        return ""
+    step = -(-len(values) // width)
+    top = len(SPARK) - 1
+    return "".join(SPARK[max(0, min(top, round(min(values[index:index + step]) * top)))]
+                   for index in range(0, len(values), step))
+
+
+def format_report(machine):
+    waits = machine.waits
+    rejected = sum(machine.rejected.values())
+    lines = [f"Replayed {machine.orders} orders, {format_duration(machine.timeline.now())} "
+             f"of trace in {machine.wall_seconds:.1f}s wall clock",
+             f"Served {machine.served}, rejected {rejected}, failed brews {machine.failed}, "
+             f"{machine.injections} refills/stockouts injected"]
+    for reason, count in sorted(machine.rejected.items(), key=lambda item: -item[1]):
+        lines.append(f"  {reason:<40}{count:>8}  {count / machine.orders:>6.1%}")
+    if machine.skipped:
+        lines.append(f"Skipped {sum(machine.skipped.values())} trace events:")
+        for reason, count in sorted(machine.skipped.items(), key=lambda item: -item[1]):
+            lines.append(f"  {reason:<40}{count:>8}")
+
+    lines.append("")
+    if waits.total:
+        lines.append(f"Queue wait: p50 {waits.percentile(0.50)}s  p90 {waits.percentile(0.90)}s  "
+                     f"p95 {waits.percentile(0.95)}s  p99 {waits.percentile(0.99)}s  "
+                     f"max {waits.max:.0f}s")
+        below = 0.0
+        for low, high in zip((0,) + WAIT_BUCKETS, WAIT_BUCKETS + (None,)):
+            share = (1.0 if high is None else waits.share_below(high)) - below
+            below += share
+            label = f"{low}-{high}s" if high is not None else f"{low}s+"
+            lines.append(f"  {label:<10}{'#' * round(share * 40):<40} {share:>6.1%}")
+
+    revenue = sum(machine.revenue.values())
+    lines.append("")
+    lines.append(f"Revenue: ${revenue / 100:,.2f}" + (
+        f" (${revenue / 100 / machine.served:.2f} per drink)" if machine.served else ""))
+    for drink, cents in sorted(machine.revenue.items(), key=lambda item: -item[1]):
+        lines.append(f"  {drink:<24}${cents / 100:>12,.2f}")
+
+    lines.append("")
+    lines.append(f"Ingredient levels, lowest per bucket (sampled every "
+                 f"{machine.sample_every:.0f}s of trace time):")
+    for name, curve in zip(INGREDIENTS, machine.curves):
+        lowest = min(curve) if curve else 1.0
+        lines.append(f"  {name:<16}|{sparkline(curve)}| min {lowest:.0%}")
+    return "\n".join(lines)
+
+
+def write_curves(machine, path):
+    # Depletion curves as CSV: trace seconds, then one fill fraction per ingredient.
+    # The last row is the end of the replay, whenever that fell.
+    with open(path, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["t"] + list(INGREDIENTS))
+        for at, *levels in zip(machine.sample_times, *machine.curves):
+            writer.writerow([round(at, 1)] + [round(level, 4) for level in levels])
+
+
+def parse_speed(text):
+    # "max" -> None (no pacing), "1" -> real time, "60" -> an hour a minute
+    if text == "max":
+        return None
+    speed = float(text)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay an order trace against the headless order path")
+    parser.add_argument("trace", help="JSON-lines or CSV trace, or a journal.log")
+    parser.add_argument("--speed", type=parse_speed, default=None,
+                        help='"max" (default), 1 for real time or N times faster')
+    parser.add_argument("--stations", type=int, default=2)
+    parser.add_argument("--max-queue", type=int, default=10)
+    parser.add_argument("--policy", choices=("fifo", "batch"), default="fifo")
+    parser.add_argument("--max-wait", type=float, default=120.0,
+                        help="seconds the batching policy may hold an order back")
+    parser.add_argument("--refill-every", type=float, default=None,
+                        help="refill every ingredient this often, in trace seconds")
+    parser.add_argument("--refill", default="",
+                        help='extra refills, e.g. "Milk@3600,all@43200"')
+    parser.add_argument("--stockout", default="",
+                        help='ingredients that run dry, e.g. "Milk@7200,Coffee@9000"')
+    parser.add_argument("--sample-every", type=float, default=300.0,
+                        help="trace seconds between ingredient level samples")
+    parser.add_argument("--curves", help="write the depletion curves to this CSV file")
+    parser.add_argument("--generate", type=float, metavar="HOURS",
+                        help="first write a synthetic trace of this many hours to TRACE")
+    parser.add_argument("--rate", type=float, default=30.0,
+                        help="orders per hour off-peak for --generate")
+    parser.add_argument("--peak-factor", type=float, default=3.0)
+    parser.add_argument("--temperatures", default="90",
+                        help='order temperature mix for --generate, e.g. "70:1,90:4"')
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    try:
+        injections = ([(at, "refill", name) for at, name in parse_injections(args.refill)]
+                      + [(at, "stockout", name) for at, name in parse_injections(args.stockout)])
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.generate:
+        written = write_synthetic_trace(args.trace, args.generate, args.rate,
+                                        args.peak_factor, args.seed,
+                                        parse_temperatures(args.temperatures))
+        print(f"Wrote {written} orders over {args.generate:g}h to {args.trace}")
+
+    policy = BatchingPolicy(max_wait=args.max_wait) if args.policy == "batch" else FifoPolicy()
+    machine = replay(args.trace, args.speed, args.stations, args.max_queue, policy,
+                     args.refill_every, injections, args.sample_every)
+    print(format_report(machine))
+    if args.curves:
+        write_curves(machine, args.curves)
+        print(f"Depletion curves written to {args.curves}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import heapq
+import itertools
+from collections import deque
+
+from events import publish_job_event
+from metrics import Metrics
+
+
+# Shared machine resources a brew step can hold
+GRINDER = "grinder"
+BOILER = "boiler"
+STEAMER = "steamer"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def build_brew_steps(order, coffee_menu):
+    # (status text, seconds, shared resource, step name) for each step of a drink
+    has_milk = coffee_menu[order.coffee_type]["milk"] > 0
+    steps = [
+        ("☕ Starting to prepare your coffee...", 1, None, "start"),
+        ("⚙️ Grinding coffee beans...", 2, GRINDER, "grind"),
+        (f"🌡️ Heating water to {order.temperature}°C...", 2, BOILER, "heat_water"),
+        ("⏳ Preparing espresso...", 2, BOILER, "espresso"),
+        ("🥛 Heating milk..." if has_milk else None, 2, STEAMER, "heat_milk"),
+        ("🌪️ Frothing milk..." if has_milk else None, 2, STEAMER, "froth"),
+        (f"👨‍🍳 Preparing {order.coffee_type}...", 2, None, "prepare"),
+        ("🍯 Adding extras..." if order.extras else None, 1, None, "extras"),
+        ("✨ Your coffee is ready! Enjoy!", 2, None, "ready")
+    ]
+
+    return [step for step in steps if step[0] is not None]
+
+
+def plan_steps(order, coffee_menu, model, now):
+    # Fixed demo durations, or estimates from a BrewModel
+    if model is None:
+        return build_brew_steps(order, coffee_menu)
+    return model.steps(order, now)
+
+
+def uses_steamer(job):
+    return any(resource == STEAMER for _, _, resource, _ in job.steps)
+
+
+class FifoPolicy:
+    # Waiting drinks start in arrival order
+    name = "fifo"
+
+    def pick(self, pending, previous, now):
+        return 0
+
+
+class BatchingPolicy:
+    # Starts the waiting drink that changes over most cheaply from the one
+    # started last: a temperature within tolerance first (reheating the
+    # boiler is the slowest changeover), then the same milk use, then the
+    # most shared and fewest new extras; ties go to the earlier order. Only
+    # the first `window` waiting drinks are considered. Every drink started
+    # ahead of an older one adds its planned duration to that order's
+    # delay, and a jump that would push any order's delay past max_wait
+    # seconds starts that order instead, so no order waits more than
+    # max_wait longer than it would have in arrival order.
+    name = "batch"
+
+    def __init__(self, max_wait=120.0, temperature_tolerance=3, window=12):
+        self.max_wait = max_wait
+        self.temperature_tolerance = temperature_tolerance
+        self.window = window
+        self.delays = {}  # job id -> seconds it has been held back so far
+        self.max_delay = 0.0
+
+    def pick(self, pending, previous, now):
+        # Index into pending (oldest first) of the job to start
+        index = self._best(pending, previous) if previous is not None else 0
+        chosen = pending[index]
+        delays = self.delays
+        # Falling back to an older job puts its own (maybe longer) duration
+        # in front of the jobs ahead of it, so check again until none of
+        # them goes over; pending[0] always passes
+        while True:
+            for older, job in enumerate(itertools.islice(pending, index)):
+                if delays.get(job.job_id, 0.0) + chosen.duration > self.max_wait:
+                    index, chosen = older, job
+                    break
+            else:
+                break
+        for job in itertools.islice(pending, index):
+            delay = delays[job.job_id] = delays.get(job.job_id, 0.0) + chosen.duration
+            self.max_delay = max(self.max_delay, delay)
+        delays.pop(chosen.job_id, None)
+        return index
+
+    def _best(self, pending, previous):
+        milk = uses_steamer(previous)
+        temperature = previous.order.temperature
+        extras = set(previous.order.extras)
+        best_index, best_score = 0, None
+        for index, job in enumerate(itertools.islice(pending, self.window)):
+            job_extras = set(job.order.extras)
+            score = (abs(job.order.temperature - temperature) <= self.temperature_tolerance,
+                     uses_steamer(job) == milk,
+                     len(job_extras & extras) - len(job_extras - extras))
+            if best_score is None or score > best_score:
+                best_index, best_score = index, score
+        return best_index
+
+
+def estimate_etas(active, waiting, stations, now):
+    # Greedy estimate: each queued job goes to the station that frees up first
+    estimates = {}
+    free_at = []
+    for job in active:
+        left = job.remaining(now)
+        estimates[job.job_id] = left
+        free_at.append(left)
+    free_at.extend([0.0] * max(0, stations - len(free_at)))
+    heapq.heapify(free_at)
+
+    for job in waiting:
+        finish = heapq.heappop(free_at) + job.duration
+        estimates[job.job_id] = finish
+        heapq.heappush(free_at, finish)
+
+    return estimates
+
+
+class BrewJob:
+    def __init__(self, job_id, order, steps):
+        self.job_id = job_id
+        self.order = order
+        self.steps = steps
+        self.duration = sum(step[1] for step in steps)
+        self.amounts = None  # recipe amounts when queued, for a BrewModel
+        self.status = "queued"
+        self.current_step = ""
+        self.enqueued_at = None
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.step_index = 0
+        self.step_started = None
+        self.wait_started = None
+
+    def remaining(self, now):
+        if self.started_at is None:
+            return self.duration
+        return max(0.0, self.duration - (now - self.started_at))
+
+
+class EventBrewScheduler:
+    # Brew stations driven by timers on a shared Timeline instead of sleeping
+    # station threads. All callbacks run on the timeline's loop, so with a
+    # TkTimeline they may touch widgets directly.
+    def __init__(self, coffee_menu, timeline, stations=2, grinders=1, boilers=1,
+                 steamers=1, max_queue=20, on_step=None, on_done=None, metrics=None,
+                 events=None, model=None, policy=None):
+        self.coffee_menu = coffee_menu
+        self.timeline = timeline
+        self.stations = stations
+        self.max_queue = max_queue
+        self.on_step = on_step
+        self.on_done = on_done
+        self.metrics = metrics or Metrics()
+        self.events = events  # EventBus for per-order progress, optional
+        self.model = model  # BrewModel for size/temperature-aware durations, optional
+        self.policy = policy or FifoPolicy()  # which waiting drink starts next
+
+        self.resources = {GRINDER: grinders, BOILER: boilers, STEAMER: steamers}
+        self.jobs = {}
+        self._pending = deque()
+        self._active = {}
+        self._waiters = {name: deque() for name in self.resources}
+        self._ids = itertools.count(1)
+        self._last_started = None
+
+    def start(self):
+        self._dispatch()
+
+    def is_full(self):
+        return len(self._pending) >= self.max_queue
+
+    def queue_depth(self):
+        return len(self._pending)
+
+    def in_progress(self):
+        return len(self._active)
+
+    def submit(self, order):
+        if self.is_full():
+            raise QueueFullError(f"Brew queue is full ({self.max_queue} orders)")
+        now = self.timeline.now()
+        job = BrewJob(next(self._ids), order,
+                      plan_steps(order, self.coffee_menu, self.model, now))
+        if self.model is not None:
+            job.amounts = self.model.amounts(order)
+        job.enqueued_at = now
+        self.jobs[job.job_id] = job
+        self._pending.append(job)
+        publish_job_event(self.events, job, "queued")
+        self._dispatch()
+        return job
+
+    def eta(self, job_id):
+        return self.etas().get(job_id)
+
+    def etas(self):
+        return estimate_etas(self._active.values(), self._pending,
+                             self.stations, self.timeline.now())
+
+    def _dispatch(self):
+        while self._pending and len(self._active) < self.stations:
+            now = self.timeline.now()
+            index = self.policy.pick(self._pending, self._last_started, now)
+            job = self._pending[index]
+            del self._pending[index]
+            if index:
+                self.metrics.inc("reordered_jobs_total", policy=self.policy.name)
+            self._last_started = job
+            job.status = "brewing"
+            job.started_at = now
+            self._active[job.job_id] = job
+            self.metrics.observe("queue_wait_seconds", job.started_at - job.enqueued_at)
+            self._advance(job)
+
+    def _advance(self, job):
+        if job.step_index >= len(job.steps):
+            self._finish(job)
+            return
+
+        step, duration, resource, name = job.steps[job.step_index]
+        now = self.timeline.now()
+        if resource is not None:
+            if self.resources[resource] == 0:
+                # Wait for another station to release the shared resource
+                job.wait_started = now
+                self._waiters[resource].append(job)
+                return
+            self.resources[resource] -= 1
+            if job.wait_started is not None:
+                self.metrics.observe("resource_wait_seconds", now - job.wait_started,
+                                     resource=resource)
+                job.wait_started = None
+
+        try:
+            if self.model is not None:
+                duration = self.model.duration(job.order, name, now, amounts=job.amounts)
+            job.current_step = step
+            job.step_started = now
+            publish_job_event(self.events, job, "step", step=name, text=step)
+            if self.on_step:
+                self.on_step(job, step)
+        except Exception as error:
+            # Fail the job rather than leave its station busy forever
+            if resource is not None:
+                self._release(resource)
+            self._finish(job, error)
+            return
+        self.timeline.call_later(duration, self._step_done, job)
+
+    def _step_done(self, job):
+        _, _, resource, name = job.steps[job.step_index]
+        self.metrics.observe("brew_step_seconds", self.timeline.now() - job.step_started,
+                             step=name)
+        job.step_index += 1
+        if resource is not None:
+            self._release(resource)
+        self._advance(job)
+
+    def _release(self, resource):
+        self.resources[resource] += 1
+        if self._waiters[resource]:
+            self._advance(self._waiters[resource].popleft())
+
+    def _finish(self, job, error=None):
+        job.status = "done" if error is None else "failed"
+        job.error = error
+        job.finished_at = self.timeline.now()
+        self._active.pop(job.job_id, None)
+        self.jobs.pop(job.job_id, None)
+        self.metrics.observe("brew_seconds", job.finished_at - job.started_at,
+                             drink=job.order.coffee_type)
+        publish_job_event(self.events, job, job.status)
+        if self.on_done:
+            self.on_done(job)
+        self._dispatch()
@@ -0,0 +1,156 @@
+import argparse
+import sys
+
+from bench import OrderGenerator, percentile
+from brewmodel import BrewModel
+from engine import OrderEngine
+from scheduler import BatchingPolicy, EventBrewScheduler, FifoPolicy, QueueFullError
+from timeline import VirtualTimeline
+
+
+def simulate_day(stations=2, hours=14.0, rate_per_hour=30.0, burst_factor=3.0,
+                 burst_every=4 * 3600, burst_length=3600, max_queue=20, seed=1,
+                 boilers=1, grinders=1, steamers=1, policy=None, temperatures=None):
+    # Replay a day of synthetic orders against the brew pipeline on a virtual
+    # clock. Orders that find the queue full count as walk-aways.
+    engine = OrderEngine()
+    policy = policy or FifoPolicy()
+    timeline = VirtualTimeline()
+    finished = []
+    scheduler = EventBrewScheduler(engine.coffee_menu, timeline, stations=stations,
+                                   grinders=grinders, boilers=boilers, steamers=steamers,
+                                   max_queue=max_queue, on_done=finished.append,
+                                   model=BrewModel(engine.recipes), policy=policy)
+    generator = OrderGenerator(rate=rate_per_hour / 3600, burst_every=burst_every,
+                               burst_length=burst_length, burst_factor=burst_factor,
+                               seed=seed, temperatures=temperatures)
+
+    horizon = hours * 3600
+    state = {"walked_away": 0, "peak_queue": 0, "arrivals": 0}
+
+    def arrive(order):
+        state["arrivals"] += 1
+        try:
+            scheduler.submit(order)
+        except QueueFullError:
+            state["walked_away"] += 1
+        state["peak_queue"] = max(state["peak_queue"], scheduler.queue_depth())
+
+    # Arrivals are scheduled one ahead so a long day never sits in memory
+    arrivals = generator.stream(10 ** 9)
+
+    def schedule_next():
+        at, order = next(arrivals)
+        if at >= horizon:
+            return
+        timeline.call_later(at - timeline.now(), lambda: (arrive(order), schedule_next()))
+
+    schedule_next()
+    scheduler.start()
+    timeline.run()
+
+    waits = sorted(job.started_at - job.enqueued_at for job in finished)
+    totals = sorted(job.finished_at - job.enqueued_at for job in finished)
+    busy = sum(job.finished_at - job.started_at for job in finished)
+    end = max(horizon, timeline.now())
+    return {
+        "stations": stations,
+        "policy": policy.name,
+        "arrivals": state["arrivals"],
+        "served": len(finished),
+        "walked_away": state["walked_away"],
+        "peak_queue": state["peak_queue"],
+        "wait_p50": round(percentile(waits, 0.50), 1),
+        "wait_p95": round(percentile(waits, 0.95), 1),
+        "wait_max": round(waits[-1] if waits else 0.0, 1),
+        "order_to_cup_p95": round(percentile(totals, 0.95), 1),
+        "utilization": round(busy / (stations * end), 3),
+        # Brewed drinks per hour a station spends brewing: what reordering buys
+        "drinks_per_station_hour": round(len(finished) * 3600 / busy, 2) if busy else 0.0,
+        "max_delay": round(getattr(policy, "max_delay", 0.0), 1),
+    }
+
+
+def parse_temperatures(text):
+    # "70:1,90:4" -> {70: 1.0, 90: 4.0}; a bare "90" means every order
+    weights = {}
+    for part in text.split(","):
+        value, _, weight = part.partition(":")
+        weights[int(value)] = float(weight or 1)
+    return weights
+
+
+def parse_stations(text):
+    # "1-4" or "1,2,4"
+    if "-" in text:
+        low, high = text.split("-")
+        return list(range(int(low), int(high) + 1))
+    return [int(part) for part in text.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a day of orders on a virtual clock")
+    parser.add_argument("--stations", default="1-4", help='e.g. "1-4" or "1,2,4"')
+    parser.add_argument("--hours", type=float, default=14.0)
+    parser.add_argument("--rate", type=float, default=30.0, help="orders per hour off-peak")
+    parser.add_argument("--peak-factor", type=float, default=3.0)
+    parser.add_argument("--boilers", type=int, default=1)
+    parser.add_argument("--grinders", type=int, default=1)
+    parser.add_argument("--steamers", type=int, default=1)
+    parser.add_argument("--max-queue", type=int, default=20)
+    parser.add_argument("--target-wait", type=float, default=120.0,
+                        help="p95 queue wait in seconds the plan has to meet")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--policy", choices=("fifo", "batch", "compare"), default="fifo",
+                        help="queue order; compare runs both and reports the gain")
+    parser.add_argument("--max-wait", type=float, default=120.0,
+                        help="seconds the batching policy may hold an order back")
+    parser.add_argument("--temperatures", default="90",
+                        help='order temperature mix, e.g. "70:1,80:2,90:5,95:2"')
+    args = parser.parse_args(argv)
+
+    policies = {"fifo": [FifoPolicy], "batch": [BatchingPolicy],
+                "compare": [FifoPolicy, BatchingPolicy]}[args.policy]
+    temperatures = parse_temperatures(args.temperatures)
+
+    print(f"{'stations':>8} {'policy':>6} {'orders':>7} {'served':>7} {'walked':>7} "
+          f"{'peak q':>7} {'wait p50':>9} {'wait p95':>9} {'wait max':>9} {'cup p95':>8} "
+          f"{'drinks/h':>9} {'util':>6}")
+    enough = None
+    for stations in parse_stations(args.stations):
+        results = []
+        for make_policy in policies:
+            policy = (BatchingPolicy(max_wait=args.max_wait)
+                      if make_policy is BatchingPolicy else make_policy())
+            result = simulate_day(stations, args.hours, args.rate, args.peak_factor,
+                                  max_queue=args.max_queue, seed=args.seed,
+                                  boilers=args.boilers, grinders=args.grinders,
+                                  steamers=args.steamers, policy=policy,
+                                  temperatures=temperatures)
+            results.append(result)
+            print(f"{stations:>8} {result['policy']:>6} {result['arrivals']:>7} "
+                  f"{result['served']:>7} {result['walked_away']:>7} "
+                  f"{result['peak_queue']:>7} {result['wait_p50']:>8}s "
+                  f"{result['wait_p95']:>8}s {result['wait_max']:>8}s "
+                  f"{result['order_to_cup_p95']:>7}s "
+                  f"{result['drinks_per_station_hour']:>9} {result['utilization']:>6.0%}")
+        if len(results) == 2:
+            fifo, batch = results
+            gain = batch["drinks_per_station_hour"] / fifo["drinks_per_station_hour"] - 1
+            print(f"{'':>8} batching: {gain:+.1%} drinks per station-hour, "
+                  f"{batch['walked_away'] - fifo['walked_away']:+d} walk-aways, "
+                  f"p95 wait {fifo['wait_p95']}s -> {batch['wait_p95']}s, "
+                  f"no order held back more than {batch['max_delay']}s")
+        result = results[-1]
+        if enough is None and not result["walked_away"] and result["wait_p95"] <= args.target_wait:
+            enough = stations
+
+    if enough is None:
+        print(f"No station count tried keeps p95 wait under {args.target_wait:.0f}s")
+    else:
+        print(f"{enough} station(s) keep p95 wait under {args.target_wait:.0f}s at this peak")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+import pytest
+
+from analytics import ColumnStore, ShardedColumnStore, SalesAnalytics
+from engine import Order, OrderEngine
+
+
+def test_rows_in_range_when_history_is_out_of_order(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    for ts in (100.0, 300.0, 200.0, 50.0, 250.0):
+        store.append(ts, "Latte", [], ts / 100, 0.0)
+    assert [row[0] for row in store.rows(100.0, 260.0)] == [100.0, 200.0, 250.0]
+    assert store.query(0.0, 1000.0).orders == 5
+
+
+def test_sorted_history_reads_only_the_range(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    for ts in range(10):
+        store.append(float(ts), "Mocha" if ts % 2 else "Latte", ["Extra Shot"], 1.0, 0.0)
+    rows = list(store.rows(3.0, 6.0))
+    assert [(row[0], row[1], row[2]) for row in rows] == [
+        (3.0, "Mocha", ["Extra Shot"]), (4.0, "Latte", ["Extra Shot"]),
+        (5.0, "Mocha", ["Extra Shot"])]
+
+
+def test_extras_past_32_bits_survive_and_64_is_the_limit(tmp_path):
+    store = ColumnStore(str(tmp_path))
+    names = [f"extra-{index}" for index in range(64)]
+    store.append(1.0, "Latte", names[:40], 1.0, 0.0)
+    store.append(2.0, "Latte", names[40:], 1.0, 0.0)
+    store.flush()
+    rows = list(ColumnStore(str(tmp_path)).rows(0.0, 10.0))
+    assert rows[0][2] == names[:40] and rows[1][2] == names[40:]
+    with pytest.raises(ValueError):
+        store.append(3.0, "Latte", ["one too many"], 1.0, 0.0)
+
+
+def test_history_is_stamped_at_completion(tmp_path):
+    engine = OrderEngine()
+    engine.add_money(100, "cash-1")
+    analytics = SalesAnalytics(ShardedColumnStore(str(tmp_path)))
+    engine.add_listener(analytics.on_order_event)
+    first = engine.process_order(Order("Latte"))
+    second = engine.process_order(Order("Espresso"))
+    engine.complete_order(second)
+    engine.complete_order(first)
+    rows = list(analytics.store.rows(0.0, float("inf")))
+    assert [row[1] for row in rows] == ["Espresso", "Latte"]
+    assert rows[1][0] == first.completed_at.timestamp()
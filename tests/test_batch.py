@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import pytest
+
+import batch
+from batch import evaluate_batch
+from engine import Order, OrderEngine
+from inventory import INGREDIENTS
+
+
+def make_orders():
+    sizes = ("Small", "Medium", "Large")
+    drinks = ("Latte", "Mocha", "Espresso", "Cappuccino", "Americano")
+    extras = ((), ("Extra Shot",), ("Vanilla Syrup", "Whipped Cream"))
+    orders = [Order(drink, sizes[index % 3], extras[index % 3])
+              for index, drink in enumerate(drinks * 8)]
+    orders.insert(3, Order("Unknown"))
+    return orders
+
+
+def inputs(engine, orders):
+    # What evaluate_batch hands to either path
+    result = evaluate_batch(engine, orders, datetime(2026, 3, 6, 15))
+    rows = [None if error else engine.recipes.recipe_for(order).amounts
+            for order, error in zip(orders, result.errors)]
+    available = [engine.inventory.available(index) for index in range(len(INGREDIENTS))]
+    return result, (rows, result.cents, result.discounts, available, result.errors)
+
+
+def test_prices_match_what_the_engine_charges():
+    engine = OrderEngine()
+    now = datetime(2026, 3, 6, 15)
+    orders = make_orders()
+    result = evaluate_batch(engine, orders, now)
+    for order, cents, error in zip(orders, result.cents, result.errors):
+        if not error:
+            assert cents == engine.quote_cents(order, now)[0]
+    assert result.errors[3] and not result.feasible[3]
+    assert 0 < result.prefix < len(orders)
+    assert result.prefix_total == sum(result.cents[:result.prefix]) / 100
+
+
+def test_python_prefix_stops_at_the_first_order_stock_cannot_cover():
+    engine = OrderEngine()
+    orders = make_orders()
+    _, args = inputs(engine, orders)
+    python = batch._evaluate_python(*args)
+    for order in orders[:python.prefix]:
+        if not engine.validate(order):
+            reservation, _ = engine.inventory.reserve(engine.recipes.recipe_for(order).amounts)
+            assert reservation is not None
+    assert engine.check_resources(orders[python.prefix])
+
+
+def test_numpy_and_python_paths_agree():
+    pytest.importorskip("numpy")
+    engine = OrderEngine()
+    _, args = inputs(engine, make_orders())
+    python = batch._evaluate_python(*args)
+    vectorised = batch._evaluate_numpy(*args)
+    assert vectorised.cents == python.cents
+    assert vectorised.prices == python.prices
+    assert vectorised.feasible == python.feasible
+    assert vectorised.prefix == python.prefix
@@ -0,0 +1,62 @@
+from engine import Order, OrderEngine
+from fleet import FleetCoordinator, MachineNode
+from inventory import INGREDIENTS
+from scheduler import EventBrewScheduler
+from timeline import VirtualTimeline
+
+
+def make_node(name):
+    engine = OrderEngine()
+    scheduler = EventBrewScheduler(engine.coffee_menu, VirtualTimeline())
+
+    def accept(order):
+        result = engine.process_order(order, prepaid=True)
+        if result.ok:
+            scheduler.submit(order)
+        return result
+
+    return MachineNode(name, engine, scheduler, accept)
+
+
+def test_re_registering_does_not_repeat_refunds():
+    coordinator = FleetCoordinator()
+    payer, brewer = make_node("A"), make_node("B")
+    for index in range(len(INGREDIENTS)):
+        payer.engine.inventory.drain(index)
+    coordinator.register(payer)
+    coordinator.register(brewer)
+    coordinator.register(brewer)
+    assert len(brewer.engine.listeners) == 1
+
+    name, result = coordinator.submit(Order("Espresso"), origin="A")
+    assert name == "B" and result.prepaid
+    assert brewer.engine.cancel_order(result)
+    assert payer.engine.money == result.price
+    assert brewer.engine.money == 0
+
+
+def test_registering_a_restarted_machine_drops_the_old_listener():
+    coordinator = FleetCoordinator()
+    old, new = make_node("A"), make_node("A")
+    coordinator.register(old)
+    coordinator.unregister("A")
+    coordinator.register(new)
+    assert old.engine.listeners == [] and len(new.engine.listeners) == 1
+
+
+def test_refund_waits_for_a_payer_that_has_unregistered():
+    coordinator = FleetCoordinator()
+    payer, brewer = make_node("A"), make_node("B")
+    for index in range(len(INGREDIENTS)):
+        payer.engine.inventory.drain(index)
+    coordinator.register(payer)
+    coordinator.register(brewer)
+    _, result = coordinator.submit(Order("Latte"), origin="A")
+    coordinator.unregister("A")
+    assert brewer.engine.cancel_order(result)
+    assert payer.engine.money == 0
+
+    coordinator.register(payer)
+    assert payer.engine.money == result.price
+    coordinator.register(payer)
+    assert payer.engine.money == result.price
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from engine import Order, OrderEngine
+from forecast import RefillForecaster
+from inventory import COFFEE, empty_vector
+
+
+def coffee(grams):
+    amounts = empty_vector()
+    amounts[COFFEE] = grams
+    return amounts
+
+
+def hour_of(timestamp):
+    return datetime.fromtimestamp(timestamp).hour
+
+
+def test_empty_hours_fold_as_zero_consumption():
+    forecaster = RefillForecaster(OrderEngine().inventory, alpha=0.5)
+    start = 1000 * 3600.0
+    forecaster.record(coffee(3600), start)
+    forecaster.record(coffee(3600), start + 3600)
+    # Three quiet hours, then an order
+    forecaster.record(coffee(0), start + 5 * 3600)
+    assert forecaster.profile[hour_of(start)][COFFEE] == 1.0
+    assert forecaster.profile[hour_of(start + 3600)][COFFEE] == 1.0
+    for offset in (2, 3, 4):
+        assert forecaster.profile_seen[hour_of(start + offset * 3600)]
+        assert forecaster.profile[hour_of(start + offset * 3600)][COFFEE] == 0.0
+
+
+def test_a_quiet_day_decays_every_slot_once():
+    forecaster = RefillForecaster(OrderEngine().inventory, alpha=0.5)
+    start = 1000 * 3600.0
+    for offset in range(24):
+        forecaster.record(coffee(3600), start + offset * 3600)
+    forecaster.record(coffee(0), start + 48 * 3600)
+    assert forecaster.profile[hour_of(start + 3600)][COFFEE] == 0.5
+    # The last busy hour was folded with its own usage, then once as empty
+    assert forecaster.profile[hour_of(start + 23 * 3600)][COFFEE] == 0.5
+
+
+def test_consumption_is_bucketed_by_completion_time():
+    engine = OrderEngine()
+    engine.add_money(100, "cash-1")
+    forecaster = RefillForecaster(engine.inventory)
+    engine.add_listener(forecaster.on_order_event)
+    result = engine.process_order(Order("Espresso"))
+    result.timestamp = datetime(2020, 1, 1, 9, 59)
+    engine.complete_order(result)
+    assert forecaster._hour_key == int(result.completed_at.timestamp() // 3600)
@@ -0,0 +1,132 @@
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+from engine import Order, OrderEngine
+from ingest import OrderIngestServer, parse_payment
+from scheduler import EventBrewScheduler
+from timeline import VirtualTimeline
+
+
+def make_server():
+    engine = OrderEngine()
+    scheduler = EventBrewScheduler(engine.coffee_menu, VirtualTimeline())
+
+    def accept(order):
+        # What the machine does for API orders: charge, then queue
+        result = engine.process_order(order)
+        if not result.ok:
+            return result, None
+        return result, scheduler.submit(order)
+
+    return OrderIngestServer(engine, scheduler, accept), engine
+
+
+def test_api_orders_are_charged():
+    server, engine = make_server()
+    order = Order("Espresso", table="3")
+    code, body = server._accept(order)
+    assert code == 402 and engine.total_sales == 0
+
+    txn_id, amount, table, _ = parse_payment({"txn": "pos-1", "amount": 50, "table": "3"})
+    assert server.pay(txn_id, amount, table)[0] == 200
+    assert server.pay(txn_id, amount, table)[1]["duplicate"]
+    code, body = server._accept(order)
+    assert code == 202
+    assert engine.money == 50 - body["price"]
+    assert engine.total_sales == body["price"]
+
+
+def test_api_orders_go_on_the_open_tab():
+    server, engine = make_server()
+    engine.open_tab("9", limit=100)
+    code, body = server._accept(Order("Latte", table="9"))
+    assert code == 202
+    assert engine.money == 0
+    assert engine.settle_tab("9", txn_id="settle-9") == body["price"]
+
+
+def test_timed_out_order_in_the_inbox_is_never_brewed():
+    server, engine = make_server()
+    engine.add_money(100)
+    server.timeout = 0.01
+    future = server.submit(Order("Espresso"))
+    assert server.wait(future) == (503, {"error": "machine did not respond"})
+    server.drain()
+    assert engine.total_sales == 0 and not server.orders
+
+
+def test_timed_out_order_already_on_the_loop_gets_its_answer():
+    server, engine = make_server()
+    engine.add_money(100)
+    server.timeout = 0.2
+    future = server.submit(Order("Espresso"))
+    server._inbox.get_nowait()
+    future.set_running_or_notify_cancel()
+    threading.Timer(0.3, lambda: future.set_result((202, {"id": 1}))).start()
+    assert server.wait(future) == (202, {"id": 1})
+
+
+def test_stalled_loop_answers_504_instead_of_hanging():
+    server, engine = make_server()
+    server.timeout = 0.01
+    future = server.submit(Order("Espresso"))
+    server._inbox.get_nowait()
+    future.set_running_or_notify_cancel()
+    code, _ = server.wait(future)
+    assert code == 504
+
+
+def request(server, path, token=None, body=None):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    data = None if body is None else json.dumps(body).encode()
+    req = urllib.request.Request(f"http://127.0.0.1:{server.port}{path}", data, headers)
+    try:
+        with urllib.request.urlopen(req, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def test_token_is_required_when_set():
+    server, engine = make_server()
+    server.port = 0
+    server.token = "s3cret"
+    server.start()
+    try:
+        assert server.host == "127.0.0.1"
+        assert request(server, "/menu") == 401
+        assert request(server, "/menu", token="wrong") == 401
+        assert request(server, "/menu", token="s3cret") == 200
+        payment = {"txn": "t1", "amount": 5}
+        assert request(server, "/payments", body=payment) == 401
+        assert engine.money == 0
+        assert request(server, "/payments", token="s3cret", body=payment) == 200
+        assert engine.money == 5
+    finally:
+        server.stop()
+
+
+def raw_post(server, length, body=b""):
+    # Status code for a POST /orders with a hand-written Content-Length
+    with socket.create_connection(("127.0.0.1", server.port), timeout=5) as connection:
+        connection.sendall(b"POST /orders HTTP/1.1\r\nHost: x\r\n"
+                           b"Content-Length: " + length + b"\r\n\r\n" + body)
+        return int(connection.recv(1024).split()[1])
+
+
+def test_bad_content_length_is_refused():
+    server, _ = make_server()
+    server.port = 0
+    server.start()
+    try:
+        assert raw_post(server, b"-1") == 400
+        assert raw_post(server, b"abc") == 400
+        assert raw_post(server, b"%d" % (64 * 1024 + 1)) == 413
+        assert raw_post(server, b"4", b"null") == 400
+    finally:
+        server.stop()
@@ -0,0 +1,109 @@
+from engine import Order, OrderEngine
+from inventory import INGREDIENTS, MILK
+from journal import Journal
+from ledger import CASH, compare_states, replay_journal, tab_account
+
+
+def open_engine(directory):
+    engine = OrderEngine()
+    journal = Journal(str(directory))
+    journal.recover(engine)
+    journal.open()
+    engine.journal = journal
+    return engine
+
+
+def crash(engine):
+    # Everything appended is on disk; nothing else survives
+    engine.journal.sync()
+    engine.journal.close()
+
+
+def levels(engine):
+    return [engine.inventory.available(index) for index in range(len(INGREDIENTS))]
+
+
+def test_recovery_rebuilds_ledger_and_stock(tmp_path):
+    engine = open_engine(tmp_path)
+    engine.add_money(100, txn_id="deposit-1")
+    engine.add_money(100, txn_id="deposit-1")
+    for size in ("Small", "Large"):
+        result = engine.process_order(Order("Latte", size))
+        engine.complete_order(result)
+    cancelled = engine.process_order(Order("Espresso"))
+    engine.cancel_order(cancelled)
+    live = engine.ledger.state()
+    crash(engine)
+
+    recovered = open_engine(tmp_path)
+    assert recovered.ledger.state()["balances"] == live["balances"]
+    assert recovered.ledger.state()["sales"] == live["sales"]
+    assert recovered.drinks_sold == engine.drinks_sold
+    assert levels(recovered) == levels(engine)
+    assert recovered.reconcile() == []
+    crash(recovered)
+
+
+def test_refill_while_an_order_is_brewing_recovers_live_stock(tmp_path):
+    engine = open_engine(tmp_path)
+    engine.add_money(100)
+    brewing = engine.process_order(Order("Latte"))
+    engine.refill_resource("Milk")
+    engine.complete_order(brewing)
+    assert engine.inventory.levels[MILK] < engine.inventory.capacity[MILK]
+    crash(engine)
+
+    recovered = open_engine(tmp_path)
+    assert levels(recovered) == levels(engine)
+    crash(recovered)
+
+
+def test_refill_then_cancel_recovers_live_stock(tmp_path):
+    engine = open_engine(tmp_path)
+    engine.add_money(100)
+    brewing = engine.process_order(Order("Latte"))
+    engine.refill_resource("Milk")
+    engine.cancel_order(brewing)
+    crash(engine)
+
+    recovered = open_engine(tmp_path)
+    assert levels(recovered) == levels(engine)
+    crash(recovered)
+
+
+def test_recovery_from_snapshot_plus_tail(tmp_path):
+    engine = open_engine(tmp_path)
+    engine.journal.snapshot_every = 5
+    engine.add_money(1000)
+    for _ in range(12):
+        engine.complete_order(engine.process_order(Order("Espresso")))
+    engine.refill_resource("Coffee")
+    crash(engine)
+
+    recovered = open_engine(tmp_path)
+    assert recovered.ledger.state()["balances"] == engine.ledger.state()["balances"]
+    assert levels(recovered) == levels(engine)
+    crash(recovered)
+
+
+def test_ledger_replay_matches_tabs_and_settlements(tmp_path):
+    engine = open_engine(tmp_path)
+    engine.open_tab("5", limit=200)
+    engine.add_money(20, txn_id="pos-1", table="5")
+    engine.complete_order(engine.process_order(Order("Mocha", table="5")))
+    engine.cancel_order(engine.process_order(Order("Latte", table="5")))
+    engine.settle_tab("5", txn_id="settle-5")
+    engine.settle_tab("5", txn_id="settle-5")
+    engine.journal.sync()
+
+    replayed = replay_journal(engine.journal.directory)
+    assert compare_states(engine.ledger.state(), replayed.state()) == []
+    assert tab_account("5") not in replayed.tabs()
+    assert engine.reconcile() == []
+
+    # A posting the journal never saw shows up to the cent
+    engine.ledger.record = None
+    engine.ledger.post(CASH, 1)
+    assert engine.reconcile() == [("cash", replayed.balance(CASH) + 1,
+                                   replayed.balance(CASH))]
+    crash(engine)
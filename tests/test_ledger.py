@@ -0,0 +1,51 @@
+from engine import Order, OrderEngine
+from ledger import CASH, Ledger, compare_states, tab_account, to_cents
+
+
+def test_to_cents_rounds_half_up():
+    assert to_cents(1.005) == 101
+    assert to_cents(2.675) == 268
+    assert to_cents(19.99) == 1999
+    assert to_cents(3) == 300
+
+
+def test_post_is_idempotent_per_account_and_txn():
+    ledger = Ledger()
+    first = ledger.post(CASH, 500, "txn-1")
+    again = ledger.post(CASH, 500, "txn-1")
+    assert first.ok and not first.duplicate
+    assert again.duplicate and again.balance == first.balance
+    assert ledger.balance(CASH) == 500
+
+
+def test_debit_stops_at_the_tab_limit():
+    ledger = Ledger()
+    account = tab_account(4)
+    ledger.open_tab(account, 1000)
+    assert ledger.charge(account, 800)
+    assert not ledger.charge(account, 300)
+    assert not ledger.post(CASH, -1, "overdraw").ok
+
+
+def test_settle_tab_retry_returns_the_first_settlement():
+    engine = OrderEngine()
+    engine.open_tab("7", limit=100)
+    result = engine.process_order(Order("Latte", table="7"))
+    assert result.ok and result.account == tab_account("7")
+    paid = engine.settle_tab("7", txn_id="settle-7")
+    assert paid == result.price
+    assert engine.settle_tab("7", txn_id="settle-7") == paid
+    assert engine.settle_tab("7", txn_id="settle-other") is None
+    assert engine.settle_tab("7") is None
+    assert engine.ledger.tabs() == {}
+
+
+def test_state_round_trip_matches_to_the_cent():
+    ledger = Ledger()
+    ledger.post(CASH, 1234, "a")
+    ledger.open_tab(tab_account(2), 5000)
+    ledger.charge(tab_account(2), 450)
+    copy = Ledger()
+    copy.restore(ledger.state())
+    assert compare_states(ledger.state(), copy.state()) == []
+    assert copy.post(CASH, 1234, "a").duplicate
@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+
+from engine import Order, OrderEngine
+from menuconfig import MENU_PATH, load_menu
+
+
+def same_recipes(first, second, order):
+    a, b = first.recipes.recipe_for(order), second.recipes.recipe_for(order)
+    return a.price == b.price and list(a.amounts) == list(b.amounts)
+
+
+def test_cache_hit_matches_a_fresh_parse(tmp_path):
+    order = Order("Latte", "Large", ["Whipped Cream", "Extra Shot"])
+    fresh = load_menu(MENU_PATH)
+    load_menu(MENU_PATH, str(tmp_path))
+    cached = load_menu(MENU_PATH, str(tmp_path))
+    assert cached.coffee_menu == fresh.coffee_menu
+    assert same_recipes(cached, fresh, order)
+
+
+def test_corrupt_cache_falls_back_to_parsing(tmp_path):
+    load_menu(MENU_PATH, str(tmp_path))
+    (cache,) = os.listdir(tmp_path)
+    (tmp_path / cache).write_bytes(b"\x00not a cache")
+    config = load_menu(MENU_PATH, str(tmp_path))
+    assert same_recipes(config, load_menu(MENU_PATH), Order("Mocha"))
+    assert (tmp_path / cache).read_bytes() != b"\x00not a cache"
+
+
+def test_other_menus_keep_their_caches(tmp_path):
+    other = tmp_path / "other.json"
+    shutil.copy(MENU_PATH, other)
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    load_menu(MENU_PATH, str(cache_dir))
+    load_menu(str(other), str(cache_dir))
+    assert len(os.listdir(cache_dir)) == 2
+
+    # An edit to one menu replaces only that menu's stale cache
+    other.write_text(other.read_text(encoding="utf-8") + "\n", encoding="utf-8")
+    load_menu(str(other), str(cache_dir))
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_size_change_rebuilds_only_that_size(tmp_path):
+    engine = OrderEngine()
+    data = json.loads(open(MENU_PATH, encoding="utf-8").read())
+    data["size_options"]["Large"] = 2.0
+    data["size_options"]["Huge"] = 2.5
+    del data["size_options"]["Small"]
+    edited = tmp_path / "menu.json"
+    edited.write_text(json.dumps(data), encoding="utf-8")
+    medium = engine.recipes.recipe_for(Order("Latte", "Medium"))
+
+    changes = engine.apply_menu(load_menu(str(edited)))
+    assert changes["sizes"] and not changes["extras"]
+    assert engine.recipes.recipe_for(Order("Latte", "Medium")) is medium
+    fresh = load_menu(str(edited))
+    for size in ("Medium", "Large", "Huge"):
+        assert same_recipes(engine, fresh, Order("Latte", size, ["Extra Shot"]))
+    assert ("Latte", "Small") not in engine.recipes._rows
@@ -0,0 +1,102 @@
+import os
+
+from analytics import ColumnStore, ShardedColumnStore
+from engine import Order, OrderEngine, OrderResult
+from metrics import Metrics
+from postorder import COMPLETE, ORDER, TAIL, PostOrderPool, RecordLayout
+
+
+ALL_EXTRAS = ("Extra Shot", "Caramel Syrup", "Vanilla Syrup", "Chocolate Sauce",
+              "Whipped Cream")
+
+
+def make_layout():
+    engine = OrderEngine()
+    return RecordLayout.for_menu(engine.coffee_menu, engine.size_options,
+                                 engine.recipes.extra_names)
+
+
+def make_result(**fields):
+    fields.setdefault("extras", ALL_EXTRAS)
+    return OrderResult(Order("Latte", "Large", **fields), True, price=41.5, discount=0.1)
+
+
+def test_record_round_trip_keeps_every_extra_and_long_table():
+    layout = make_layout()
+    result = make_result(customer="Ayşe Yılmaz", table="123456789", temperature=85)
+    record = layout.pack(COMPLETE, 7, result)
+    decoded = layout.unpack(record, 0)
+    assert decoded == {"kind": COMPLETE, "seq": 7, "timestamp": result.timestamp.timestamp(),
+                       "price": 41.5, "discount": 0.1, "temperature": 85, "drink": "Latte",
+                       "size": "Large", "extras": list(ALL_EXTRAS),
+                       "customer": "Ayşe Yılmaz", "table": "123456789"}
+
+
+def test_record_that_does_not_fit_is_not_packed():
+    layout = make_layout()
+    assert layout.pack(ORDER, 1, make_result(customer="x" * 65)) is None
+    assert layout.pack(ORDER, 1, make_result(table="1" * 17)) is None
+    assert layout.pack(ORDER, 1, make_result(extras=("Oat Milk",))) is None
+    assert layout.pack(ORDER, 1, make_result(customer="x" * 64)) is not None
+
+
+def test_layout_survives_rebuild_from_spec():
+    layout = make_layout()
+    rebuilt = RecordLayout(*layout.spec())
+    record = layout.pack(ORDER, 3, make_result(extras=("Whipped Cream",)))
+    assert rebuilt.unpack(record, 0)["extras"] == ["Whipped Cream"]
+
+
+def test_pool_falls_back_in_process_for_records_that_do_not_fit(tmp_path):
+    delivered = []
+    pool = PostOrderPool(str(tmp_path), ColumnStore(str(tmp_path / "analytics")),
+                         make_layout(), workers=0,
+                         on_result=lambda *args: delivered.append(args))
+    result = make_result(customer="x" * 100)
+    pool.on_order_event("complete", result)
+    pool.poll()
+    pool.close()
+    assert pool.handled_inline == 1
+    assert delivered == [("complete", result, 41)]
+
+
+def test_workers_write_full_extras_to_history(tmp_path):
+    delivered = []
+    store = ShardedColumnStore(str(tmp_path / "analytics"))
+    pool = PostOrderPool(str(tmp_path), store, make_layout(), workers=1,
+                         on_result=lambda *args: delivered.append(args))
+    pool.start()
+    result = make_result(customer="Bo", table="123456789")
+    pool.on_order_event("order", result)
+    pool.on_order_event("complete", result)
+    pool.close()
+    assert pool.handled_inline == 0
+    assert [event for event, _, _ in delivered] == ["order", "complete"]
+    assert [extras for _, _, extras, _, _ in store.rows(0, float("inf"))] == [list(ALL_EXTRAS)]
+    receipts = os.listdir(tmp_path / "receipts")
+    with open(tmp_path / "receipts" / receipts[0], encoding="utf-8") as handle:
+        text = handle.read()
+    assert "Whipped Cream" in text and "Table: 123456789" in text
+
+
+def test_records_left_by_a_dead_worker_run_in_process(tmp_path):
+    delivered = []
+    metrics = Metrics(enabled=True)
+    pool = PostOrderPool(str(tmp_path), ColumnStore(str(tmp_path / "analytics")),
+                         make_layout(), workers=1, metrics=metrics,
+                         on_result=lambda *args: delivered.append(args))
+    pool.start()
+    process, ring = pool._processes[0], pool._rings[0]
+    process.terminate()
+    process.join()
+    results = [make_result(customer=name) for name in ("A", "B", "C")]
+    for result in results:
+        pool.on_order_event("order", result)
+    # As if the worker took the first record and died before answering
+    TAIL.pack_into(ring.memory.buf, 0, 1)
+    pool.poll()
+    pool.close()
+    assert pool.handled_inline == 2 and pool.lost == 1
+    assert [result for _, result, _ in delivered] == results[1:]
+    assert pool.backlog() == 0
+    assert metrics.counters[("post_orders_lost_total", ())] == 1
@@ -0,0 +1,35 @@
+import csv
+import json
+
+from replay import format_report, replay, write_curves
+
+
+def write_trace(path, events):
+    with open(path, "w", encoding="utf-8") as handle:
+        for event in events:
+            handle.write(json.dumps(event) + "\n")
+
+
+def test_unknown_ingredient_is_reported_and_skipped(tmp_path):
+    trace = str(tmp_path / "trace.jsonl")
+    write_trace(trace, [{"t": 0, "coffee": "Latte"},
+                        {"t": 10, "refill": "Saffron"},
+                        {"t": 20, "stockout": "milk"},
+                        {"t": 30, "coffee": "Espresso"}])
+    machine = replay(trace, sample_every=60.0)
+    assert machine.orders == 2 and machine.injections == 1
+    assert machine.skipped == {"refill of unknown ingredient 'Saffron'": 1}
+    assert "Skipped 1 trace events" in format_report(machine)
+
+
+def test_last_curve_row_is_the_end_of_the_replay(tmp_path):
+    trace = str(tmp_path / "trace.jsonl")
+    write_trace(trace, [{"t": at, "coffee": "Americano"} for at in (0, 100, 250)])
+    machine = replay(trace, sample_every=60.0)
+    curves = str(tmp_path / "curves.csv")
+    write_curves(machine, curves)
+    with open(curves, encoding="utf-8", newline="") as handle:
+        rows = list(csv.reader(handle))[1:]
+    times = [float(row[0]) for row in rows]
+    assert times[:5] == [0.0, 60.0, 120.0, 180.0, 240.0]
+    assert times[-1] == round(machine.timeline.now(), 1) and times[-1] > 250
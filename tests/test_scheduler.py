@@ -0,0 +1,79 @@
+from brewmodel import BrewModel
+from engine import Order, OrderEngine
+from scheduler import BatchingPolicy, BrewJob, EventBrewScheduler
+from timeline import VirtualTimeline
+
+
+def make_job(job_id, seconds, temperature=90):
+    return BrewJob(job_id, Order("Espresso", temperature=temperature),
+                   [("Brewing", seconds, None, "brew")])
+
+
+def test_batching_prefers_matching_temperature():
+    policy = BatchingPolicy(max_wait=120)
+    pending = [make_job(1, 30, temperature=70), make_job(2, 30)]
+    assert policy.pick(pending, make_job(0, 30), now=0.0) == 1
+    assert policy.delays == {1: 30}
+
+
+def test_batching_fallback_respects_max_wait_of_older_jobs():
+    # Starting job 3 would push job 2 over the limit; falling back to job 2
+    # would in turn push job 1 over with job 2's longer duration
+    policy = BatchingPolicy(max_wait=120)
+    pending = [make_job(1, 30, temperature=70), make_job(2, 60, temperature=70),
+               make_job(3, 25)]
+    policy.delays = {1: 90.0, 2: 100.0}
+    assert policy.pick(pending, make_job(0, 30), now=0.0) == 0
+    assert policy.delays == {2: 100.0}
+    assert policy.max_delay <= 120
+
+
+def test_batching_never_delays_past_max_wait():
+    policy = BatchingPolicy(max_wait=120)
+    temperatures = [70, 90, 80, 90, 70, 90, 95, 90, 70, 90]
+    pending = [make_job(index, 20 + index * 7 % 50, temperature)
+               for index, temperature in enumerate(temperatures, 1)]
+    previous = make_job(0, 30)
+    while pending:
+        index = policy.pick(pending, previous, now=0.0)
+        previous = pending.pop(index)
+    assert policy.max_delay <= 120
+
+
+def make_scheduler(engine, model, stations=1):
+    timeline = VirtualTimeline()
+    finished = []
+    scheduler = EventBrewScheduler(engine.coffee_menu, timeline, stations=stations,
+                                   on_done=finished.append, model=model)
+    scheduler.start()
+    return scheduler, timeline, finished
+
+
+def test_drink_removed_while_queued_still_brews():
+    engine = OrderEngine()
+    scheduler, timeline, finished = make_scheduler(engine, BrewModel(engine.recipes))
+    scheduler.submit(Order("Latte"))
+    scheduler.submit(Order("Latte", "Large"))
+    engine.remove_drink("Latte")
+    timeline.run()
+    assert [job.status for job in finished] == ["done", "done"]
+    assert not scheduler.in_progress() and not scheduler.queue_depth()
+
+
+class BrokenModel(BrewModel):
+    def duration(self, order, step, now=None, commit=True, amounts=None):
+        if commit and step == "grind" and order.size == "Small":
+            raise KeyError(order.size)
+        return super().duration(order, step, now, commit, amounts)
+
+
+def test_failed_step_frees_station_and_resource():
+    engine = OrderEngine()
+    scheduler, timeline, finished = make_scheduler(engine, BrokenModel(engine.recipes))
+    scheduler.submit(Order("Espresso", "Small"))
+    scheduler.submit(Order("Espresso"))
+    timeline.run()
+    assert [job.status for job in finished] == ["failed", "done"]
+    assert isinstance(finished[0].error, KeyError)
+    assert scheduler.resources["grinder"] == 1
+    assert not scheduler.in_progress()
@@ -0,0 +1,112 @@
+import heapq
+import itertools
+import time
+
+
+class TimerHandle:
+    def __init__(self, timeline):
+        self.timeline = timeline
+        self.cancelled = False
+        self._token = None
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            if self._token is not None:
+                self.timeline._unschedule(self._token)
+
+
+class Timeline:
+    # Single timer scheduler shared by the brew pipeline and the UI loops
+
+    def now(self):
+        raise NotImplementedError
+
+    def _schedule(self, delay, callback):
+        raise NotImplementedError
+
+    def _unschedule(self, token):
+        raise NotImplementedError
+
+    def call_later(self, delay, callback, *args):
+        handle = TimerHandle(self)
+
+        def fire():
+            if not handle.cancelled:
+                handle.cancelled = True
+                callback(*args)
+
+        handle._token = self._schedule(delay, fire)
+        return handle
+
+    def every(self, interval, callback, *args, delay=0):
+        # Repeat callback every interval seconds until the handle is cancelled
+        handle = TimerHandle(self)
+
+        def tick():
+            if handle.cancelled:
+                return
+            handle._token = self._schedule(interval, tick)
+            callback(*args)
+
+        handle._token = self._schedule(delay, tick)
+        return handle
+
+
+class TkTimeline(Timeline):
+    # Timers run on the Tk main loop through app.after
+    def __init__(self, app):
+        self.app = app
+
+    def now(self):
+        return time.monotonic()
+
+    def _schedule(self, delay, callback):
+        return self.app.after(int(delay * 1000), callback)
+
+    def _unschedule(self, token):
+        self.app.after_cancel(token)
+
+
+class VirtualTimeline(Timeline):
+    # Simulated clock: run() jumps straight to the next due timer
+    def __init__(self, start=0.0):
+        self._now = start
+        self._queue = []
+        self._seq = itertools.count()
+
+    def now(self):
+        return self._now
+
+    def _schedule(self, delay, callback):
+        entry = [self._now + max(0.0, delay), next(self._seq), callback, True]
+        heapq.heappush(self._queue, entry)
+        return entry
+
+    def _unschedule(self, token):
+        token[3] = False
+
+    def pending(self):
+        return sum(1 for entry in self._queue if entry[3])
+
+    def run(self, until=None, max_events=None):
+        # Fire due timers in time order; returns the number fired
+        fired = 0
+        while self._queue:
+            if max_events is not None and fired >= max_events:
+                break
+            when, _, callback, active = self._queue[0]
+            if until is not None and when > until:
+                break
+            heapq.heappop(self._queue)
+            if not active:
+                continue
+            self._now = when
+            callback()
+            fired += 1
+        if until is not None and until > self._now:
+            self._now = until
+        return fired
+
+    def advance(self, seconds):
+        return self.run(until=self._now + seconds)
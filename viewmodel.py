@@ -0,0 +1,42 @@
+import threading
+
+
+class ViewModel:
+    # Collects "this part of the screen changed" marks and redraws each dirty
+    # part once per frame on the timeline's loop. mark() is cheap and safe
+    # from any thread; only flush() touches widgets.
+    def __init__(self, timeline, fps=20):
+        self.timeline = timeline
+        self.interval = 1.0 / fps
+        self.renderers = {}
+        self.flushes = 0
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def bind(self, key, render):
+        self.renderers[key] = render
+
+    def mark(self, *keys):
+        with self._lock:
+            self._dirty.update(keys)
+
+    def start(self):
+        if self._timer is None:
+            self._timer = self.timeline.every(self.interval, self.flush)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+        self.flushes += 1
+        for key in dirty:
+            render = self.renderers.get(key)
+            if render is not None:
+                render()